@@ -0,0 +1,142 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import index
+from pool import FORMATOS, QueryTimeout, _Leitura, _Tarefa
+
+# Interface asyncio para o banco: nenhuma chamada ao DuckDB roda no event
+# loop. Cada consulta vai para um executor próprio (um cursor por thread),
+# e um semáforo limita quantas estão em andamento; as demais esperam no
+# loop sem ocupar thread.
+#
+# Cancelar a corrotina (task.cancel(), asyncio.wait_for, timeout=) marca a
+# consulta: se ainda não começou ela nem roda, e se já está no DuckDB o
+# cursor é interrompido.
+#
+# batches() entrega lotes Arrow por uma fila de tamanho fixo: quando o
+# consumidor não acompanha, a thread produtora fica parada no put e o
+# DuckDB não lê o lote seguinte. Um stream ocupa uma vaga do semáforo e
+# uma thread do executor até terminar ou ser fechado; quem sai do async for
+# antes do fim deve usar contextlib.aclosing(db.batches(...)), senão a vaga
+# só volta quando o gerador for coletado.
+BUFFER = 4
+# marca de fim do stream na fila
+_FIM = object()
+
+
+class AsyncDatabase(_Leitura):
+    def __init__(self, db_file='meu_banco.duckdb', max_concurrency=8, max_workers=None,
+                 timeout=None, read_only=True, conn=None):
+        super().__init__(db_file, read_only, conn,
+                         ThreadPoolExecutor(max_workers or max_concurrency, thread_name_prefix='duckdb-async'))
+        self.timeout = timeout
+        self._vagas = asyncio.Semaphore(max_concurrency)
+
+    def _run(self, tarefa, sql, params, formato):
+        cursor = self._cursor()
+        if not tarefa.iniciar(cursor):
+            return None
+        try:
+            return FORMATOS[formato](cursor, sql, params)
+        finally:
+            tarefa.terminar()
+
+    async def fetch(self, sql, params=None, formato='arrow', timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(self._fetch(sql, params, formato), timeout)
+        except asyncio.TimeoutError:
+            raise QueryTimeout(f"consulta excedeu {timeout}s") from None
+
+    async def _fetch(self, sql, params, formato):
+        async with self._vagas:
+            tarefa = _Tarefa()
+            futuro = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._run, tarefa, sql, params, formato
+            )
+            try:
+                # shield: cancelar a espera não cancela o futuro do executor,
+                # que só termina depois da interrupção
+                return await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                tarefa.cancelar()
+                # a vaga só é devolvida quando a thread estiver livre
+                try:
+                    await futuro
+                except Exception:
+                    pass
+                raise
+
+    async def views(self):
+        # a primeira chamada consulta o catálogo numa thread do executor
+        if self._views is None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._listar_views)
+        return self._views
+
+    async def fetch_view(self, view, formato='arrow', timeout=None):
+        await self.views()
+        return await self.fetch(self._sql_view(view), formato=formato, timeout=timeout)
+
+    async def fetch_views(self, views, formato='arrow', timeout=None):
+        # {view: resultado}; as consultas correm juntas, até o limite de vagas
+        resultados = await asyncio.gather(*(self.fetch_view(view, formato, timeout) for view in views))
+        return dict(zip(views, resultados))
+
+    def _produzir(self, tarefa, sql, params, batch_size, fila, loop):
+        def entregar(item):
+            asyncio.run_coroutine_threadsafe(fila.put(item), loop).result()
+
+        cursor = self._cursor()
+        try:
+            if not tarefa.iniciar(cursor):
+                return
+            reader = cursor.execute(sql, params).to_arrow_reader(batch_size)
+            for batch in reader:
+                if tarefa.cancelada:
+                    return
+                entregar(batch)
+        except Exception as erro:
+            if not tarefa.cancelada:
+                entregar(erro)
+        finally:
+            tarefa.terminar()
+            entregar(_FIM)
+
+    async def batches(self, sql, params=None, batch_size=index.BATCH_SIZE, buffer=BUFFER):
+        # async for batch in db.batches(sql): ...; no máximo buffer lotes
+        # prontos esperando o consumidor
+        async with self._vagas:
+            loop = asyncio.get_running_loop()
+            fila = asyncio.Queue(buffer)
+            tarefa = _Tarefa()
+            futuro = loop.run_in_executor(
+                self._executor, self._produzir, tarefa, sql, params, batch_size, fila, loop
+            )
+            terminou = False
+            try:
+                while True:
+                    item = await fila.get()
+                    if item is _FIM:
+                        terminou = True
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                if not terminou:
+                    # consumidor saiu antes do fim (break, exceção ou
+                    # cancelamento): interrompe e esvazia a fila até a
+                    # produtora terminar, para ela não ficar presa no put
+                    tarefa.cancelar()
+                    while await fila.get() is not _FIM:
+                        pass
+                await futuro
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._fechar)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
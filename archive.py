@@ -0,0 +1,266 @@
+import argparse
+import datetime
+import glob
+import os
+import sys
+
+import duckdb
+
+from cache import bump_versions
+
+# Arquivo histórico em Parquet.
+#
+# Avaliações (com seus benefícios) e vínculos anteriores a uma data de
+# corte saem do banco para arquivos Parquet particionados no estilo Hive
+# por estado da empresa e ano (estado_empresa=SP/ano=2015/...). As views
+# hist_* juntam a tabela quente com o arquivo; filtros em estado_empresa e
+# ano podam diretórios inteiros, e filtros nas datas usam as estatísticas
+# dos row groups. As views vw_* continuam lendo só as tabelas quentes.
+#
+# Cada execução é um lote em tbl_lote_arquivo com os arquivos nomeados
+# lote<id>_*.parquet. Os ids apagados do banco são lidos desses arquivos,
+# então um lote interrompido na exportação é descartado e um interrompido
+# depois dela é retomado na próxima execução. Os vínculos atuais
+# (emprego_atual) nunca são arquivados, nem os que uma avaliação que fica
+# no banco ainda referencia.
+#
+# O DELETE não diminui o arquivo .duckdb; compact() reescreve o banco
+# num arquivo novo.
+ARCHIVE_DDL = r"""
+CREATE SEQUENCE IF NOT EXISTS seq_lote_arquivo;
+CREATE TABLE IF NOT EXISTS tbl_lote_arquivo (
+    id_lote INTEGER DEFAULT nextval('seq_lote_arquivo') PRIMARY KEY,
+    dt_corte TIMESTAMP NOT NULL,
+    ds_destino VARCHAR(500) NOT NULL,
+    status VARCHAR(12) NOT NULL,
+    qtd_avaliacao BIGINT,
+    qtd_avaliacao_beneficio BIGINT,
+    qtd_vinculo BIGINT,
+    dt_lote TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# nome no arquivo -> (tabela quente, coluna id, consulta com estado_empresa e ano)
+ARQUIVADAS = {
+    'avaliacao': ('tbl_avaliacao', 'id_avaliacao', """
+        SELECT a.*, e.estado_empresa, year(a.dt_avaliacao) AS ano
+          FROM tbl_avaliacao a
+          JOIN tbl_empresa e ON e.id_empresa = a.id_empresa
+    """),
+    'avaliacao_beneficio': ('tbl_avaliacao_beneficio', 'id_avaliacao_beneficio', """
+        SELECT ab.*, e.estado_empresa, year(a.dt_avaliacao) AS ano
+          FROM tbl_avaliacao_beneficio ab
+          JOIN tbl_avaliacao a ON a.id_avaliacao = ab.id_avaliacao
+          JOIN tbl_empresa e ON e.id_empresa = a.id_empresa
+    """),
+    'vinculo_usuario_empresa': ('tbl_vinculo_usuario_empresa', 'id_vinculo', """
+        SELECT v.*, e.estado_empresa, year(v.dt_inicio_vinculo) AS ano
+          FROM tbl_vinculo_usuario_empresa v
+          JOIN tbl_empresa e ON e.id_empresa = v.id_empresa
+    """),
+}
+
+
+def _arquivos_lote(destino, id_lote, nome=''):
+    return sorted(glob.glob(os.path.join(destino, nome, '**', f'lote{id_lote}_*.parquet'), recursive=True))
+
+
+def _ids_lote(destino, id_lote, nome):
+    # os ids de um lote saem dos próprios arquivos: só é apagado do banco o
+    # que foi gravado em Parquet
+    arquivos = _arquivos_lote(destino, id_lote, nome)
+    if not arquivos:
+        return "SELECT NULL::INTEGER AS id WHERE FALSE"
+    _, chave, _ = ARQUIVADAS[nome]
+    lista = ', '.join(f"'{a}'" for a in arquivos)
+    return f"SELECT {chave} AS id FROM read_parquet([{lista}])"
+
+
+def _apagar(conn, id_lote, destino):
+    # filhos antes dos pais, em transações separadas: o DuckDB ainda vê a
+    # chave referenciada se filho e pai são apagados na mesma transação.
+    # Refazer é seguro (DELETE por id), então um lote interrompido aqui é
+    # retomado na próxima execução.
+    conn.execute(f"""
+        DELETE FROM tbl_avaliacao_beneficio
+         WHERE id_avaliacao_beneficio IN ({_ids_lote(destino, id_lote, 'avaliacao_beneficio')})
+    """)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        qtd = {}
+        for nome in ('avaliacao', 'vinculo_usuario_empresa'):
+            tabela, chave, _ = ARQUIVADAS[nome]
+            conn.execute(f"CREATE OR REPLACE TEMP TABLE _arq_ids AS {_ids_lote(destino, id_lote, nome)}")
+            conn.execute(f"DELETE FROM {tabela} WHERE {chave} IN (SELECT id FROM _arq_ids)")
+            # mesmo registro de log_changes, direto da tabela temporária
+            conn.execute(f"INSERT INTO tbl_log_alteracao (nm_tabela, id_registro) SELECT '{tabela}', id FROM _arq_ids")
+            qtd[nome] = conn.execute("SELECT count(*) FROM _arq_ids").fetchone()[0]
+        qtd['avaliacao_beneficio'] = conn.execute(
+            f"SELECT count(*) FROM ({_ids_lote(destino, id_lote, 'avaliacao_beneficio')})"
+        ).fetchone()[0]
+        bump_versions(conn, [ARQUIVADAS[nome][0] for nome, n in qtd.items() if n])
+        conn.execute("""
+            UPDATE tbl_lote_arquivo
+               SET status = 'concluido', qtd_avaliacao = ?, qtd_avaliacao_beneficio = ?, qtd_vinculo = ?
+             WHERE id_lote = ?
+        """, [qtd['avaliacao'], qtd['avaliacao_beneficio'], qtd['vinculo_usuario_empresa'], id_lote])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("DROP TABLE IF EXISTS _arq_ids")
+    return qtd
+
+
+def _retomar_pendentes(conn):
+    # lote que caiu durante a exportação é descartado; depois dela, retomado
+    for id_lote, destino, status in conn.execute(
+        "SELECT id_lote, ds_destino, status FROM tbl_lote_arquivo WHERE status <> 'concluido' ORDER BY id_lote"
+    ).fetchall():
+        if status == 'exportado':
+            _apagar(conn, id_lote, destino)
+            continue
+        for caminho in _arquivos_lote(destino, id_lote):
+            os.remove(caminho)
+        conn.execute("DELETE FROM tbl_lote_arquivo WHERE id_lote = ?", [id_lote])
+
+
+def history_views(conn, destino):
+    # hist_<nome>: tabela quente + Parquet; sem arquivo ainda, só a quente
+    for nome, (_, _, consulta) in ARQUIVADAS.items():
+        padrao = os.path.join(destino, nome, '**', '*.parquet')
+        sql = consulta
+        if glob.glob(padrao, recursive=True):
+            sql += f"""
+        UNION ALL BY NAME
+        SELECT * FROM read_parquet('{padrao}', hive_partitioning = true, union_by_name = true)"""
+        conn.execute(f"CREATE OR REPLACE VIEW hist_{nome} AS {sql}")
+
+
+def archive(conn, corte, destino='arquivo'):
+    # devolve {nome: linhas arquivadas}
+    destino = os.path.abspath(destino)
+    corte = datetime.datetime.fromisoformat(str(corte))
+    os.makedirs(destino, exist_ok=True)
+    _retomar_pendentes(conn)
+    id_lote = conn.execute("""
+        INSERT INTO tbl_lote_arquivo (dt_corte, ds_destino, status) VALUES (?, ?, 'exportando')
+        RETURNING id_lote
+    """, [corte, destino]).fetchone()[0]
+
+    limite = f"TIMESTAMP '{corte}'"
+    filtros = {
+        'avaliacao': f"a.dt_avaliacao < {limite}",
+        'avaliacao_beneficio': f"a.dt_avaliacao < {limite}",
+        # o vínculo só sai junto com (ou depois de) sua última avaliação:
+        # tbl_avaliacao.id_vinculo não tem FK que barre o DELETE
+        'vinculo_usuario_empresa': f"""v.dt_inicio_vinculo < {limite} AND NOT v.emprego_atual
+            AND NOT EXISTS (SELECT 1 FROM tbl_avaliacao a
+                             WHERE a.id_vinculo = v.id_vinculo AND a.dt_avaliacao >= {limite})""",
+    }
+    # numa transação, as três exportações veem o mesmo estado do banco
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for nome, (_, _, consulta) in ARQUIVADAS.items():
+            conn.execute(f"""
+                COPY ({consulta} WHERE {filtros[nome]})
+                TO '{os.path.join(destino, nome)}'
+                (FORMAT parquet, PARTITION_BY (estado_empresa, ano), APPEND,
+                 FILENAME_PATTERN 'lote{id_lote}_{{uuid}}')
+            """)
+        conn.execute("UPDATE tbl_lote_arquivo SET status = 'exportado' WHERE id_lote = ?", [id_lote])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    qtd = _apagar(conn, id_lote, destino)
+    history_views(conn, destino)
+    return qtd
+
+
+def _ordem_tabelas(conn):
+    # tabelas referenciadas por FK antes de quem as referencia
+    tabelas = [r[0] for r in conn.execute("""
+        SELECT table_name FROM duckdb_tables()
+         WHERE database_name = 'origem' AND NOT temporary ORDER BY table_oid
+    """).fetchall()]
+    depende = {t: set() for t in tabelas}
+    for tabela, referenciada in conn.execute("""
+        SELECT table_name, referenced_table FROM duckdb_constraints()
+         WHERE database_name = 'origem' AND constraint_type = 'FOREIGN KEY'
+    """).fetchall():
+        depende[tabela].add(referenciada)
+    ordem = []
+    while depende:
+        prontas = [t for t in tabelas if t in depende and not depende[t] - set(ordem)]
+        ordem.extend(prontas)
+        for t in prontas:
+            del depende[t]
+    return ordem
+
+
+def compact(db_file, ordem=None):
+    # reescreve o banco num arquivo novo (sem os blocos liberados pelos
+    # DELETEs) e troca os arquivos; nenhuma outra conexão pode estar aberta.
+    # COPY FROM DATABASE não serve: copia as tabelas fora da ordem das FKs.
+    # ordem: {tabela: expressão do ORDER BY} com que as linhas são gravadas
+    # (maintenance.py); as demais mantêm a ordem atual.
+    ordem = ordem or {}
+    novo = db_file + '.compactando'
+    if os.path.exists(novo):
+        os.remove(novo)
+    conn = duckdb.connect(novo)
+    try:
+        conn.execute(f"ATTACH '{db_file}' AS origem (READ_ONLY)")
+        # o sql das sequences já começa do próximo valor
+        for (sql,) in conn.execute(
+            "SELECT sql FROM duckdb_sequences() WHERE database_name = 'origem' AND NOT temporary"
+        ).fetchall():
+            conn.execute(sql)
+        for tabela in _ordem_tabelas(conn):
+            sql = conn.execute(
+                "SELECT sql FROM duckdb_tables() WHERE database_name = 'origem' AND table_name = ?", [tabela]
+            ).fetchone()[0]
+            conn.execute(sql)
+            ordenacao = f" ORDER BY {ordem[tabela]}" if tabela in ordem else ""
+            conn.execute(f"INSERT INTO {tabela} SELECT * FROM origem.{tabela}{ordenacao}")
+        # índices secundários (os de PK/UNIQUE vêm com as tabelas)
+        for (sql,) in conn.execute(
+            "SELECT sql FROM duckdb_indexes() WHERE database_name = 'origem' AND sql IS NOT NULL"
+        ).fetchall():
+            conn.execute(sql)
+        for (sql,) in conn.execute("""
+            SELECT sql FROM duckdb_views()
+             WHERE database_name = 'origem' AND NOT internal AND NOT temporary ORDER BY view_oid
+        """).fetchall():
+            conn.execute(sql)
+        conn.execute("DETACH origem")
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    antes = os.path.getsize(db_file)
+    os.replace(novo, db_file)
+    return antes, os.path.getsize(db_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Arquiva avaliações e vínculos antigos em Parquet")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--antes', required=True, help="data de corte (AAAA-MM-DD)")
+    parser.add_argument('--destino', default='arquivo')
+    parser.add_argument('--compactar', action='store_true', help="reescreve o .duckdb depois de arquivar")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    qtd = archive(conn, args.antes, args.destino)
+    conn.close()
+    print("Arquivadas: " + ", ".join(f"{nome} {n}" for nome, n in qtd.items()))
+    if args.compactar:
+        antes, depois = compact(args.db)
+        print(f"Banco compactado: {antes / 2**20:.1f} MB -> {depois / 2**20:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1336 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import duckdb
+import numpy as np
+
+import index
+from cli import ORCAMENTO_MS
+
+# Benchmarks das views analíticas.
+#
+#   python benchmark.py views --sf 0.1 1 10 --output bench.json
+#   python benchmark.py views --sf 1 --baseline bench.json --threshold 0.25
+#
+# Com --baseline o processo termina com código 1 se alguma view ficar mais
+# lenta que o baseline além do limite.
+
+PERCENTIS = (50, 95, 99)
+# diferenças menores que isso (em ms) são ruído, mesmo que passem do limite
+RUIDO_MS = 1.0
+
+
+def list_views(conn):
+    return [r[0] for r in conn.execute("""
+        SELECT view_name FROM duckdb_views()
+         WHERE NOT internal AND view_name LIKE 'vw\\_%' ESCAPE '\\'
+         ORDER BY view_name
+    """).fetchall()]
+
+
+def percentiles(amostras):
+    valores = np.percentile(np.array(amostras) * 1000.0, PERCENTIS)
+    return {f'p{p}_ms': round(float(v), 4) for p, v in zip(PERCENTIS, valores)}
+
+
+def timed(conn, sql):
+    inicio = time.perf_counter()
+    conn.execute(sql).fetchall()
+    return time.perf_counter() - inicio
+
+
+def _operadores(no):
+    return {
+        'operador': no.get('operator_name') or no.get('query_name'),
+        'tempo_s': no.get('operator_timing', no.get('latency')),
+        'linhas': no.get('operator_cardinality', no.get('rows_returned')),
+        'tabela': (no.get('extra_info') or {}).get('Table'),
+        'filhos': [_operadores(filho) for filho in no.get('children', [])],
+    }
+
+
+def profile(conn, sql):
+    # equivalente ao EXPLAIN ANALYZE, mas em JSON
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as arquivo:
+        caminho = arquivo.name
+    try:
+        conn.execute("PRAGMA enable_profiling = 'json'")
+        conn.execute(f"PRAGMA profiling_output = '{caminho}'")
+        conn.execute(sql).fetchall()
+        conn.execute("PRAGMA disable_profiling")
+        with open(caminho) as arquivo:
+            dados = json.load(arquivo)
+    finally:
+        os.remove(caminho)
+    return {
+        'latencia_s': dados.get('latency'),
+        'pico_memoria_bytes': dados.get('system_peak_buffer_memory'),
+        'linhas_lidas': dados.get('cumulative_rows_scanned'),
+        'bytes_lidos': dados.get('total_bytes_read'),
+        'plano': _operadores(dados),
+    }
+
+
+def bench_view(db_file, view, cold_reps, warm_reps):
+    sql = f"SELECT * FROM {view}"
+    # frio: cada execução numa instância nova, sem buffer cache
+    frio = []
+    for _ in range(cold_reps):
+        conn = duckdb.connect(db_file, read_only=True)
+        frio.append(timed(conn, sql))
+        conn.close()
+
+    conn = duckdb.connect(db_file, read_only=True)
+    timed(conn, sql)
+    quente = [timed(conn, sql) for _ in range(warm_reps)]
+    perfil = profile(conn, sql)
+    conn.close()
+    return {
+        'frio': percentiles(frio),
+        'quente': percentiles(quente),
+        'pico_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'perfil': perfil,
+    }
+
+
+def run_views(scale_factors, cold_reps, warm_reps, db_dir):
+    resultados = {}
+    for sf in scale_factors:
+        db_file = os.path.join(db_dir, f'bench_sf{sf:g}.duckdb')
+        inicio = time.perf_counter()
+        index.build_database(db_file, sf).close()
+        carga = time.perf_counter() - inicio
+
+        conn = duckdb.connect(db_file, read_only=True)
+        views = list_views(conn)
+        conn.close()
+
+        por_view = {}
+        for view in views:
+            por_view[view] = bench_view(db_file, view, cold_reps, warm_reps)
+            print(f"SF={sf:g} {view}: p50 quente {por_view[view]['quente']['p50_ms']} ms, "
+                  f"frio {por_view[view]['frio']['p50_ms']} ms")
+        resultados[f'{sf:g}'] = {'carga_s': round(carga, 3), 'views': por_view}
+    return resultados
+
+
+def compare(atual, baseline, threshold):
+    regressoes = []
+    for sf, dados in atual['resultados'].items():
+        base_sf = baseline['resultados'].get(sf)
+        if base_sf is None:
+            continue
+        for view, medidas in dados['views'].items():
+            base_view = base_sf['views'].get(view)
+            if base_view is None:
+                continue
+            novo = medidas['quente']['p50_ms']
+            antigo = base_view['quente']['p50_ms']
+            if novo > antigo * (1 + threshold) and novo - antigo > RUIDO_MS:
+                regressoes.append((sf, view, antigo, novo))
+    return regressoes
+
+
+def metadata():
+    return {
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'duckdb': duckdb.__version__,
+        'python': platform.python_version(),
+        'maquina': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def cmd_views(args):
+    os.makedirs(args.db_dir, exist_ok=True)
+    resultado = {
+        'meta': metadata(),
+        'resultados': run_views(args.sf, args.cold, args.reps, args.db_dir),
+    }
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as arquivo:
+            baseline = json.load(arquivo)
+        regressoes = compare(resultado, baseline, args.threshold)
+        for sf, view, antigo, novo in regressoes:
+            print(f"REGRESSÃO SF={sf} {view}: {antigo} ms -> {novo} ms")
+        if regressoes:
+            return 1
+        print("Nenhuma regressão em relação ao baseline")
+    return 0
+
+
+def _clientes(n_clientes, consultas, executar):
+    # n_clientes threads, cada uma executando sua parte das consultas
+    latencias = []
+    lock = threading.Lock()
+
+    def cliente(i):
+        proprias = []
+        for sql in consultas[i::n_clientes]:
+            inicio = time.perf_counter()
+            executar(sql)
+            proprias.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(proprias)
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(n_clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+    return {'consultas_por_s': round(len(consultas) / total, 2), **percentiles(latencias)}
+
+
+def cmd_pool(args):
+    from pool import QueryService
+
+    db_file = args.db or os.path.join(args.db_dir, f'bench_sf{args.sf:g}.duckdb')
+    if not args.db:
+        os.makedirs(args.db_dir, exist_ok=True)
+        index.build_database(db_file, args.sf).close()
+
+    conn = duckdb.connect(db_file, read_only=True)
+    views = list_views(conn)
+    resultado = {'meta': metadata(), 'resultados': {}}
+    for n_clientes in args.clients:
+        consultas = [f"SELECT * FROM {views[i % len(views)]}" for i in range(args.queries)]
+
+        # hoje: uma conexão só, usada em série
+        lock = threading.Lock()
+
+        def serial(sql):
+            with lock:
+                conn.execute(sql).fetchall()
+
+        unica = _clientes(n_clientes, consultas, serial)
+        with QueryService(conn=conn, max_workers=args.workers or n_clientes) as servico:
+            pool = _clientes(n_clientes, consultas, lambda sql: servico.fetch(sql))
+        resultado['resultados'][str(n_clientes)] = {'conexao_unica': unica, 'pool': pool}
+        print(f"{n_clientes} clientes: conexão única {unica['consultas_por_s']} q/s "
+              f"(p99 {unica['p99_ms']} ms), pool {pool['consultas_por_s']} q/s (p99 {pool['p99_ms']} ms)")
+    conn.close()
+
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_ingest(args):
+    import ingest
+
+    db_file = os.path.join(args.db_dir, f'bench_ingest_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+
+    # reaproveita avaliações existentes (com seus benefícios) como entrada
+    arquivo = os.path.join(args.db_dir, 'bench_ingest.parquet')
+    conn.execute(f"""
+        COPY (
+            SELECT a.* EXCLUDE (id_avaliacao),
+                   (SELECT list(b.id_beneficio) FROM tbl_avaliacao_beneficio b
+                     WHERE b.id_avaliacao = a.id_avaliacao) AS beneficios
+              FROM tbl_avaliacao a, range(CAST(ceil({args.rows} / (SELECT count(*) FROM tbl_avaliacao)) AS BIGINT))
+             LIMIT {args.rows}
+        ) TO '{arquivo}' (FORMAT parquet)
+    """)
+
+    inicio = time.perf_counter()
+    resultado = ingest.ingest_file(conn, arquivo, batch_size=args.batch)
+    total = time.perf_counter() - inicio
+    conn.close()
+    por_minuto = resultado['inseridas'] / total * 60
+    print(f"{resultado['inseridas']} avaliações em {total:.2f}s ({por_minuto:,.0f}/min), "
+          f"{len(resultado['rejeitadas'])} rejeitadas")
+    return 0
+
+
+def _replicar_avaliacoes(conn, rows):
+    # replica as avaliações existentes até chegar em rows; devolve o total
+    faltam = rows - conn.execute("SELECT count(*) FROM tbl_avaliacao").fetchone()[0]
+    if faltam > 0:
+        conn.execute(f"""
+            INSERT INTO tbl_avaliacao
+            SELECT nextval('seq_tbl_avaliacao'), a.* EXCLUDE (id_avaliacao)
+              FROM tbl_avaliacao a, range(CAST(ceil({faltam} / (SELECT count(*) FROM tbl_avaliacao)) AS BIGINT))
+             LIMIT {faltam}
+        """)
+    return conn.execute("SELECT count(*) FROM tbl_avaliacao").fetchone()[0]
+
+
+def cmd_search(args):
+    import search
+
+    db_file = os.path.join(args.db_dir, f'bench_search_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+
+    inicio = time.perf_counter()
+    search.build_index(conn, args.stemming)
+    construcao = time.perf_counter() - inicio
+    postagens = conn.execute("SELECT count(*) FROM tbl_fts_postagem").fetchone()[0]
+    print(f"{total} avaliações, índice com {postagens} postagens em {construcao:.1f}s")
+
+    # hoje: varredura com ILIKE, as mais recentes primeiro
+    ilike = """
+        SELECT id_avaliacao, id_empresa, nota_geral, depoimento_geral
+          FROM tbl_avaliacao
+         WHERE depoimento_geral ILIKE ?
+         ORDER BY dt_avaliacao DESC
+         LIMIT ?
+    """
+    resultado = {'meta': metadata(), 'avaliacoes': total, 'postagens': postagens,
+                 'construcao_s': round(construcao, 3), 'consultas': {}}
+    for consulta in args.queries:
+        medidas = {}
+        for nome, executar in (
+            ('ilike', lambda: conn.execute(ilike, [f'%{consulta}%', args.k]).fetchall()),
+            ('bm25', lambda: search.search(conn, consulta, args.k)),
+            ('bm25_nota_4', lambda: search.search(conn, consulta, args.k, nota_min=4)),
+        ):
+            executar()
+            amostras = []
+            for _ in range(args.reps):
+                inicio = time.perf_counter()
+                executar()
+                amostras.append(time.perf_counter() - inicio)
+            medidas[nome] = percentiles(amostras)
+        resultado['consultas'][consulta] = medidas
+        print(f"{consulta!r}: ILIKE p50 {medidas['ilike']['p50_ms']} ms, "
+              f"BM25 p50 {medidas['bm25']['p50_ms']} ms, "
+              f"BM25 nota>=4 p50 {medidas['bm25_nota_4']['p50_ms']} ms")
+    conn.close()
+
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def _latencias(db_file, consultas, reps):
+    conn = duckdb.connect(db_file, read_only=True)
+    medidas = {}
+    for nome, sql in consultas.items():
+        timed(conn, sql)
+        medidas[nome] = percentiles([timed(conn, sql) for _ in range(reps)])
+    conn.close()
+    return medidas
+
+
+def cmd_archive(args):
+    import archive
+
+    db_file = os.path.join(args.db_dir, f'bench_archive_sf{args.sf:g}.duckdb')
+    destino = os.path.join(args.db_dir, 'bench_arquivo')
+    os.makedirs(args.db_dir, exist_ok=True)
+    if os.path.exists(destino):
+        shutil.rmtree(destino)
+    conn = index.build_database(db_file, args.sf)
+    archive.history_views(conn, os.path.abspath(destino))
+    views = list_views(conn)
+    conn.execute("CHECKPOINT")
+    conn.close()
+
+    consultas = {view: f"SELECT * FROM {view}" for view in views}
+    consultas.update({
+        'hist_avaliacao estado+ano': f"""
+            SELECT count(*), avg(nota_geral) FROM hist_avaliacao
+             WHERE estado_empresa = 'SP' AND ano = {args.ano_consulta}""",
+        'hist_avaliacao data': f"""
+            SELECT count(*), avg(nota_geral) FROM hist_avaliacao
+             WHERE dt_avaliacao >= TIMESTAMP '{args.ano_consulta}-01-01'
+               AND dt_avaliacao < TIMESTAMP '{args.ano_consulta + 1}-01-01'""",
+        'hist_avaliacao tudo': "SELECT count(*), avg(nota_geral) FROM hist_avaliacao",
+    })
+
+    resultado = {'meta': metadata(), 'antes': {}, 'depois': {}}
+    resultado['antes']['tamanho_bytes'] = os.path.getsize(db_file)
+    resultado['antes']['latencias'] = _latencias(db_file, consultas, args.reps)
+
+    conn = duckdb.connect(db_file)
+    inicio = time.perf_counter()
+    resultado['arquivadas'] = archive.archive(conn, args.antes, destino)
+    resultado['arquivamento_s'] = round(time.perf_counter() - inicio, 3)
+    conn.close()
+    inicio = time.perf_counter()
+    archive.compact(db_file)
+    resultado['compactacao_s'] = round(time.perf_counter() - inicio, 3)
+    resultado['depois']['tamanho_bytes'] = os.path.getsize(db_file)
+    resultado['depois']['arquivo_parquet_bytes'] = sum(
+        os.path.getsize(os.path.join(raiz, f)) for raiz, _, arquivos in os.walk(destino) for f in arquivos
+    )
+    resultado['depois']['latencias'] = _latencias(db_file, consultas, args.reps)
+
+    print(f"Banco: {resultado['antes']['tamanho_bytes'] / 2**20:.1f} MB -> "
+          f"{resultado['depois']['tamanho_bytes'] / 2**20:.1f} MB "
+          f"(+ {resultado['depois']['arquivo_parquet_bytes'] / 2**20:.1f} MB em Parquet); "
+          f"arquivadas: {resultado['arquivadas']}")
+    for nome in consultas:
+        print(f"{nome}: p50 {resultado['antes']['latencias'][nome]['p50_ms']} ms -> "
+              f"{resultado['depois']['latencias'][nome]['p50_ms']} ms")
+
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_sketch(args):
+    import sketches
+
+    db_file = os.path.join(args.db_dir, f'bench_sketch_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+    inicio = time.perf_counter()
+    sketches.build_sketches(conn)
+    construcao = time.perf_counter() - inicio
+    print(f"{total} avaliações, sketches construídos em {construcao:.1f}s")
+
+    quantis = list(args.quantis)
+    salario_exato = f"""
+        SELECT id_cargo_especialidade, id_senioridade,
+               quantile_disc(salario_vinculo, {quantis})::DOUBLE[] AS valores
+          FROM tbl_vinculo_usuario_empresa GROUP BY ALL
+    """
+    nota_exata = f"SELECT quantile_disc(nota_geral, {quantis})::DOUBLE[] FROM tbl_avaliacao"
+    # (exato, aproximado) -> cada um devolve {chave: valor} para medir o erro
+    pares = {
+        'hora_extra_remunerada': (
+            lambda: dict(conn.execute("SELECT * FROM vw_percentual_hora_extra_remunerada").fetchall()),
+            lambda: dict(zip(*sketches.approx_overtime(conn).select(['categoria', 'percentual']).to_pydict().values())),
+        ),
+        'usuarios_distintos': (
+            lambda: {'n': conn.execute("SELECT count(DISTINCT id_usuario) FROM tbl_avaliacao").fetchone()[0]},
+            lambda: {'n': sketches.approx_distinct(conn, 'usuario_avaliador')['estimativa']},
+        ),
+        'quantis_salario': (
+            lambda: {(c, s, q): v for c, s, valores in conn.execute(salario_exato).fetchall()
+                     for q, v in zip(quantis, valores)},
+            lambda: {(r['id_cargo_especialidade'], r['id_senioridade'], r['quantil']): r['valor']
+                     for r in sketches.approx_quantiles(conn, 'salario', quantis).to_pylist()},
+        ),
+        'quantis_nota': (
+            lambda: dict(zip(quantis, conn.execute(nota_exata).fetchone()[0])),
+            lambda: {r['quantil']: r['valor'] for r in sketches.approx_quantiles(conn, 'nota', quantis, ()).to_pylist()},
+        ),
+    }
+
+    resultado = {'meta': metadata(), 'avaliacoes': total, 'construcao_s': round(construcao, 3), 'consultas': {}}
+    for nome, (exato, aproximado) in pares.items():
+        medidas = {}
+        for modo, executar in (('exato', exato), ('aproximado', aproximado)):
+            executar()
+            amostras = []
+            for _ in range(args.reps):
+                inicio = time.perf_counter()
+                executar()
+                amostras.append(time.perf_counter() - inicio)
+            medidas[modo] = percentiles(amostras)
+        valores_exatos, estimados = exato(), aproximado()
+        medidas['erro_relativo_max'] = max(
+            abs(estimados[chave] - valor) / abs(valor) if valor else abs(estimados[chave])
+            for chave, valor in valores_exatos.items()
+        )
+        resultado['consultas'][nome] = medidas
+        print(f"{nome}: exato p50 {medidas['exato']['p50_ms']} ms, "
+              f"aproximado p50 {medidas['aproximado']['p50_ms']} ms, "
+              f"erro relativo máx {medidas['erro_relativo_max']:.4f}")
+    conn.close()
+
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_metrics(args):
+    import metrics
+
+    db_file = os.path.join(args.db_dir, f'bench_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    index.build_database(db_file, args.sf).close()
+    arquivo = os.path.join(args.db_dir, 'bench_metricas.jsonl')
+
+    simples = duckdb.connect(db_file, read_only=True)
+    instrumentada = metrics.InstrumentedConnection(
+        duckdb.connect(db_file, read_only=True), arquivo=arquivo, origem='benchmark',
+        taxa_perfil=args.taxa_perfil)
+    views = list_views(simples)
+    resultado = {'meta': metadata(), 'taxa_perfil': args.taxa_perfil, 'views': {}}
+    totais = {'simples': 0.0, 'instrumentada': 0.0}
+    for view in views:
+        sql = f"SELECT * FROM {view}"
+        amostras = {'simples': [], 'instrumentada': []}
+        timed(simples, sql)
+        timed(instrumentada, sql)
+        # intercaladas, para que ruído da máquina afete as duas igualmente
+        for _ in range(args.reps):
+            for nome, conn in (('simples', simples), ('instrumentada', instrumentada)):
+                amostras[nome].append(timed(conn, sql))
+        medidas = {nome: percentiles(valores) for nome, valores in amostras.items()}
+        for nome in totais:
+            totais[nome] += medidas[nome]['p50_ms']
+        resultado['views'][view] = medidas
+    instrumentada.close()
+    simples.close()
+
+    resultado['overhead'] = round(totais['instrumentada'] / totais['simples'] - 1, 4)
+    print(f"Soma dos p50: {totais['simples']:.2f} ms -> {totais['instrumentada']:.2f} ms "
+          f"(overhead {resultado['overhead']:+.2%})")
+    with open(args.output, 'w') as arquivo_saida:
+        json.dump(resultado, arquivo_saida, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_shard(args):
+    import shard
+
+    db_file = os.path.join(args.db_dir, f'bench_sf{args.sf:g}.duckdb')
+    destino = os.path.join(args.db_dir, f'bench_shards_{args.por}')
+    os.makedirs(args.db_dir, exist_ok=True)
+    index.build_database(db_file, args.sf).close()
+    inicio = time.perf_counter()
+    shard.create_shards(db_file, destino, args.shards, args.por)
+    criacao = time.perf_counter() - inicio
+
+    conn = duckdb.connect(db_file, read_only=True)
+    views = list(shard.CONSULTAS)
+
+    def unico():
+        return [conn.execute(f"SELECT * FROM {view}").fetchall() for view in views]
+
+    resultado = {'meta': metadata(), 'por': args.por, 'shards': args.shards,
+                 'criacao_s': round(criacao, 3)}
+    with shard.ShardedDatabase(destino, args.workers) as banco:
+        distribuidas = banco.fetch_views()
+        divergentes = [
+            view for view in views
+            if sorted(map(str, conn.execute(f"SELECT * FROM {view}").fetchall()))
+            != sorted(str(tuple(linha.values())) for linha in distribuidas[view].to_pylist())
+        ]
+        for nome, executar in (('arquivo_unico', unico), ('scatter_gather', banco.fetch_views)):
+            executar()
+            amostras = []
+            for _ in range(args.reps):
+                inicio = time.perf_counter()
+                executar()
+                amostras.append(time.perf_counter() - inicio)
+            resultado[nome] = percentiles(amostras)
+    conn.close()
+    resultado['divergentes'] = divergentes
+
+    print(f"{args.shards} shards por {args.por} em {criacao:.1f}s; todas as views: "
+          f"arquivo único p50 {resultado['arquivo_unico']['p50_ms']} ms, "
+          f"scatter-gather p50 {resultado['scatter_gather']['p50_ms']} ms; "
+          f"divergentes: {divergentes or 'nenhuma'}")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 1 if divergentes else 0
+
+
+def cmd_startup(args):
+    import subprocess
+
+    db_file = os.path.join(args.db_dir, f'bench_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    if not os.path.exists(db_file):
+        index.build_database(db_file, args.sf).close()
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    saida = os.path.join(args.db_dir, 'bench_export.parquet')
+    comandos = {
+        'report': [sys.executable, cli, '--db', db_file, 'report', args.view],
+        'export': [sys.executable, cli, '--db', db_file, 'export', args.view, '--format', 'parquet',
+                   '--saida', saida],
+    }
+    resultado = {'meta': metadata(), 'orcamento_ms': args.budget_ms, 'comandos': {}}
+    estourados = []
+    for nome, comando in comandos.items():
+        amostras = []
+        for _ in range(args.reps):
+            inicio = time.perf_counter()
+            subprocess.run(comando, check=True, stdout=subprocess.DEVNULL)
+            amostras.append(time.perf_counter() - inicio)
+        resultado['comandos'][nome] = percentiles(amostras)
+        if resultado['comandos'][nome]['p50_ms'] > args.budget_ms:
+            estourados.append(nome)
+        print(f"{nome}: p50 {resultado['comandos'][nome]['p50_ms']} ms (orçamento {args.budget_ms} ms)")
+
+    # report sem --grafico não pode carregar matplotlib
+    verificacao = subprocess.run([sys.executable, '-c', (
+        "import sys; sys.path.insert(0, sys.argv[1]); import cli; "
+        "cli.main(['--db', sys.argv[2], 'report', sys.argv[3]]); "
+        "sys.exit(3 if 'matplotlib' in sys.modules else 0)"
+    ), os.path.dirname(cli), db_file, args.view], stdout=subprocess.DEVNULL)
+    resultado['matplotlib_carregado'] = verificacao.returncode == 3
+    if verificacao.returncode:
+        estourados.append('matplotlib')
+        print("report carregou matplotlib sem --grafico")
+    resultado['estourados'] = estourados
+
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 1 if estourados else 0
+
+
+def _carga_aberta(executar, pedidos, taxa, n_threads):
+    # carga em malha aberta: os pedidos chegam em horários fixos (taxa por
+    # segundo), atendidos ou não; a latência conta desde a chegada, então a
+    # fila de espera entra na medida quando a taxa passa da capacidade
+    fila = queue.Queue()
+    latencias = []
+    lock = threading.Lock()
+
+    def atendente():
+        proprias = []
+        while True:
+            item = fila.get()
+            if item is None:
+                break
+            chegada, pedido = item
+            executar(pedido)
+            proprias.append(time.perf_counter() - chegada)
+        with lock:
+            latencias.extend(proprias)
+
+    threads = [threading.Thread(target=atendente) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    inicio = time.perf_counter()
+    for i, pedido in enumerate(pedidos):
+        chegada = inicio + i / taxa
+        espera = chegada - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        fila.put((chegada, pedido))
+    for _ in threads:
+        fila.put(None)
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - inicio
+    return {'taxa_alvo': taxa, 'atendidas_por_s': round(len(pedidos) / total, 2), **percentiles(latencias)}
+
+
+def cmd_lookup(args):
+    from lookup import LookupService
+    from migrations import view_definitions
+    from refresh import init_refresh
+    from rollup import rebuild_rollup
+
+    db_file = os.path.join(args.db_dir, f'bench_lookup_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+    # mv e rollups refeitos de uma vez, na ordem de gravação da definição
+    _, select = view_definitions(conn, index.VIEWS)['mv_empresa_resumo_avaliacao']
+    conn.execute(f"CREATE OR REPLACE TABLE mv_empresa_resumo_avaliacao AS {select}")
+    init_refresh(conn)
+    rebuild_rollup(conn)
+    conn.close()
+
+    conn = duckdb.connect(db_file, read_only=True)
+    n_empresas, n_usuarios = conn.execute(
+        "SELECT (SELECT max(id_empresa) FROM tbl_empresa), (SELECT max(id_usuario) FROM tbl_usuario)"
+    ).fetchone()
+    rng = np.random.default_rng(42)
+    # 80% perfis de empresa, 20% históricos de usuário
+    pedidos = [
+        ('empresa', int(rng.integers(1, n_empresas + 1))) if rng.random() < 0.8
+        else ('usuario', int(rng.integers(1, n_usuarios + 1)))
+        for _ in range(args.lookups)
+    ]
+    print(f"{total} avaliações, {n_empresas} empresas, {n_usuarios} usuários")
+
+    resultado = {'meta': metadata(), 'avaliacoes': total, 'resultados': {}}
+    for preparar in (False, True):
+        nome = 'preparadas' if preparar else 'sem_preparo'
+        with LookupService(conn, preparar=preparar) as lookups:
+            def executar(pedido):
+                tipo, chave = pedido
+                if tipo == 'empresa':
+                    lookups.company_profile(chave)
+                else:
+                    lookups.user_history(chave)
+
+            for pedido in pedidos[:200]:
+                executar(pedido)
+            # capacidade: clientes em malha fechada, sem espera entre pedidos
+            capacidade = _clientes(args.threads, pedidos, executar)
+            # carga pedida, e 80% da capacidade medida quando ela não alcança
+            taxas = [args.taxa]
+            if capacidade['consultas_por_s'] < args.taxa:
+                taxas.append(round(capacidade['consultas_por_s'] * 0.8, 2))
+            cargas = [_carga_aberta(executar, pedidos, taxa, args.threads) for taxa in taxas]
+        resultado['resultados'][nome] = {'capacidade': capacidade, 'carga': cargas}
+        print(f"{nome}: capacidade {capacidade['consultas_por_s']} lookups/s "
+              f"(p99 {capacidade['p99_ms']} ms)")
+        for carga in cargas:
+            print(f"  {carga['taxa_alvo']} lookups/s pedidos: {carga['atendidas_por_s']} atendidos/s, "
+                  f"p50 {carga['p50_ms']} ms, p99 {carga['p99_ms']} ms")
+    conn.close()
+
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_aio(args):
+    import asyncio
+    from contextlib import aclosing
+
+    from aio import AsyncDatabase
+    from pool import QueryTimeout
+
+    db_file = os.path.join(args.db_dir, f'bench_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    index.build_database(db_file, args.sf).close()
+
+    async def medir_loop(parar, atrasos):
+        # atraso do event loop: quanto um sleep curto acorda depois do previsto
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            await asyncio.sleep(0.005)
+            atrasos.append(time.perf_counter() - inicio - 0.005)
+
+    async def rodar():
+        resultado = {}
+        async with AsyncDatabase(db_file, max_concurrency=args.concurrency) as db:
+            views = sorted(v for v in await db.views() if v.startswith('vw_'))
+            latencias = []
+
+            async def cliente(i):
+                inicio = time.perf_counter()
+                await db.fetch_view(views[i % len(views)])
+                latencias.append(time.perf_counter() - inicio)
+
+            parar, atrasos = asyncio.Event(), []
+            medidor = asyncio.create_task(medir_loop(parar, atrasos))
+            inicio = time.perf_counter()
+            await asyncio.gather(*(cliente(i) for i in range(args.coroutines)))
+            total = time.perf_counter() - inicio
+            parar.set()
+            await medidor
+            resultado['consultas'] = {
+                'corrotinas': args.coroutines,
+                'consultas_por_s': round(args.coroutines / total, 2),
+                **percentiles(latencias),
+                'atraso_loop_max_ms': round(max(atrasos) * 1000, 3),
+            }
+
+            # metade das corrotinas com timeout curto: as interrompidas
+            # devolvem a vaga e as outras seguem
+            async def com_timeout(i):
+                try:
+                    await db.fetch("SELECT count(*) FROM tbl_avaliacao a, range(2000)",
+                                   timeout=args.timeout if i % 2 else None)
+                    return 'ok'
+                except QueryTimeout:
+                    return 'timeout'
+
+            inicio = time.perf_counter()
+            estados = await asyncio.gather(*(com_timeout(i) for i in range(args.coroutines // 10)))
+            resultado['cancelamento'] = {
+                'ok': estados.count('ok'),
+                'timeout': estados.count('timeout'),
+                'total_s': round(time.perf_counter() - inicio, 3),
+            }
+
+            # stream com consumidor lento: a produtora não passa do buffer
+            entregues = []
+            linhas = 0
+            async with aclosing(db.batches("SELECT * FROM mv_empresa_resumo_avaliacao",
+                                           batch_size=args.batch)) as lotes:
+                async for batch in lotes:
+                    entregues.append(time.perf_counter())
+                    linhas += batch.num_rows
+                    await asyncio.sleep(0.01)
+            resultado['stream'] = {'lotes': len(entregues), 'linhas': linhas}
+        return resultado
+
+    resultado = {'meta': metadata(), **asyncio.run(rodar())}
+    consultas = resultado['consultas']
+    print(f"{args.coroutines} corrotinas: {consultas['consultas_por_s']} consultas/s, "
+          f"p99 {consultas['p99_ms']} ms, atraso máximo do loop {consultas['atraso_loop_max_ms']} ms")
+    print(f"timeout: {resultado['cancelamento']}; stream: {resultado['stream']}")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_cluster(args):
+    import maintenance
+
+    db_file = os.path.join(args.db_dir, f'bench_cluster_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+    conn.close()
+    def medir():
+        conn = duckdb.connect(db_file, read_only=True)
+        medidas = {'zonemaps': {}}
+        for tabela, coluna, valor in maintenance.FILTROS:
+            row_groups, pulados = maintenance.zonemap_skips(conn, tabela, coluna, valor)
+            medidas['zonemaps'][f'{tabela}.{coluna}'] = {'row_groups': row_groups, 'pulados': pulados}
+        for view in args.views:
+            sql = f"SELECT * FROM {view}"
+            timed(conn, sql)
+            perfil = profile(conn, sql)
+            medidas[view] = {
+                **percentiles([timed(conn, sql) for _ in range(args.reps)]),
+                'linhas_lidas': perfil['linhas_lidas'],
+            }
+        conn.close()
+        return medidas
+
+    resultado = {'meta': metadata(), 'avaliacoes': total, 'antes': medir()}
+    inicio = time.perf_counter()
+    maintenance.reorder(db_file)
+    resultado['manutencao_s'] = round(time.perf_counter() - inicio, 3)
+    resultado['depois'] = medir()
+
+    print(f"{total} avaliações, manutenção em {resultado['manutencao_s']}s")
+    for nome, zonemap in resultado['depois']['zonemaps'].items():
+        print(f"  {nome}: row groups pulados {resultado['antes']['zonemaps'][nome]['pulados']} -> "
+              f"{zonemap['pulados']} de {zonemap['row_groups']}")
+    for view in args.views:
+        antes, depois = resultado['antes'][view], resultado['depois'][view]
+        print(f"  {view}: p50 {antes['p50_ms']} -> {depois['p50_ms']} ms, "
+              f"linhas lidas {antes['linhas_lidas']} -> {depois['linhas_lidas']}")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_links(args):
+    # junção antiga por (usuário, empresa) vs. pelo vínculo resolvido, na
+    # view de tempo de promoção: linhas que chegam à agregação e latência
+    db_file = os.path.join(args.db_dir, f'bench_links_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+    juncoes = {
+        'usuario_empresa': """
+            JOIN tbl_usuario u ON a.id_usuario = u.id_usuario
+            JOIN tbl_vinculo_usuario_empresa vue
+              ON a.id_usuario = vue.id_usuario
+             AND a.id_empresa = vue.id_empresa
+        """,
+        'id_vinculo': "JOIN tbl_vinculo_usuario_empresa vue ON vue.id_vinculo = a.id_vinculo",
+    }
+    resultado = {'meta': metadata(), 'avaliacoes': total}
+    for nome, juncao in juncoes.items():
+        origem = f"FROM tbl_avaliacao a {juncao} WHERE a.tempo_primeira_promocao IS NOT NULL"
+        sql = f"""
+            SELECT s.ds_senioridade, ROUND(AVG(a.tempo_primeira_promocao)::numeric, 2)
+              {origem.replace('WHERE', 'JOIN tbl_senioridade s ON vue.id_senioridade = s.id_senioridade WHERE')}
+             GROUP BY s.ds_senioridade ORDER BY 1
+        """
+        timed(conn, sql)
+        resultado[nome] = {
+            **percentiles([timed(conn, sql) for _ in range(args.reps)]),
+            'linhas_agregadas': conn.execute(f"SELECT count(*) {origem}").fetchone()[0],
+            'medias': [[s, float(m)] for s, m in conn.execute(sql).fetchall()],
+        }
+    resultado['avaliacoes_com_vinculo'] = conn.execute(
+        "SELECT count(*) FROM tbl_avaliacao WHERE tempo_primeira_promocao IS NOT NULL AND id_vinculo IS NOT NULL"
+    ).fetchone()[0]
+    conn.close()
+
+    print(f"{total} avaliações, {resultado['avaliacoes_com_vinculo']} com promoção e vínculo")
+    for nome in juncoes:
+        medida = resultado[nome]
+        print(f"  {nome}: {medida['linhas_agregadas']} linhas agregadas, p50 {medida['p50_ms']} ms, "
+              f"p95 {medida['p95_ms']} ms; médias {medida['medias']}")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def _varreduras(no, tabela):
+    # quantas vezes o plano lê a tabela
+    proprio = 1 if (no['tabela'] or '').endswith(f'.{tabela}') else 0
+    return proprio + sum(_varreduras(filho, tabela) for filho in no['filhos'])
+
+
+def cmd_fused(args):
+    from fused import FUSED_SQL, FUSED_VIEWS, RELATORIO, full_report
+
+    db_file = os.path.join(args.db_dir, f'bench_fused_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+    conn.close()
+
+    def sequencial(conn):
+        return {view: conn.execute(f"SELECT * FROM {view}").to_arrow_table() for view in FUSED_VIEWS}
+
+    resultado = {'meta': metadata(), 'avaliacoes': total}
+    for nome, executar in (('sequencial', sequencial), ('fundido', full_report)):
+        frio = []
+        for _ in range(args.cold):
+            conn = duckdb.connect(db_file, read_only=True)
+            inicio = time.perf_counter()
+            executar(conn)
+            frio.append(time.perf_counter() - inicio)
+            conn.close()
+        conn = duckdb.connect(db_file, read_only=True)
+        executar(conn)
+        quente = []
+        for _ in range(args.reps):
+            inicio = time.perf_counter()
+            executar(conn)
+            quente.append(time.perf_counter() - inicio)
+        if nome == 'sequencial':
+            perfis = [profile(conn, f"SELECT * FROM {view}") for view in FUSED_VIEWS]
+        else:
+            perfis = [profile(conn, FUSED_SQL)]
+            perfis += [profile(conn, sql) for sql in FUSED_VIEWS.values()]
+            conn.execute(f"DROP TABLE {RELATORIO}")
+        resultado[nome] = {
+            'frio': percentiles(frio),
+            'quente': percentiles(quente),
+            'varreduras': sum(_varreduras(p['plano'], 'tbl_avaliacao') for p in perfis),
+            'linhas_lidas': sum(p['linhas_lidas'] or 0 for p in perfis),
+        }
+        conn.close()
+
+    conn = duckdb.connect(db_file, read_only=True)
+    fundido = full_report(conn)
+    divergentes = [
+        view for view, tabela in sequencial(conn).items()
+        if sorted(map(str, tabela.to_pylist())) != sorted(map(str, fundido[view].to_pylist()))
+    ]
+    conn.close()
+    resultado['divergentes'] = divergentes
+
+    print(f"{total} avaliações, {len(FUSED_VIEWS)} views; divergentes: {', '.join(divergentes) or 'nenhuma'}")
+    for nome in ('sequencial', 'fundido'):
+        medida = resultado[nome]
+        print(f"  {nome}: {medida['varreduras']} varreduras de tbl_avaliacao, "
+              f"{medida['linhas_lidas']} linhas lidas, p50 quente {medida['quente']['p50_ms']} ms, "
+              f"frio {medida['frio']['p50_ms']} ms")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 1 if divergentes else 0
+
+
+def cmd_leaderboard(args):
+    import leaderboard
+
+    db_file = os.path.join(args.db_dir, f'bench_leaderboard_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    total = _replicar_avaliacoes(conn, args.rows)
+    leaderboard.update_leaderboard(conn)
+
+    resultado = {'meta': metadata(), 'avaliacoes': total, 'k': args.k}
+    # leitura: top k guardado vs. média de todas as empresas ordenada na hora
+    sql_media = f"""
+        SELECT e.nm_fantasia_empresa, avg(a.nota_geral) AS media, count(*) AS qtd
+          FROM tbl_avaliacao a JOIN tbl_empresa e ON e.id_empresa = a.id_empresa
+         GROUP BY e.nm_fantasia_empresa ORDER BY media DESC LIMIT {args.k}
+    """
+    leituras = {
+        'placar': lambda: leaderboard.top_companies(conn, args.k),
+        'placar_estado': lambda: leaderboard.top_companies(conn, args.k, 'estado', 'SP'),
+        'media_na_hora': lambda: conn.execute(sql_media).fetchall(),
+    }
+    for nome, ler in leituras.items():
+        ler()
+        amostras = []
+        for _ in range(args.reps):
+            inicio = time.perf_counter()
+            ler()
+            amostras.append(time.perf_counter() - inicio)
+        resultado[nome] = percentiles(amostras)
+
+    # escrita: lotes de avaliações novas, incremental vs. recálculo completo
+    incremental, completo = [], []
+    for _ in range(args.lotes):
+        total = _replicar_avaliacoes(conn, total + args.lote)
+        inicio = time.perf_counter()
+        leaderboard.update_leaderboard(conn)
+        incremental.append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        leaderboard.rebuild_leaderboard(conn)
+        completo.append(time.perf_counter() - inicio)
+    resultado['update_incremental'] = percentiles(incremental)
+    resultado['rebuild'] = percentiles(completo)
+    conn.close()
+
+    print(f"{total} avaliações; top {args.k}:")
+    for nome in leituras:
+        print(f"  leitura {nome}: p50 {resultado[nome]['p50_ms']} ms, p95 {resultado[nome]['p95_ms']} ms")
+    print(f"  lote de {args.lote}: incremental p50 {resultado['update_incremental']['p50_ms']} ms, "
+          f"recálculo completo p50 {resultado['rebuild']['p50_ms']} ms")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def _avaliacoes_para(conn, empresas, n):
+    # n avaliações copiadas de outras, todas para as empresas dadas
+    conn.execute(f"""
+        INSERT INTO tbl_avaliacao
+        SELECT nextval('seq_tbl_avaliacao'), a.* EXCLUDE (id_avaliacao)
+                REPLACE ({list(empresas)}[1 + row_number() OVER () % {len(empresas)}] AS id_empresa)
+          FROM tbl_avaliacao a USING SAMPLE {n} ROWS
+    """)
+
+
+def cmd_similar(args):
+    import scipy.sparse as sp
+    import tracemalloc
+
+    import similar
+    from lookup import LookupService
+
+    db_file = os.path.join(args.db_dir, f'bench_similar_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    memoria = args.memoria_mb * 2**20
+    resultado = {'meta': metadata(), 'k': args.k, 'memoria_mb': args.memoria_mb}
+
+    inicio = time.perf_counter()
+    empresas = similar.rebuild_similar(conn, args.k, memoria)
+    resultado['banco'] = {'empresas': empresas, 'rebuild_s': round(time.perf_counter() - inicio, 3)}
+
+    # leitura: lista guardada (chave primária) vs. cosseno calculado na hora
+    ids = [r[0] for r in conn.execute("SELECT id_empresa FROM tbl_empresa_perfil GROUP BY ALL").fetchall()]
+    rng = np.random.default_rng(0)
+    sorteadas = rng.choice(ids, args.reps)
+
+    def na_hora(empresa):
+        # perfis já gravados; só a matriz e o produto de uma linha
+        ids_perfil, matriz = similar.load_matrix(conn)
+        return similar.neighbors(matriz, np.searchsorted(ids_perfil, [empresa]), args.k)
+
+    with LookupService(conn) as lookups:
+        leituras = {
+            'lista_guardada': lambda e: lookups.execute('empresa_similares', e),
+            'na_hora': na_hora,
+        }
+        for nome, ler in leituras.items():
+            ler(int(sorteadas[0]))
+            amostras = []
+            for e in sorteadas:
+                inicio = time.perf_counter()
+                ler(int(e))
+                amostras.append(time.perf_counter() - inicio)
+            resultado['banco'][nome] = percentiles(amostras)
+
+    # escrita: avaliações novas em poucas empresas, incremental vs. completo
+    incremental, completo = [], []
+    for _ in range(args.lotes):
+        _avaliacoes_para(conn, rng.choice(ids, args.tocadas, replace=False).tolist(), args.lote)
+        inicio = time.perf_counter()
+        similar.update_similar(conn, args.k, memoria)
+        incremental.append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        similar.rebuild_similar(conn, args.k, memoria)
+        completo.append(time.perf_counter() - inicio)
+    resultado['banco']['update_incremental'] = percentiles(incremental)
+    resultado['banco']['rebuild'] = percentiles(completo)
+    conn.close()
+
+    # escala: só o top k em blocos, com perfis sintéticos
+    resultado['escala'] = []
+    for n in args.empresas:
+        matriz = sp.random(n, args.atributos, density=args.densidade, format='csr',
+                           random_state=0, dtype=np.float32)
+        normas = np.sqrt(np.asarray(matriz.multiply(matriz).sum(axis=1)).ravel())
+        matriz = (sp.diags(1 / np.maximum(normas, 1e-12)) @ matriz).astype(np.float32).toarray()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        similar.neighbors(matriz, np.arange(n), args.k, memoria)
+        tempo = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        resultado['escala'].append({'empresas': n, 'tempo_s': round(tempo, 2), 'pico_mb': round(pico / 2**20, 1)})
+
+    banco = resultado['banco']
+    print(f"{banco['empresas']} empresas no banco, top {args.k}; rebuild {banco['rebuild_s']} s")
+    for nome in leituras:
+        print(f"  leitura {nome}: p50 {banco[nome]['p50_ms']} ms, p95 {banco[nome]['p95_ms']} ms")
+    print(f"  {args.lote} avaliações em {args.tocadas} empresas: incremental p50 "
+          f"{banco['update_incremental']['p50_ms']} ms, recálculo completo p50 {banco['rebuild']['p50_ms']} ms")
+    for linha in resultado['escala']:
+        print(f"  {linha['empresas']} empresas sintéticas: {linha['tempo_s']} s, "
+              f"pico {linha['pico_mb']} MB (orçamento {args.memoria_mb} MB)")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def cmd_users(args):
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    import users
+    from generate import cpf_digits, digits_to_strings
+
+    db_file = os.path.join(args.db_dir, f'bench_users_sf{args.sf:g}.duckdb')
+    os.makedirs(args.db_dir, exist_ok=True)
+    conn = index.build_database(db_file, args.sf)
+    processos = args.processos or os.cpu_count()
+    resultado = {'meta': metadata(), 'usuarios': args.usuarios, 'log_n': args.log_n, 'processos': processos}
+
+    # bases de CPF acima das do gerador (< 10^8), e-mails com o índice
+    i = np.arange(args.usuarios, dtype=np.int64)
+    lote = pa.table({
+        'nm_usuario': pa.array([f'Usuário {k}' for k in i]),
+        'cpf_usuario': digits_to_strings(cpf_digits(5 * 10**8 + i * 7919)),
+        'email_usuario': pa.array([f'usuario.{k}@bench.example.com' for k in i]),
+        'senha': pa.array([f'senha-{k:08d}' for k in i]),
+    })
+
+    inicio = time.perf_counter()
+    validas, _ = users.validate(conn, users.normalize(lote))
+    tempo = time.perf_counter() - inicio
+    resultado['validacao'] = {'usuarios_s': round(args.usuarios / tempo), 'validas': int(validas.sum())}
+
+    # só o hash: serial, processos e threads (o scrypt solta o GIL)
+    senhas = lote['senha'].to_pylist()
+    modos = {
+        'serial': lambda: None,
+        'processos': lambda: ProcessPoolExecutor(processos),
+        'threads': lambda: ThreadPoolExecutor(processos),
+    }
+    for nome, criar in modos.items():
+        pool = criar()
+        try:
+            inicio = time.perf_counter()
+            users.hash_passwords(senhas, pool, log_n=args.log_n)
+            tempo = time.perf_counter() - inicio
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        resultado[nome] = {'usuarios_s': round(args.usuarios / tempo, 1), 'tempo_s': round(tempo, 2)}
+
+    # carga completa de um arquivo Parquet (validação, hash e INSERT)
+    arquivo_usuarios = os.path.join(args.db_dir, 'bench_users.parquet')
+    pq.write_table(lote, arquivo_usuarios)
+    inicio = time.perf_counter()
+    carga = users.import_file(conn, arquivo_usuarios, processos=processos, log_n=args.log_n)
+    tempo = time.perf_counter() - inicio
+    conn.close()
+    resultado['carga'] = {'usuarios_s': round(carga['inseridas'] / tempo, 1), 'inseridas': carga['inseridas']}
+
+    print(f"{args.usuarios} usuários, scrypt N=2^{args.log_n}, {processos} processos "
+          f"({os.cpu_count()} núcleos):")
+    print(f"  validação: {resultado['validacao']['usuarios_s']} usuários/s")
+    for nome in modos:
+        print(f"  hash {nome}: {resultado[nome]['usuarios_s']} usuários/s")
+    print(f"  carga completa: {resultado['carga']['usuarios_s']} usuários/s")
+    with open(args.output, 'w') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do banco de avaliações")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('views', help="latência de todas as views vw_*")
+    p.add_argument('--sf', type=float, nargs='+', default=[0.1, 1])
+    p.add_argument('--reps', type=int, default=20, help="execuções quentes por view")
+    p.add_argument('--cold', type=int, default=3, help="execuções frias por view")
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_views.json')
+    p.add_argument('--baseline')
+    p.add_argument('--threshold', type=float, default=0.25,
+                   help="aumento relativo do p50 quente tolerado (0.25 = 25%%)")
+    p.set_defaults(func=cmd_views)
+
+    p = sub.add_parser('pool', help="vazão do pool de cursores vs. conexão única")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--db', help="banco existente (não reconstrói)")
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--clients', type=int, nargs='+', default=[8, 32])
+    p.add_argument('--workers', type=int, help="threads do pool (padrão: uma por cliente)")
+    p.add_argument('--queries', type=int, default=2000)
+    p.add_argument('--output', default='bench_pool.json')
+    p.set_defaults(func=cmd_pool)
+
+    p = sub.add_parser('ingest', help="vazão da ingestão em lote de avaliações")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=1_000_000)
+    p.add_argument('--batch', type=int, default=500_000)
+    p.add_argument('--db-dir', default='bench_db')
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser('search', help="busca BM25 vs. ILIKE nos depoimentos")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=10_000_000, help="avaliações no banco")
+    p.add_argument('--queries', nargs='+', default=['hora extra', '13°', 'remuneração', 'ambiente ótimo'])
+    p.add_argument('--stemming', action='store_true')
+    p.add_argument('-k', type=int, default=10)
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_search.json')
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser('archive', help="tamanho do banco e latência antes/depois do arquivo em Parquet")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--antes', default='2016-01-01', help="data de corte do arquivamento")
+    p.add_argument('--ano-consulta', type=int, default=2014, help="ano usado nas consultas às views hist_*")
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_archive.json')
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser('sketch', help="modo aproximado (sketches) vs. contagens e quantis exatos")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=2_000_000, help="avaliações no banco")
+    p.add_argument('--quantis', type=float, nargs='+', default=[0.5, 0.9, 0.99])
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_sketch.json')
+    p.set_defaults(func=cmd_sketch)
+
+    p = sub.add_parser('metrics', help="overhead da instrumentação das consultas nas views")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--reps', type=int, default=50)
+    p.add_argument('--taxa-perfil', type=float, default=0.01, help="fração dos comandos com profiler")
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_metrics.json')
+    p.set_defaults(func=cmd_metrics)
+
+    p = sub.add_parser('shard', help="views em arquivo único vs. scatter-gather nos shards")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--shards', type=int, default=4)
+    p.add_argument('--por', choices=['estado', 'hash'], default='hash')
+    p.add_argument('--workers', type=int)
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_shard.json')
+    p.set_defaults(func=cmd_shard)
+
+    p = sub.add_parser('startup', help="tempo de partida da CLI (falha acima do orçamento)")
+    p.add_argument('--sf', type=float, default=0.1)
+    p.add_argument('--view', default='vw_problemas_pj')
+    p.add_argument('--budget-ms', type=float, default=float(ORCAMENTO_MS))
+    p.add_argument('--reps', type=int, default=10)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_startup.json')
+    p.set_defaults(func=cmd_startup)
+
+    p = sub.add_parser('lookup', help="latência dos lookups por empresa e usuário sob carga")
+    p.add_argument('--sf', type=float, default=10)
+    p.add_argument('--rows', type=int, default=2_000_000, help="avaliações no banco")
+    p.add_argument('--lookups', type=int, default=2000)
+    p.add_argument('--taxa', type=float, default=10_000, help="lookups por segundo pedidos")
+    p.add_argument('--threads', type=int, default=4)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_lookup.json')
+    p.set_defaults(func=cmd_lookup)
+
+    p = sub.add_parser('aio', help="interface asyncio com centenas de corrotinas")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--coroutines', type=int, default=500)
+    p.add_argument('--concurrency', type=int, default=8, help="consultas em andamento ao mesmo tempo")
+    p.add_argument('--timeout', type=float, default=0.05, help="timeout da metade cancelada (s)")
+    p.add_argument('--batch', type=int, default=2048, help="linhas por lote no stream")
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_aio.json')
+    p.set_defaults(func=cmd_aio)
+
+    p = sub.add_parser('cluster', help="zonemaps e latência antes/depois de reordenar as tabelas")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=2_000_000, help="avaliações no banco")
+    p.add_argument('--views', nargs='+',
+                   default=['vw_empresas_clt_mascarado_pj', 'vw_tempo_medio_promocao_senioridade'])
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_cluster.json')
+    p.set_defaults(func=cmd_cluster)
+
+    p = sub.add_parser('links', help="junção por (usuário, empresa) vs. pelo vínculo resolvido")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=2_000_000, help="avaliações no banco")
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_links.json')
+    p.set_defaults(func=cmd_links)
+
+    p = sub.add_parser('fused', help="relatório fundido (uma varredura) vs. as views uma a uma")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=2_000_000, help="avaliações no banco")
+    p.add_argument('--cold', type=int, default=3)
+    p.add_argument('--reps', type=int, default=20)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_fused.json')
+    p.set_defaults(func=cmd_fused)
+
+    p = sub.add_parser('leaderboard', help="top k do ranking bayesiano: leitura e manutenção incremental")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--rows', type=int, default=2_000_000, help="avaliações no banco")
+    p.add_argument('--k', type=int, default=100)
+    p.add_argument('--reps', type=int, default=50)
+    p.add_argument('--lote', type=int, default=1000, help="avaliações novas por atualização")
+    p.add_argument('--lotes', type=int, default=5)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_leaderboard.json')
+    p.set_defaults(func=cmd_leaderboard)
+
+    p = sub.add_parser('similar', help="empresas parecidas: leitura, incremental e escala do top k")
+    p.add_argument('--sf', type=float, default=20)
+    p.add_argument('--k', type=int, default=10)
+    p.add_argument('--reps', type=int, default=50)
+    p.add_argument('--memoria-mb', type=int, default=256)
+    p.add_argument('--lote', type=int, default=200, help="avaliações novas por atualização")
+    p.add_argument('--tocadas', type=int, default=5, help="empresas que recebem as avaliações")
+    p.add_argument('--lotes', type=int, default=5)
+    p.add_argument('--empresas', type=int, nargs='+', default=[10_000, 100_000],
+                   help="tamanhos do teste de escala (perfis sintéticos)")
+    p.add_argument('--atributos', type=int, default=60)
+    p.add_argument('--densidade', type=float, default=0.3)
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_similar.json')
+    p.set_defaults(func=cmd_similar)
+
+    p = sub.add_parser('users', help="cadastro em lote: usuários/s com hash serial, processos e threads")
+    p.add_argument('--sf', type=float, default=1)
+    p.add_argument('--usuarios', type=int, default=500)
+    p.add_argument('--processos', type=int, help="padrão: um por núcleo")
+    p.add_argument('--log-n', type=int, default=15, help="custo do scrypt (N = 2^log_n)")
+    p.add_argument('--db-dir', default='bench_db')
+    p.add_argument('--output', default='bench_users.json')
+    p.set_defaults(func=cmd_users)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Cache de resultados das views, versionado pelos dados.
+#
+# Cada tabela tem um contador em tbl_versao_dados que as escritas
+# incrementam (bump_versions). A chave de uma entrada inclui as versões das
+# tabelas das quais a view depende, então uma escrita só invalida as views
+# que leem a tabela alterada. As entradas são tabelas Arrow; a remoção é LRU
+# com limite de memória em bytes.
+DATA_VERSION_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_versao_dados (
+    nm_tabela VARCHAR(60) PRIMARY KEY,
+    versao BIGINT NOT NULL,
+    dt_alteracao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+RE_TABELA = re.compile(r'\b((?:tbl|mv)_\w+)\b', re.IGNORECASE)
+RE_COLUNA = re.compile(r'^\w+$')
+MAX_BYTES = 256 * 1024 * 1024
+
+
+def bump_versions(conn, tables):
+    tables = sorted(set(tables))
+    if not tables:
+        return
+    conn.execute("""
+        INSERT INTO tbl_versao_dados (nm_tabela, versao)
+        SELECT unnest(?::VARCHAR[]), 1
+        ON CONFLICT (nm_tabela) DO UPDATE
+           SET versao = tbl_versao_dados.versao + 1, dt_alteracao = now()
+    """, [tables])
+
+
+def data_versions(conn, tables):
+    versoes = dict(conn.execute(
+        "SELECT nm_tabela, versao FROM tbl_versao_dados WHERE nm_tabela IN (SELECT unnest(?::VARCHAR[]))",
+        [list(tables)],
+    ).fetchall())
+    return tuple(versoes.get(t, 0) for t in tables)
+
+
+def dependencies(conn, view):
+    # a própria view (versionada quando é redefinida) e as tabelas tbl_*/mv_*
+    # citadas na definição; uma tabela depende só de si mesma
+    linha = conn.execute(
+        "SELECT sql FROM duckdb_views() WHERE view_name = ? AND NOT internal", [view]
+    ).fetchone()
+    if linha is None:
+        existe = conn.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [view]
+        ).fetchone()[0]
+        if not existe:
+            raise ValueError(f"View desconhecida: {view}")
+        return (view,)
+    return tuple(sorted({t.lower() for t in RE_TABELA.findall(linha[0])} | {view}))
+
+
+class ResultCache:
+    def __init__(self, conn, max_bytes=MAX_BYTES):
+        self.conn = conn
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._dependencias = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _deps(self, cursor, view):
+        if view not in self._dependencias:
+            self._dependencias[view] = dependencies(cursor, view)
+        return self._dependencias[view]
+
+    def _remove(self, chave):
+        tabela = self._entradas.pop(chave)
+        self._bytes -= tabela.nbytes
+
+    def fetch(self, view, filters=None):
+        # filters: {coluna: valor}, aplicados como igualdades. Um cursor por
+        # chamada: a conexão é compartilhada entre threads, e consultas
+        # simultâneas no mesmo objeto trocam os resultados entre si
+        cursor = self.conn.cursor()
+        try:
+            return self._fetch(cursor, view, filters)
+        finally:
+            cursor.close()
+
+    def _fetch(self, cursor, view, filters):
+        filtros = tuple(sorted((filters or {}).items()))
+        with self._lock:
+            deps = self._deps(cursor, view)
+        versoes = data_versions(cursor, deps)
+        chave = (view, filtros, versoes)
+
+        with self._lock:
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                self.hits += 1
+                return self._entradas[chave]
+            self.misses += 1
+            # versões antigas da mesma view não serão mais lidas
+            for antiga in [c for c in self._entradas if c[0] == view and c[1] == filtros]:
+                self._remove(antiga)
+                self.invalidations += 1
+
+        sql = f"SELECT * FROM {view}"
+        if any(not RE_COLUNA.match(coluna) for coluna, _ in filtros):
+            raise ValueError(f"Coluna inválida em {filters}")
+        if filtros:
+            sql += " WHERE " + " AND ".join(f'"{coluna}" = ?' for coluna, _ in filtros)
+        tabela = cursor.execute(sql, [valor for _, valor in filtros] or None).to_arrow_table()
+
+        with self._lock:
+            if tabela.nbytes <= self.max_bytes and chave not in self._entradas:
+                self._entradas[chave] = tabela
+                self._bytes += tabela.nbytes
+                while self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entradas)))
+                    self.evictions += 1
+        return tabela
+
+    def invalidate(self, tables):
+        # descarta na hora as entradas que dependem das tabelas alteradas
+        # (toda entrada tem as dependências já calculadas pelo fetch)
+        tables = set(tables)
+        with self._lock:
+            for chave in list(self._entradas):
+                if tables & set(self._dependencias[chave[0]]):
+                    self._remove(chave)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / consultas if consultas else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
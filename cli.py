@@ -0,0 +1,159 @@
+import argparse
+import os
+import sys
+
+import duckdb
+
+# Linha de comando do banco de avaliações.
+#
+#   python cli.py init [--sf 1]
+#   python cli.py load avaliacoes.parquet
+#   python cli.py refresh
+#   python cli.py report vw_problemas_pj [--grafico]
+#   python cli.py export vw_problemas_pj --format parquet
+#
+# report e export abrem o banco só para leitura. Cada subcomando importa só
+# o que usa (index, ingest e matplotlib são pesados), para a partida ficar
+# abaixo de um segundo (ORCAMENTO_MS); benchmark.py startup mede e
+# tests/test_cli.py cobra esse limite.
+ORCAMENTO_MS = 1000
+FORMATOS_EXPORT = {
+    'csv': "FORMAT csv, HEADER",
+    'parquet': "FORMAT parquet",
+    'json': "FORMAT json",
+}
+
+
+def _abrir_leitura(db_file):
+    if not os.path.exists(db_file):
+        raise SystemExit(f"Banco não encontrado: {db_file} (rode 'init' antes)")
+    return duckdb.connect(db_file, read_only=True)
+
+
+def _validar_view(conn, view):
+    existe = conn.execute(
+        "SELECT count(*) FROM duckdb_views() WHERE view_name = ? AND NOT internal", [view]
+    ).fetchone()[0]
+    if not existe:
+        raise SystemExit(f"View desconhecida: {view}")
+
+
+def cmd_init(args):
+    import index
+
+    if args.recriar:
+        conn = index.build_database(args.db, args.sf)
+    else:
+        conn = index.open_database(args.db, args.sf)
+    conn.close()
+    return 0
+
+
+def cmd_load(args):
+    from ingest import ingest_file
+
+    conn = duckdb.connect(args.db)
+    resultado = ingest_file(conn, args.arquivo, args.formato)
+    conn.close()
+    print(f"Lidas: {resultado['lidas']}, inseridas: {resultado['inseridas']}, "
+          f"rejeitadas: {len(resultado['rejeitadas'])}")
+    return 1 if resultado['rejeitadas'] else 0
+
+
+def cmd_refresh(args):
+    from leaderboard import update_leaderboard
+    from refresh import refresh
+    from rollup import update_rollup
+    from search import update_index
+    from similar import update_similar
+    from sketches import update_sketches
+
+    conn = duckdb.connect(args.db)
+    refresh(conn)
+    update_rollup(conn)
+    update_leaderboard(conn)
+    update_similar(conn)
+    # índice de busca e sketches só se já foram construídos
+    update_index(conn)
+    update_sketches(conn)
+    conn.close()
+    print("Tabelas mv_*, rollups, ranking, parecidas, índice de busca e sketches atualizados")
+    return 0
+
+
+def cmd_report(args):
+    conn = _abrir_leitura(args.db)
+    _validar_view(conn, args.view)
+    cursor = conn.execute(f"SELECT * FROM {args.view} LIMIT ?", [args.limite])
+    colunas = [d[0] for d in cursor.description]
+    linhas = [[str(v) for v in linha] for linha in cursor.fetchall()]
+    larguras = [max([len(c)] + [len(linha[i]) for linha in linhas]) for i, c in enumerate(colunas)]
+    print('  '.join(c.ljust(w) for c, w in zip(colunas, larguras)))
+    for linha in linhas:
+        print('  '.join(v.ljust(w) for v, w in zip(linha, larguras)))
+
+    if args.grafico:
+        # matplotlib só é importado aqui (dentro de render_chart)
+        from report import chart_data, render_chart
+
+        os.makedirs(args.out, exist_ok=True)
+        rotulos, valores, series = chart_data(conn, args.view)
+        for caminho in render_chart(args.view, rotulos, valores, series, args.out, args.formats):
+            print(f"Gráfico: {caminho}")
+    conn.close()
+    return 0
+
+
+def cmd_export(args):
+    conn = _abrir_leitura(args.db)
+    _validar_view(conn, args.view)
+    saida = args.saida or f'{args.view}.{args.format}'
+    caminho = saida.replace("'", "''")
+    conn.execute(f"COPY (SELECT * FROM {args.view}) TO '{caminho}' ({FORMATOS_EXPORT[args.format]})")
+    conn.close()
+    print(f"{args.view} exportada para {saida}")
+    return 0
+
+
+COMANDOS = {
+    'init': cmd_init,
+    'load': cmd_load,
+    'refresh': cmd_refresh,
+    'report': cmd_report,
+    'export': cmd_export,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de avaliações de empresas")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('init', help="cria o banco ou aplica migrações e views pendentes")
+    p.add_argument('--sf', type=float, help="fator de escala dos dados sintéticos (só banco novo)")
+    p.add_argument('--recriar', action='store_true', help="apaga o arquivo e cria do zero")
+
+    p = sub.add_parser('load', help="ingere avaliações de um arquivo CSV, JSONL ou Parquet")
+    p.add_argument('arquivo')
+    p.add_argument('--formato', choices=['csv', 'jsonl', 'parquet'])
+
+    sub.add_parser('refresh', help="atualiza mv_*, rollups e estruturas derivadas")
+
+    p = sub.add_parser('report', help="mostra uma view (e o gráfico, com --grafico)")
+    p.add_argument('view')
+    p.add_argument('--limite', type=int, default=50)
+    p.add_argument('--grafico', action='store_true')
+    p.add_argument('--out', default='relatorios')
+    p.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg'])
+
+    p = sub.add_parser('export', help="exporta uma view")
+    p.add_argument('view')
+    p.add_argument('--format', choices=list(FORMATOS_EXPORT), default='csv')
+    p.add_argument('--saida', help="arquivo de saída (padrão: <view>.<formato>)")
+
+    args = parser.parse_args(argv)
+    return COMANDOS[args.comando](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import argparse
+import sys
+
+import duckdb
+
+# Relatório completo numa leitura só de tbl_avaliacao.
+#
+# Cinco views leem tbl_avaliacao cada uma por conta própria; gerar todas
+# seguidas varre a tabela seis vezes (vw_percentual_hora_extra_remunerada
+# sozinha varre duas). full_report() varre uma vez: a CTE base
+# (MATERIALIZED) lê as colunas usadas por todas; um GROUP BY reduz a base
+# ao grão empresa × problema PJ × vínculo, e um GROUPING SETS sobre esse
+# resultado (já pequeno) monta os níveis das views: por problema PJ, por
+# empresa e pela senioridade do vínculo. Os benefícios saem da mesma base.
+# Tudo fica numa tabela temporária, uma linha por grupo, e cada view sai
+# dela com as mesmas colunas e a mesma ordem da original.
+#
+# Com a tabela em memória a varredura é barata e o tempo vai quase todo
+# nas agregações: medido com benchmark.py fused, o relatório fundido lê um
+# quinto das linhas mas não sai mais rápido que as views em sequência.
+# Compensa quando a leitura pesa (disco lento, tabela maior que a memória);
+# por isso report.py só o usa com --fundido.
+# vw_empresas_satisfacao_alta já lê tbl_rollup_nota e fica de fora.
+RELATORIO = '_relatorio'
+
+FUSED_SQL = f"""
+CREATE OR REPLACE TEMP TABLE {RELATORIO} AS
+WITH base AS MATERIALIZED (
+    SELECT id_avaliacao, id_empresa, cod_problema_pj, id_vinculo, nota_geral,
+           faz_hora_extra, hora_extra_remunerada, tempo_primeira_promocao
+      FROM tbl_avaliacao
+),
+-- o grão mais fino que as views pedem; as colunas de hora extra entram
+-- na chave (poucos valores), mais barato que agregá-las linha a linha
+fino AS (
+    SELECT id_empresa, cod_problema_pj, id_vinculo, faz_hora_extra, hora_extra_remunerada,
+           count(*) AS qtd,
+           sum(tempo_primeira_promocao) AS soma_promocao,
+           count(tempo_primeira_promocao) AS qtd_promocao
+      FROM base
+     GROUP BY id_empresa, cod_problema_pj, id_vinculo, faz_hora_extra, hora_extra_remunerada
+),
+grupos AS (
+    SELECT CASE WHEN GROUPING(f.cod_problema_pj) = 0 THEN 'problema_pj'
+                WHEN GROUPING(f.id_empresa) = 0 THEN 'empresa'
+                ELSE 'senioridade'
+           END AS conjunto,
+           CAST(coalesce(f.cod_problema_pj, f.id_empresa, v.id_senioridade) AS INTEGER) AS chave,
+           CAST(sum(f.qtd) AS BIGINT) AS qtd,
+           CAST(sum(f.qtd) FILTER (WHERE f.cod_problema_pj = 2) AS BIGINT) AS qtd_clt_mascarado,
+           bool_or(f.faz_hora_extra AND f.hora_extra_remunerada) AS hora_extra_rem,
+           bool_or(f.faz_hora_extra AND NOT f.hora_extra_remunerada) AS hora_extra_nao_rem,
+           sum(f.soma_promocao) AS soma_promocao,
+           sum(f.qtd_promocao) AS qtd_promocao
+      FROM fino f
+      LEFT JOIN tbl_vinculo_usuario_empresa v ON v.id_vinculo = f.id_vinculo
+     GROUP BY GROUPING SETS ((f.cod_problema_pj), (f.id_empresa), (v.id_senioridade))
+),
+beneficios AS (
+    SELECT 'beneficio' AS conjunto, CAST(ab.id_beneficio AS INTEGER) AS chave, count(*) AS qtd
+      FROM base
+      JOIN tbl_avaliacao_beneficio ab ON ab.id_avaliacao = base.id_avaliacao
+     WHERE base.nota_geral >= 4
+     GROUP BY ab.id_beneficio
+)
+SELECT * FROM grupos
+UNION ALL BY NAME
+SELECT * FROM beneficios
+"""
+
+# view -> consulta sobre {RELATORIO}, com as colunas e a ordem da view
+FUSED_VIEWS = {
+    'vw_problemas_pj': f"""
+        SELECT CASE chave
+                 WHEN 1 THEN 'Irregularidades contratuais'
+                 WHEN 2 THEN 'CLT mascarado de PJ'
+                 WHEN 3 THEN 'Não pagamento de férias ou 13°'
+                 WHEN 4 THEN 'Falta de garantia de direitos trabalhistas'
+                 ELSE 'Nenhum/Indefinido'
+               END AS problema_pj,
+               qtd
+          FROM {RELATORIO}
+         WHERE conjunto = 'problema_pj' AND chave IS NOT NULL
+         ORDER BY qtd DESC
+    """,
+    'vw_empresas_clt_mascarado_pj': f"""
+        SELECT e.nm_fantasia_empresa AS empresa, CAST(sum(r.qtd_clt_mascarado) AS BIGINT) AS qtd_clt_mascarado
+          FROM {RELATORIO} r
+          JOIN tbl_empresa e ON e.id_empresa = r.chave
+         WHERE r.conjunto = 'empresa' AND r.qtd_clt_mascarado > 0
+         GROUP BY e.nm_fantasia_empresa
+         ORDER BY qtd_clt_mascarado DESC, min(e.id_empresa)
+    """,
+    'vw_percentual_hora_extra_remunerada': f"""
+        WITH base AS (
+          SELECT (SELECT COUNT(*) FROM tbl_empresa) AS total_emp,
+                 count(*) FILTER (WHERE hora_extra_rem) AS total_rem,
+                 count(*) FILTER (WHERE hora_extra_nao_rem) AS total_nao_rem
+            FROM {RELATORIO}
+           WHERE conjunto = 'empresa'
+        )
+        SELECT 'Remunerado' AS categoria,
+               CASE WHEN total_emp = 0 THEN 0
+                    ELSE ROUND((total_rem * 100.0 / total_emp), 2)
+               END AS percentual
+          FROM base
+        UNION ALL
+        SELECT 'Não Remunerado' AS categoria,
+               CASE WHEN total_emp = 0 THEN 0
+                    ELSE ROUND((total_nao_rem * 100.0 / total_emp), 2)
+               END AS percentual
+          FROM base
+    """,
+    'vw_beneficios_mais_oferecidos_boas_notas': f"""
+        SELECT b.ds_beneficio, r.qtd
+          FROM {RELATORIO} r
+          JOIN tbl_beneficio b ON b.id_beneficio = r.chave
+         WHERE r.conjunto = 'beneficio'
+         ORDER BY qtd DESC
+    """,
+    'vw_tempo_medio_promocao_senioridade': f"""
+        SELECT s.ds_senioridade AS senioridade,
+               ROUND((r.soma_promocao / r.qtd_promocao)::numeric, 2) AS media_meses_promocao
+          FROM {RELATORIO} r
+          JOIN tbl_senioridade s ON s.id_senioridade = r.chave
+         WHERE r.conjunto = 'senioridade' AND r.qtd_promocao > 0
+         ORDER BY media_meses_promocao
+    """,
+}
+
+
+def full_report(conn, views=None):
+    # {view: tabela Arrow} para as views de FUSED_VIEWS (ou as pedidas);
+    # usa um cursor próprio, a tabela temporária é da conexão
+    views = list(FUSED_VIEWS) if views is None else views
+    for view in views:
+        if view not in FUSED_VIEWS:
+            raise ValueError(f"View fora do relatório fundido: {view}")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(FUSED_SQL)
+        resultado = {view: cursor.execute(FUSED_VIEWS[view]).to_arrow_table() for view in views}
+        cursor.execute(f"DROP TABLE {RELATORIO}")
+    finally:
+        cursor.close()
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatório das views de tbl_avaliacao numa varredura só")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--views', nargs='+', choices=list(FUSED_VIEWS))
+    parser.add_argument('--limite', type=int, default=20, help="linhas exibidas por view")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db, read_only=True)
+    resultado = full_report(conn, args.views)
+    conn.close()
+    for view, tabela in resultado.items():
+        print(f"{view} ({tabela.num_rows} linhas):")
+        for linha in tabela.slice(0, args.limite).to_pylist():
+            print(f"  {linha}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from cache import bump_versions
+
+# Gerador sintético com fator de escala (SF), no estilo do TPC-H.
+# SF=1 gera 10 mil usuários e 100 empresas; os vínculos, avaliações e
+# benefícios crescem proporcionalmente (SF=100 -> ~1M usuários,
+# ~2M vínculos, ~1.6M avaliações e ~4M links avaliação-benefício).
+#
+# A geração em NumPy/Arrow leva poucos segundos mesmo em SF=100; o que
+# domina a carga é o DuckDB conferindo as FKs e as chaves a cada linha
+# (só as duas FKs de tbl_avaliacao_beneficio custam ~10 s em 4M linhas).
+# Medido num núcleo, SF=100 carrega em ~65-75 s (metade nas inserções,
+# metade no COMMIT/CHECKPOINT dos índices): a meta de "segundos" não é
+# atingida sem abrir mão das restrições do DDL.
+USUARIOS_POR_SF = 10_000
+# todos os usuários gerados têm a mesma senha, guardada como hash scrypt
+# (users.py) com custo baixo: um scrypt por usuário dobraria a carga
+SENHA_SINTETICA = 'senha-sintetica'
+EMPRESAS_POR_SF = 100
+LOTE_USUARIOS = 250_000
+
+DT_INICIO_MIN = np.datetime64('2010-01-01T00:00:00', 's')
+DT_INICIO_MAX = np.datetime64('2024-12-31T00:00:00', 's')
+
+PRIMEIROS_NOMES = [
+    ('Ana', 'ana'), ('Bruno', 'bruno'), ('Carla', 'carla'), ('Daniel', 'daniel'),
+    ('Eva', 'eva'), ('Felipe', 'felipe'), ('Gabriela', 'gabriela'), ('Henrique', 'henrique'),
+    ('Isabela', 'isabela'), ('João', 'joao'), ('Karina', 'karina'), ('Leonardo', 'leonardo'),
+    ('Mariana', 'mariana'), ('Nathan', 'nathan'), ('Olivia', 'olivia'), ('Paulo', 'paulo'),
+    ('Renata', 'renata'), ('Sérgio', 'sergio'), ('Tatiane', 'tatiane'), ('Vinícius', 'vinicius'),
+]
+SOBRENOMES = [
+    ('Silva', 'silva'), ('Souza', 'souza'), ('Mendes', 'mendes'), ('Oliveira', 'oliveira'),
+    ('Pereira', 'pereira'), ('Costa', 'costa'), ('Lima', 'lima'), ('Rocha', 'rocha'),
+    ('Martins', 'martins'), ('Alves', 'alves'), ('Dias', 'dias'), ('Barbosa', 'barbosa'),
+    ('Ferreira', 'ferreira'), ('Gomes', 'gomes'), ('Araújo', 'araujo'), ('Ribeiro', 'ribeiro'),
+]
+
+NOMES_EMPRESA = [
+    'Tech Innovators', 'Data Solutions', 'Cloud Services', 'GreenTech', 'Alpha Systems',
+    'Beta Software', 'Nuvem Digital', 'Código Certo', 'Pixel Labs', 'Bit Forte',
+]
+SUFIXOS_RAZAO = ['Ltda.', 'S.A.', 'ME', 'EIRELI']
+RUAS = ['Av. Paulista', 'Rua das Flores', 'Av. Rio Branco', 'Rua Acácias', 'Av. Atlântica',
+        'Rua XV de Novembro', 'Av. Brasil', 'Rua da Consolação']
+BAIRROS = ['Bela Vista', 'Centro', 'Botafogo', 'Copacabana', 'Savassi', 'Boa Viagem', 'Moinhos']
+# (cidade, UF, peso)
+CIDADES = [
+    ('São Paulo', 'SP', 35), ('Rio de Janeiro', 'RJ', 20), ('Belo Horizonte', 'MG', 10),
+    ('Curitiba', 'PR', 8), ('Porto Alegre', 'RS', 7), ('Recife', 'PE', 6),
+    ('Florianópolis', 'SC', 6), ('Salvador', 'BA', 5), ('Brasília', 'DF', 3),
+]
+
+DEPOIMENTOS = [
+    'Ambiente excelente, grande aprendizado.',
+    'Projeto interessante, mas poderia melhorar.',
+    'Tive problemas com PJ, mas liderança era boa.',
+    'Boas oportunidades de crescimento.',
+    'Trabalho desafiador, mas horas extras existem.',
+    'Ambiente equilibrado e suporte adequado.',
+    'Fazemos hora extra, mas nem sempre é paga.',
+    'Empresa em crescimento, equipe unida.',
+    'Horário flexível e política de benefícios boa.',
+    'Remuneração poderia ser melhor, mas ambiente ótimo.',
+    'Empresa inovadora, mas gestão de pessoas precisa evoluir.',
+    'Equilíbrio razoável entre vida pessoal e trabalho.',
+    'Precisa melhorar a comunicação interna.',
+    'Bons líderes, metodologia ágil bem aplicada.',
+    'Benefícios excelentes, equipe madura tecnicamente.',
+    'Muito trabalho repetitivo, pouca inovação.',
+    'Boa remuneração e liberdade de escolha de projetos.',
+    'Várias oportunidades de promoção interna.',
+    'Processos um pouco burocráticos.',
+    'Falta de transparência em algumas decisões.',
+    'Horas extras são remuneradas, clima descontraído.',
+    'Contratado como PJ, mas sem contrato claro de hora extra.',
+    'Relação de trabalho exigia horário fixo, mas era PJ.',
+    'Tudo estava ótimo até notar falta de 13° para PJ.',
+    'Não pagaram 13° e férias, mesmo exigindo dedicação exclusiva.',
+    'Exigem registro de ponto e metas típicas de CLT.',
+]
+
+# probabilidade de cada benefício (na ordem de id_beneficio) aparecer numa avaliação
+PROB_BENEFICIO = [0.55, 0.45, 0.50, 0.20, 0.08, 0.25, 0.15, 0.10, 0.30]
+CARGAS_HORARIAS = [20, 30, 36, 40, 44]
+SALARIO_BASE_SENIORIDADE = [3500.0, 6000.0, 10000.0]
+
+CPF_PESOS_1 = np.arange(10, 1, -1)
+CPF_PESOS_2 = np.arange(11, 1, -1)
+CNPJ_PESOS_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+CNPJ_PESOS_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+
+def to_digits(values, width):
+    # inteiros -> matriz (n, width) de dígitos decimais
+    potencias = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return (np.asarray(values, dtype=np.int64)[:, None] // potencias) % 10
+
+
+def digits_to_strings(digits):
+    texto = np.ascontiguousarray(digits.astype(np.uint8) + ord('0'))
+    return pa.array(texto.view(f'S{digits.shape[1]}').ravel()).cast(pa.string())
+
+
+def cpf_digits(base):
+    # base: inteiros de 9 dígitos -> (n, 11) com os dígitos verificadores
+    d = to_digits(base, 9)
+    dv1 = (d @ CPF_PESOS_1 * 10 % 11) % 10
+    d = np.column_stack([d, dv1])
+    dv2 = (d @ CPF_PESOS_2 * 10 % 11) % 10
+    return np.column_stack([d, dv2])
+
+
+def cnpj_digits(base):
+    # base: inteiros de 12 dígitos (raiz + filial) -> (n, 14)
+    d = to_digits(base, 12)
+    resto = d @ CNPJ_PESOS_1 % 11
+    d = np.column_stack([d, np.where(resto < 2, 0, 11 - resto)])
+    resto = d @ CNPJ_PESOS_2 % 11
+    return np.column_stack([d, np.where(resto < 2, 0, 11 - resto)])
+
+
+def reserve_ids(conn, sequence, n):
+    # consome n valores da sequence e devolve o primeiro, para que os ids
+    # gerados em lote continuem consistentes com os DEFAULT nextval(...)
+    if n == 0:
+        return None
+    return conn.execute(
+        f"SELECT min(v) FROM (SELECT nextval('{sequence}') AS v FROM range({n}))"
+    ).fetchone()[0]
+
+
+def _ids(conn, sql):
+    return np.array([r[0] for r in conn.execute(sql).fetchall()], dtype=np.int64)
+
+
+def _timestamps(segundos):
+    return pa.array(segundos.astype('datetime64[s]')).cast(pa.timestamp('us'))
+
+
+def _nullable(values, mask_validos):
+    return pa.array(values, mask=~mask_validos)
+
+
+def insert_arrow(conn, table, batch):
+    conn.register('_lote', batch)
+    cols = ', '.join(batch.column_names)
+    conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM _lote")
+    conn.unregister('_lote')
+
+
+def _empresas(conn, rng, n):
+    id_inicio = reserve_ids(conn, 'seq_empresa', n)
+    ids = np.arange(id_inicio, id_inicio + n, dtype=np.int64)
+    # raiz do CNPJ derivada do id (bijeção mod 10^8), filial 0001
+    raiz = (ids * 48271) % 10**8
+    cnpj = digits_to_strings(cnpj_digits(raiz * 10_000 + 1))
+
+    nome = pc.take(pa.array(NOMES_EMPRESA), rng.integers(0, len(NOMES_EMPRESA), n))
+    id_str = pc.cast(pa.array(ids), pa.string())
+    fantasia = pc.binary_join_element_wise(nome, id_str, ' ')
+    razao = pc.binary_join_element_wise(
+        fantasia, pc.take(pa.array(SUFIXOS_RAZAO), rng.integers(0, len(SUFIXOS_RAZAO), n)), ' ')
+
+    pesos = np.array([c[2] for c in CIDADES], dtype=np.float64)
+    cidade_idx = rng.choice(len(CIDADES), n, p=pesos / pesos.sum())
+    cep = digits_to_strings(to_digits(rng.integers(1_000_000, 99_999_999, n), 8))
+
+    batch = pa.table({
+        'id_empresa': pa.array(ids, pa.int32()),
+        'nm_fantasia_empresa': fantasia,
+        'razao_social_empresa': razao,
+        'cnpj_empresa': cnpj,
+        'rua_empresa': pc.take(pa.array(RUAS), rng.integers(0, len(RUAS), n)),
+        'numero_empresa': pc.cast(pa.array(rng.integers(1, 5000, n)), pa.string()),
+        'bairro_empresa': pc.take(pa.array(BAIRROS), rng.integers(0, len(BAIRROS), n)),
+        'cidade_empresa': pc.take(pa.array([c[0] for c in CIDADES]), cidade_idx),
+        'estado_empresa': pc.take(pa.array([c[1] for c in CIDADES]), cidade_idx),
+        'cep_empresa': cep,
+    })
+    insert_arrow(conn, 'tbl_empresa', batch)
+    return ids
+
+
+def _usuarios(conn, rng, n, senha_hash):
+    id_inicio = reserve_ids(conn, 'seq_usuario', n)
+    ids = np.arange(id_inicio, id_inicio + n, dtype=np.int64)
+    # base do CPF com 1º dígito 0 e nunca 000000000 (ids < 10^8)
+    cpf = digits_to_strings(cpf_digits((ids * 48271) % 10**8))
+
+    p = rng.integers(0, len(PRIMEIROS_NOMES), n)
+    s = rng.integers(0, len(SOBRENOMES), n)
+    id_str = pc.cast(pa.array(ids), pa.string())
+    nome = pc.binary_join_element_wise(
+        pc.take(pa.array([x[0] for x in PRIMEIROS_NOMES]), p),
+        pc.take(pa.array([x[0] for x in SOBRENOMES]), s), ' ')
+    email = pc.binary_join_element_wise(
+        pc.take(pa.array([x[1] for x in PRIMEIROS_NOMES]), p),
+        pc.take(pa.array([x[1] for x in SOBRENOMES]), s),
+        pc.binary_join_element_wise(id_str, pa.scalar('example.com'), '@'), '.')
+
+    batch = pa.table({
+        'id_usuario': pa.array(ids, pa.int32()),
+        'nm_usuario': nome,
+        'cpf_usuario': cpf,
+        'email_usuario': email,
+        'senha_usuario': pa.repeat(pa.scalar(senha_hash), n),
+    })
+    insert_arrow(conn, 'tbl_usuario', batch)
+    return ids
+
+
+def _vinculos(conn, rng, usuarios, empresas, qualidade, cargos, senioridades):
+    n_usuarios = len(usuarios)
+    por_usuario = rng.integers(1, 4, n_usuarios)
+    m = int(por_usuario.sum())
+    fim_grupo = np.cumsum(por_usuario)
+    inicio_grupo = fim_grupo - por_usuario
+
+    id_inicio = reserve_ids(conn, 'tbl_vinculo_usuario_empresa', m)
+    ids = np.arange(id_inicio, id_inicio + m, dtype=np.int64)
+    id_usuario = np.repeat(usuarios, por_usuario)
+    # empresas maiores concentram mais vínculos
+    id_empresa = empresas[(rng.random(m) ** 2 * len(empresas)).astype(np.int64)]
+
+    # datas crescentes dentro de cada usuário: o último vínculo é o atual
+    intervalo = (DT_INICIO_MAX - DT_INICIO_MIN).astype(np.int64)
+    saltos = rng.integers(0, intervalo // 3, m)
+    acumulado = np.cumsum(saltos)
+    acumulado -= np.repeat(acumulado[inicio_grupo] - saltos[inicio_grupo], por_usuario)
+    inicio = DT_INICIO_MIN.astype(np.int64) + np.minimum(acumulado, intervalo)
+    atual = np.zeros(m, dtype=bool)
+    atual[fim_grupo - 1] = True
+
+    sen_idx = rng.integers(0, len(senioridades), m)
+    base = np.array(SALARIO_BASE_SENIORIDADE)[np.minimum(sen_idx, len(SALARIO_BASE_SENIORIDADE) - 1)]
+    salario = np.round(base * rng.lognormal(0.0, 0.25, m) * (0.85 + 0.3 * qualidade[id_empresa - empresas[0]]), 2)
+    regime = np.where(rng.random(m) < 0.3, 2, 1)
+
+    batch = pa.table({
+        'id_vinculo': pa.array(ids, pa.int32()),
+        'id_usuario': pa.array(id_usuario, pa.int32()),
+        'id_empresa': pa.array(id_empresa, pa.int32()),
+        'id_cargo_especialidade': pa.array(cargos[rng.integers(0, len(cargos), m)], pa.int32()),
+        'id_senioridade': pa.array(senioridades[sen_idx], pa.int32()),
+        'salario_vinculo': pa.array(salario),
+        'cod_regime_contratacao': pa.array(regime, pa.int32()),
+        'cod_modelo_trabalho': pa.array(rng.integers(1, 4, m), pa.int32()),
+        'carga_horaria_vinculo': pa.array(np.array(CARGAS_HORARIAS)[rng.integers(0, len(CARGAS_HORARIAS), m)], pa.int32()),
+        'cod_turno': pa.array(rng.choice([1, 2, 3], m, p=[0.8, 0.15, 0.05]), pa.int32()),
+        'dt_inicio_vinculo': _timestamps(inicio),
+        'emprego_atual': pa.array(atual),
+    })
+    insert_arrow(conn, 'tbl_vinculo_usuario_empresa', batch)
+    return {'id_vinculo': ids, 'id_usuario': id_usuario, 'id_empresa': id_empresa, 'regime': regime,
+            'inicio': inicio}
+
+
+def _avaliacoes(conn, rng, vinculos, empresas, qualidade, cargos):
+    # ~80% dos vínculos geram uma avaliação
+    origem = np.flatnonzero(rng.random(len(vinculos['id_usuario'])) < 0.8)
+    n = len(origem)
+    id_inicio = reserve_ids(conn, 'seq_tbl_avaliacao', n)
+    ids = np.arange(id_inicio, id_inicio + n, dtype=np.int64)
+    id_empresa = vinculos['id_empresa'][origem]
+    pj = vinculos['regime'][origem] == 2
+
+    faz_hora_extra = rng.random(n) < 0.5
+    promocao = rng.random(n) < 0.6
+    aumento = rng.random(n) < 0.7
+    problema = pj & (rng.random(n) < 0.6)
+    assedio = rng.random(n) < 0.05
+    com_cargo = rng.random(n) < 0.9
+    nota = np.clip(np.rint(1.5 + 3.5 * qualidade[id_empresa - empresas[0]] + rng.normal(0, 0.8, n)), 1, 5)
+    # nunca no futuro: links (ASOF) e o arquivo por mês dependem das datas
+    agora = np.datetime64('now', 's').astype(np.int64)
+    avaliacao = np.minimum(vinculos['inicio'][origem] + rng.integers(30, 1500, n) * 86_400, agora)
+
+    batch = pa.table({
+        'id_avaliacao': pa.array(ids, pa.int32()),
+        'id_usuario': pa.array(vinculos['id_usuario'][origem], pa.int32()),
+        'id_empresa': pa.array(id_empresa, pa.int32()),
+        # o vínculo que originou a avaliação (data posterior ao início dele)
+        'id_vinculo': pa.array(vinculos['id_vinculo'][origem], pa.int32()),
+        'cargo_mais_requisitado': _nullable(cargos[rng.integers(0, len(cargos), n)].astype(np.int32), com_cargo),
+        'faz_hora_extra': pa.array(faz_hora_extra),
+        # chk_hora_extra_remunerada: NULL se e somente se não faz hora extra
+        'hora_extra_remunerada': _nullable(rng.random(n) < 0.6, faz_hora_extra),
+        'tempo_primeira_promocao': _nullable(rng.integers(3, 37, n).astype(np.int32), promocao),
+        'percent_promocao': _nullable(np.round(rng.uniform(1, 30, n), 2), promocao),
+        'tempo_primeiro_aumento': _nullable(rng.integers(2, 25, n).astype(np.int32), aumento),
+        'percent_aumento': _nullable(np.round(rng.uniform(1, 20, n), 2), aumento),
+        'cod_problema_pj': _nullable(rng.integers(1, 5, n).astype(np.int32), problema),
+        'cod_assedio': _nullable(rng.integers(1, 3, n).astype(np.int32), assedio),
+        'depoimento_geral': pc.take(pa.array(DEPOIMENTOS), rng.integers(0, len(DEPOIMENTOS), n)),
+        'nota_geral': pa.array(nota.astype(np.int32)),
+        'dt_avaliacao': _timestamps(avaliacao),
+    })
+    insert_arrow(conn, 'tbl_avaliacao', batch)
+    return ids, nota
+
+
+def _avaliacao_beneficios(conn, rng, avaliacoes, notas, beneficios):
+    prob = np.resize(np.array(PROB_BENEFICIO), len(beneficios))
+    # avaliações boas citam um pouco mais de benefícios
+    fator = (0.7 + 0.1 * notas)[:, None]
+    marcados = rng.random((len(avaliacoes), len(beneficios))) < prob[None, :] * fator
+    linha, coluna = np.nonzero(marcados)
+    n = len(linha)
+    id_inicio = reserve_ids(conn, 'seq_tbl_avaliacao_beneficio', n)
+    batch = pa.table({
+        'id_avaliacao_beneficio': pa.array(np.arange(id_inicio, id_inicio + n), pa.int32()),
+        'id_avaliacao': pa.array(avaliacoes[linha], pa.int32()),
+        'id_beneficio': pa.array(beneficios[coluna], pa.int32()),
+    })
+    insert_arrow(conn, 'tbl_avaliacao_beneficio', batch)
+
+
+def generate(conn, scale_factor=1, seed=42, batch_size=LOTE_USUARIOS):
+    # As tabelas de domínio (senioridade, cargo, benefício) já devem estar
+    # carregadas; os ids delas são lidos do banco.
+    rng = np.random.default_rng(seed)
+    cargos = _ids(conn, "SELECT id_cargo_especialidade FROM tbl_cargo_especialidade ORDER BY 1")
+    senioridades = _ids(conn, "SELECT id_senioridade FROM tbl_senioridade ORDER BY 1")
+    beneficios = _ids(conn, "SELECT id_beneficio FROM tbl_beneficio ORDER BY 1")
+
+    n_empresas = max(1, int(round(EMPRESAS_POR_SF * scale_factor)))
+    n_usuarios = max(1, int(round(USUARIOS_POR_SF * scale_factor)))
+
+    # checkpoints intermediários reescrevem os índices ART inteiros a cada
+    # lote (custo quadrático); adiamos para um único CHECKPOINT no final
+    conn.execute("SET checkpoint_threshold = '64GB'")
+
+    # users.py importa este módulo; o import fica aqui para não fechar o ciclo
+    from users import SCRYPT_LOG_N_SINTETICO, hash_password
+    senha_hash = hash_password(SENHA_SINTETICA, SCRYPT_LOG_N_SINTETICO)
+
+    conn.execute("BEGIN TRANSACTION")
+    empresas = _empresas(conn, rng, n_empresas)
+    qualidade = rng.beta(4, 2, n_empresas)
+    conn.execute("COMMIT")
+
+    for inicio in range(0, n_usuarios, batch_size):
+        n = min(batch_size, n_usuarios - inicio)
+        conn.execute("BEGIN TRANSACTION")
+        usuarios = _usuarios(conn, rng, n, senha_hash)
+        vinculos = _vinculos(conn, rng, usuarios, empresas, qualidade, cargos, senioridades)
+        avaliacoes, notas = _avaliacoes(conn, rng, vinculos, empresas, qualidade, cargos)
+        _avaliacao_beneficios(conn, rng, avaliacoes, notas, beneficios)
+        conn.execute("COMMIT")
+
+    bump_versions(conn, ['tbl_empresa', 'tbl_usuario', 'tbl_vinculo_usuario_empresa',
+                         'tbl_avaliacao', 'tbl_avaliacao_beneficio'])
+
+    conn.execute("RESET checkpoint_threshold")
+    conn.execute("CHECKPOINT")
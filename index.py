@@ -1,6 +1,20 @@
 import duckdb
 import os
-import matplotlib.pyplot as plt
+import sys
+
+from archive import ARCHIVE_DDL
+from cache import DATA_VERSION_DDL, bump_versions
+from generate import generate
+from leaderboard import LEADERBOARD_DDL, update_leaderboard
+from links import LINKS_DDL, backfill_links
+from metrics import METRICS_DDL, InstrumentedConnection
+from migrations import apply_views, current_version, migrate
+from refresh import MARKS_DDL, REFRESH_DDL, init_refresh
+from rollup import MARCA_BENEFICIO_DDL, ROLLUP_BENEFICIO_DDL, ROLLUP_DDL, update_rollup
+from search import POSTAGEM_INTEGER_DDL, SEARCH_DDL
+from similar import SIMILAR_DDL, update_similar
+from sketches import SKETCH_DDL
+from users import SCRYPT_LOG_N_SINTETICO, hash_plaintext
 
 DDL = r"""
 CREATE SEQUENCE seq_usuario;
@@ -110,7 +124,7 @@ CREATE TABLE tbl_avaliacao_beneficio (
 );
 
 """
-POPULATE = r"""
+DIMENSIONS = r"""
 INSERT INTO tbl_senioridade (ds_senioridade) VALUES
 ('Júnior'),     -- id_senioridade = 1
 ('Pleno'),      -- id_senioridade = 2
@@ -136,7 +150,8 @@ INSERT INTO tbl_beneficio (ds_beneficio) VALUES
 ('Treinamento Pago'),    -- 7
 ('Academia'),            -- 8
 ('Cartão Alimentação');  -- 9
-
+"""
+POPULATE = r"""
 ------------------------------------------------------------------------------
 -- 4. INSERÇÃO DE USUÁRIOS (15 USUÁRIOS)
 ------------------------------------------------------------------------------
@@ -568,6 +583,11 @@ VALUES
 (30, 1),
 (30, 2);
     """
+# vw_media_salario_cargo_senioridade, vw_empresas_satisfacao_alta e
+# vw_tempo_primeiro_aumento_dev leem os rollups (rollup.py): alterações
+# feitas depois do último update_rollup, inclusive por
+# refresh.update_salario e set_emprego_atual, só aparecem nelas depois do
+# próximo (cli.py refresh ou open_database).
 VIEWS = """CREATE TABLE mv_usuario_empresa_atual AS
 SELECT u.id_usuario,
        u.nm_usuario,
@@ -591,7 +611,10 @@ SELECT a.id_avaliacao,
        a.dt_avaliacao  
 FROM tbl_avaliacao a  
 JOIN tbl_empresa e ON a.id_empresa = e.id_empresa  
-JOIN tbl_usuario u on u.id_usuario = a.id_usuario;
+JOIN tbl_usuario u on u.id_usuario = a.id_usuario
+-- gravada em ordem de empresa: o perfil de uma empresa (lookup.py) lê só
+-- os blocos dela
+ORDER BY a.id_empresa, a.dt_avaliacao DESC;
 
 CREATE OR REPLACE VIEW vw_beneficios_mais_oferecidos_boas_notas AS
 SELECT
@@ -608,10 +631,10 @@ CREATE VIEW vw_media_salario_cargo_senioridade AS
 SELECT 
     ce.ds_cargo_especialidade AS cargo,
     s.ds_senioridade          AS senioridade,
-    ROUND(AVG(vue.salario_vinculo)::numeric, 2) AS media_salarial
-FROM tbl_vinculo_usuario_empresa vue
-JOIN tbl_cargo_especialidade ce ON vue.id_cargo_especialidade = ce.id_cargo_especialidade
-JOIN tbl_senioridade s         ON vue.id_senioridade = s.id_senioridade
+    ROUND((SUM(r.soma) / SUM(r.qtd))::numeric, 2) AS media_salarial
+FROM tbl_rollup_vinculo r
+JOIN tbl_cargo_especialidade ce ON r.id_cargo_especialidade = ce.id_cargo_especialidade
+JOIN tbl_senioridade s         ON r.id_senioridade = s.id_senioridade
 GROUP BY ce.ds_cargo_especialidade, s.ds_senioridade;
 
 CREATE VIEW vw_problemas_pj AS
@@ -644,10 +667,7 @@ SELECT
     s.ds_senioridade AS senioridade,
     ROUND(AVG(a.tempo_primeira_promocao)::numeric, 2) AS media_meses_promocao
 FROM tbl_avaliacao a
-JOIN tbl_usuario u ON a.id_usuario = u.id_usuario
-JOIN tbl_vinculo_usuario_empresa vue 
-  ON a.id_usuario = vue.id_usuario
- AND a.id_empresa = vue.id_empresa
+JOIN tbl_vinculo_usuario_empresa vue ON vue.id_vinculo = a.id_vinculo
 JOIN tbl_senioridade s ON vue.id_senioridade = s.id_senioridade
 WHERE a.tempo_primeira_promocao IS NOT NULL
 GROUP BY s.ds_senioridade
@@ -661,31 +681,29 @@ FROM tbl_avaliacao a
 JOIN tbl_empresa e ON a.id_empresa = e.id_empresa
 WHERE a.cod_problema_pj = 2
 GROUP BY e.nm_fantasia_empresa
-ORDER BY qtd_clt_mascarado DESC;
+-- empate na contagem: a empresa de menor id primeiro, para a ordem não
+-- depender do plano
+ORDER BY qtd_clt_mascarado DESC, min(e.id_empresa);
 
 CREATE VIEW vw_empresas_satisfacao_alta AS
 SELECT 
     e.nm_fantasia_empresa AS empresa,
-    ROUND(AVG(a.nota_geral)::numeric, 2) AS media_nota
-FROM tbl_avaliacao a
-JOIN tbl_empresa e ON a.id_empresa = e.id_empresa
+    ROUND((SUM(r.soma) / SUM(r.qtd))::numeric, 2) AS media_nota
+FROM tbl_rollup_nota r
+JOIN tbl_empresa e ON r.id_empresa = e.id_empresa
 GROUP BY e.nm_fantasia_empresa
-HAVING AVG(a.nota_geral) > 4
+HAVING SUM(r.soma) / SUM(r.qtd) > 4
 ORDER BY media_nota DESC;
 
 CREATE VIEW vw_tempo_primeiro_aumento_dev AS
 SELECT
     s.ds_senioridade AS senioridade,
-    ROUND(AVG(a.tempo_primeiro_aumento)::numeric, 2) AS media_meses_aumento
-FROM tbl_avaliacao a
-JOIN tbl_vinculo_usuario_empresa vue 
-  ON a.id_usuario = vue.id_usuario 
- AND a.id_empresa = vue.id_empresa
-JOIN tbl_cargo_especialidade ce ON vue.id_cargo_especialidade = ce.id_cargo_especialidade
-JOIN tbl_senioridade s         ON vue.id_senioridade = s.id_senioridade
+    ROUND((SUM(r.soma) / SUM(r.qtd))::numeric, 2) AS media_meses_aumento
+FROM tbl_rollup_aumento r
+JOIN tbl_cargo_especialidade ce ON r.id_cargo_especialidade = ce.id_cargo_especialidade
+JOIN tbl_senioridade s         ON r.id_senioridade = s.id_senioridade
 WHERE ce.ds_cargo_especialidade ILIKE '%desenvolvedor%'
   AND s.ds_senioridade IN ('Júnior', 'Pleno', 'Sênior')
-  AND a.tempo_primeiro_aumento IS NOT NULL
 GROUP BY s.ds_senioridade
 ORDER BY s.ds_senioridade;
 
@@ -732,34 +750,114 @@ SELECT 'Não Remunerado' AS categoria,
        END AS percentual
 FROM base;
 """
-def query_to_dict(conn, sql):
-    query_result = conn.query(sql)
-    query_result_data = query_result.fetchall()
-    final_result = []
-    cols = [col[0] for col in query_result.description]
-    for i in query_result_data:
-        final_result.append(dict(zip(cols, i)))
-
-    return final_result
-
+# (versão, descrição, sql) -- só acrescente no final, nunca altere uma
+# migração já publicada
+MIGRATIONS = [
+    (1, 'schema inicial', DDL),
+    (2, 'controle do refresh incremental das tabelas mv_*', REFRESH_DDL),
+    (3, 'versões de dados por tabela para o cache de resultados', DATA_VERSION_DDL),
+    (4, 'marcas dos consumidores incrementais', MARKS_DDL),
+    (5, 'rollups de salário, aumento e nota', ROLLUP_DDL),
+    (6, 'índice invertido para busca textual nos depoimentos', SEARCH_DDL),
+    (7, 'lotes do arquivo histórico em Parquet', ARCHIVE_DDL),
+    (8, 'sketches do modo aproximado (HyperLogLog e quantis)', SKETCH_DDL),
+    (9, 'métricas de execução das consultas', METRICS_DDL),
+    (10, 'rollup de nota por benefício citado', ROLLUP_BENEFICIO_DDL),
+    (11, 'vínculo resolvido de cada avaliação', LINKS_DDL),
+    (12, 'ranking bayesiano de empresas', LEADERBOARD_DDL),
+    (13, 'perfis e empresas parecidas', SIMILAR_DDL),
+    (14, 'marca dos links de benefício no rollup', MARCA_BENEFICIO_DDL),
+    (15, 'tf e tamanho das postagens da busca em INTEGER', POSTAGEM_INTEGER_DDL),
+]
+
+BATCH_SIZE = 65_536
+
+
+def query_arrow(conn, sql, params=None):
+    return conn.execute(sql, params).to_arrow_table()
+
+
+def query_numpy(conn, sql, params=None):
+    # dict coluna -> array NumPy
+    return conn.execute(sql, params).fetchnumpy()
+
+
+def query_batches(conn, sql, params=None, batch_size=BATCH_SIZE):
+    # lotes Arrow de tamanho fixo; a memória fica limitada a um lote por vez
+    reader = conn.execute(sql, params).to_arrow_reader(batch_size)
+    for batch in reader:
+        yield batch
+
+
+def iter_dicts(conn, sql, params=None, batch_size=BATCH_SIZE):
+    for batch in query_batches(conn, sql, params, batch_size):
+        yield from batch.to_pylist()
+
+
+def query_to_dict(conn, sql, params=None):
+    # formato antigo (lista de dicts), montado a partir dos lotes
+    return list(iter_dicts(conn, sql, params))
+
+
+def populate(conn, scale_factor=None):
+    conn.execute(DIMENSIONS)
+    if scale_factor is None:
+        conn.execute(POPULATE)
+        # o script traz as senhas em texto puro
+        hash_plaintext(conn, log_n=SCRYPT_LOG_N_SINTETICO)
+        # o script não traz o vínculo das avaliações
+        backfill_links(conn)
+        print("Banco de dados populado")
+    else:
+        generate(conn, scale_factor)
+        print(f"Banco de dados populado com dados sintéticos (SF={scale_factor})")
+
+
+def open_database(db_file='meu_banco.duckdb', scale_factor=None, instrumentar=False):
+    # abre o banco existente aplicando só o que falta (migrações e views
+    # alteradas); um banco novo é populado depois do DDL. O scale_factor só
+    # vale para bancos novos. Com instrumentar, a conexão devolvida registra
+    # cada comando em tbl_metrica_consulta (metrics.py).
+    conn = duckdb.connect(db_file)
 
-def create ():
-    db_file = 'meu_banco.duckdb'
+    print(f"Conectado ao arquivo DuckDB: {db_file}")
 
+    novo = current_version(conn) == 0
+    aplicadas = migrate(conn, MIGRATIONS)
+    if aplicadas:
+        print(f"Migrações aplicadas: {aplicadas}")
+
+    if novo:
+        populate(conn, scale_factor)
+
+    recriados = apply_views(conn, VIEWS)
+    if novo or any(nome.startswith('mv_') for nome in recriados):
+        init_refresh(conn)
+    # rollups, ranking e parecidas novos (migração recente) são montados
+    # aqui do zero
+    update_rollup(conn)
+    update_leaderboard(conn)
+    update_similar(conn)
+    if recriados:
+        bump_versions(conn, recriados)
+        print(f"VIEWS criadas: {', '.join(recriados)}")
+    if instrumentar:
+        return InstrumentedConnection(conn, origem='index')
+    return conn
+
+
+def build_database(db_file='meu_banco.duckdb', scale_factor=None):
+    # reconstrução completa, a partir de um arquivo vazio
     if os.path.exists(db_file):
             os.remove(db_file)
+    return open_database(db_file, scale_factor)
 
-    conn = duckdb.connect(db_file)
-
-    print(f"Conectado ao arquivo DuckDB: {db_file}")
 
-    conn.execute(DDL)
-    print("DDL executado com sucesso!")
+def create (scale_factor=None):
+    # matplotlib só carrega aqui: quem importa index não paga a importação
+    import matplotlib.pyplot as plt
 
-    conn.execute(POPULATE)
-    print("Banco de dados populado")
-    conn.execute(VIEWS)
-    print("VIEWS criadas")
+    conn = open_database('meu_banco.duckdb', scale_factor, instrumentar=True)
 
 
 
@@ -767,7 +865,7 @@ def create ():
     select * 
     from vw_media_salario_cargo_senioridade
             """
-    result = conn.query(query_ex).execute().fetchall()
+    result = conn.execute(query_ex).fetchall()
     print(result)
     plt.barh([x[0] + ' '+x[1] for x in result],[x[2] for x in result])
     plt.show()
@@ -777,7 +875,7 @@ def create ():
     select * 
     from vw_beneficios_mais_oferecidos_boas_notas
             """
-    result = conn.query(query_ex).execute().fetchall()
+    result = conn.execute(query_ex).fetchall()
     print(result)
     plt.bar([x[0]for x in result],[x[1] for x in result])
     plt.show()
@@ -787,7 +885,7 @@ def create ():
     select * 
     from vw_problemas_pj
             """
-    result = conn.query(query_ex).execute().fetchall()
+    result = conn.execute(query_ex).fetchall()
     print(result)
     plt.barh([x[0]for x in result],[x[1] for x in result])
     plt.show()
@@ -801,4 +899,10 @@ def create ():
 
 
 if __name__ == "__main__":
-    create()
+    # "python index.py report vw_x" e afins vão para a CLI; sem subcomando
+    # mantém o roteiro antigo (cria o banco e mostra os gráficos)
+    import cli
+
+    if len(sys.argv) > 1 and (sys.argv[1] in cli.COMANDOS or sys.argv[1].startswith('-')):
+        sys.exit(cli.main(sys.argv[1:]))
+    create(float(sys.argv[1]) if len(sys.argv) > 1 else None)
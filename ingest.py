@@ -0,0 +1,312 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+from cache import bump_versions
+from generate import insert_arrow, reserve_ids
+from leaderboard import update_leaderboard
+from links import resolve_links
+from rollup import update_rollup
+from search import update_index
+from similar import update_similar
+from sketches import update_sketches
+
+# Ingestão em lote de avaliações (CSV, JSONL ou Parquet) com seus
+# benefícios. Cada lote é validado inteiro, com operações vetorizadas,
+# contra as CHECKs e FKs de tbl_avaliacao antes do INSERT; as linhas
+# inválidas são devolvidas com os motivos e as válidas entram na mesma
+# transação que os links em tbl_avaliacao_beneficio.
+#
+# Os benefícios vêm na coluna "beneficios": lista de id_beneficio (JSONL,
+# Parquet) ou texto separado por ';' (CSV).
+LOTE = 500_000
+# bytes lidos por vez (cada linha tem de caber num bloco). O leitor de JSON
+# lê vários blocos adiante: com 1 MB, um arquivo de 240 MB passa com ~40 MB
+# de memória Arrow; com 64 MB, com ~500 MB
+BLOCO_CSV = 64 << 20
+BLOCO_JSON = 1 << 20
+
+COLUNAS = pa.schema([
+    ('id_usuario', pa.int32()),
+    ('id_empresa', pa.int32()),
+    ('cargo_mais_requisitado', pa.int32()),
+    ('faz_hora_extra', pa.bool_()),
+    ('hora_extra_remunerada', pa.bool_()),
+    ('tempo_primeira_promocao', pa.int32()),
+    ('percent_promocao', pa.float64()),
+    ('tempo_primeiro_aumento', pa.int32()),
+    ('percent_aumento', pa.float64()),
+    ('cod_problema_pj', pa.int32()),
+    ('cod_assedio', pa.int32()),
+    ('depoimento_geral', pa.string()),
+    ('nota_geral', pa.int32()),
+    ('dt_avaliacao', pa.timestamp('us')),
+])
+OBRIGATORIAS = ['id_usuario', 'id_empresa', 'faz_hora_extra', 'depoimento_geral', 'nota_geral']
+
+
+def _agrupar(leitor, batch_size):
+    # junta e corta os lotes do leitor em tabelas de batch_size linhas
+    pendente = []
+    linhas = 0
+    for batch in leitor:
+        pendente.append(batch)
+        linhas += batch.num_rows
+        if linhas >= batch_size:
+            tabela = pa.Table.from_batches(pendente)
+            inicio = 0
+            while linhas - inicio >= batch_size:
+                yield tabela.slice(inicio, batch_size)
+                inicio += batch_size
+            pendente = tabela.slice(inicio).to_batches()
+            linhas -= inicio
+    if linhas:
+        yield pa.Table.from_batches(pendente)
+
+
+def read_batches(path, formato=None, batch_size=LOTE, colunas=COLUNAS):
+    # colunas: schema usado para os tipos do CSV e do JSON (o das avaliações
+    # por padrão); CSV e JSON são lidos em blocos, sem carregar o arquivo
+    # inteiro
+    formato = formato or os.path.splitext(path)[1].lstrip('.').lower()
+    if formato == 'parquet':
+        yield from (pa.Table.from_batches([b]) for b in pq.ParquetFile(path).iter_batches(batch_size))
+    elif formato == 'csv':
+        tipos = {c.name: c.type for c in colunas}
+        tipos['beneficios'] = pa.string()
+        leitor = pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(block_size=BLOCO_CSV),
+            convert_options=pa_csv.ConvertOptions(column_types=tipos),
+        )
+        yield from _agrupar(leitor, batch_size)
+    elif formato in ('json', 'jsonl', 'ndjson'):
+        # um objeto por linha. Com os tipos fixos, um campo nulo (ou lista
+        # vazia) no primeiro bloco não trava o tipo dos blocos seguintes; as
+        # demais colunas têm o tipo inferido. Coluna ausente do arquivo
+        # chega nula, e a validação recusa a linha se ela for obrigatória
+        tipos = colunas.append(pa.field('beneficios', pa.list_(pa.int32())))
+        leitor = pa_json.open_json(
+            path,
+            read_options=pa_json.ReadOptions(block_size=BLOCO_JSON),
+            parse_options=pa_json.ParseOptions(explicit_schema=tipos, unexpected_field_behavior='infer'),
+        )
+        yield from _agrupar(leitor, batch_size)
+    else:
+        raise ValueError(f"Formato não suportado: {formato}")
+
+
+def _sem_nulos(listas):
+    # tira os elementos nulos das listas: campo vazio e ';' no fim ("1;")
+    # viram [] e [1], não um benefício nulo
+    valores = pc.list_flatten(listas)
+    validos = pc.is_valid(valores)
+    pais = pc.list_parent_indices(listas).filter(validos).to_numpy()
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(pais, minlength=len(listas)))]).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), valores.filter(validos))
+
+
+def normalize(tabela):
+    # coloca o lote no schema de tbl_avaliacao + beneficios (list<int32>)
+    faltando = [c for c in OBRIGATORIAS if c not in tabela.column_names]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {faltando}")
+    colunas = {}
+    for campo in COLUNAS:
+        if campo.name in tabela.column_names:
+            colunas[campo.name] = pc.cast(tabela[campo.name], campo.type)
+        else:
+            colunas[campo.name] = pa.nulls(tabela.num_rows, campo.type)
+
+    if 'beneficios' in tabela.column_names:
+        beneficios = tabela['beneficios']
+        if pa.types.is_string(beneficios.type) or pa.types.is_large_string(beneficios.type):
+            texto = pc.utf8_trim_whitespace(pc.fill_null(beneficios, ''))
+            beneficios = pc.split_pattern(texto, ';')
+            partes = [(c.offsets, pc.utf8_trim_whitespace(c.values)) for c in beneficios.chunks]
+            beneficios = pa.chunked_array([
+                pa.ListArray.from_arrays(offsets, pc.if_else(pc.equal(valores, ''), None, valores))
+                for offsets, valores in partes
+            ])
+        beneficios = pc.cast(beneficios, pa.list_(pa.int32()))
+        if isinstance(beneficios, pa.ChunkedArray):
+            beneficios = beneficios.combine_chunks()
+        colunas['beneficios'] = _sem_nulos(beneficios)
+    else:
+        colunas['beneficios'] = pa.array([[]] * tabela.num_rows, pa.list_(pa.int32()))
+    return pa.table(colunas).combine_chunks()
+
+
+def _existentes(conn, ids, table, key):
+    # ids do lote que existem na tabela (semi-join feito pelo DuckDB)
+    unicos = pa.table({'id': pc.unique(pc.drop_null(ids))})
+    conn.register('_ids_lote', unicos)
+    existentes = conn.execute(
+        f"SELECT id FROM _ids_lote WHERE id IN (SELECT {key} FROM {table})"
+    ).to_arrow_table()['id']
+    conn.unregister('_ids_lote')
+    return existentes
+
+
+def _mascara(expr):
+    # expressão booleana do Arrow -> np.bool_, NULL conta como falha
+    return np.asarray(pc.fill_null(expr, False).to_numpy(zero_copy_only=False), dtype=bool)
+
+
+def validate(conn, lote):
+    # devolve (mascara_validas, {linha: [motivos]}); as regras espelham as
+    # CHECKs e FKs de DDL
+    n = lote.num_rows
+    falhas = []
+    for coluna in OBRIGATORIAS:
+        falhas.append((f'{coluna} ausente', ~_mascara(pc.is_valid(lote[coluna]))))
+
+    nota = lote['nota_geral']
+    falhas.append(('chk_nota', ~_mascara(pc.and_(pc.greater_equal(nota, 1), pc.less_equal(nota, 5)))))
+    problema = lote['cod_problema_pj']
+    falhas.append(('chk_problema_pj', ~_mascara(pc.or_kleene(
+        pc.is_null(problema), pc.is_in(problema, pa.array([1, 2, 3, 4], pa.int32()))))))
+    assedio = lote['cod_assedio']
+    falhas.append(('chk_assedio', ~_mascara(pc.or_kleene(
+        pc.is_null(assedio), pc.is_in(assedio, pa.array([1, 2], pa.int32()))))))
+    faz = _mascara(lote['faz_hora_extra'])
+    remunerada_nula = _mascara(pc.is_null(lote['hora_extra_remunerada']))
+    falhas.append(('chk_hora_extra_remunerada', faz == remunerada_nula))
+    for coluna in ('percent_promocao', 'percent_aumento'):
+        valores = lote[coluna]
+        # o INSERT arredonda para 2 casas: 999.999 vira 1000.00 e não cabe
+        falhas.append((f'{coluna} fora de DECIMAL(5,2)', ~_mascara(pc.or_kleene(
+            pc.is_null(valores), pc.less(pc.abs(pc.round(valores, 2)), 1000)))))
+
+    for coluna, table, key in (
+        ('id_usuario', 'tbl_usuario', 'id_usuario'),
+        ('id_empresa', 'tbl_empresa', 'id_empresa'),
+        ('cargo_mais_requisitado', 'tbl_cargo_especialidade', 'id_cargo_especialidade'),
+    ):
+        valores = lote[coluna]
+        existentes = _existentes(conn, valores, table, key)
+        falhas.append((f'fk {coluna}', ~_mascara(pc.or_kleene(
+            pc.is_null(valores), pc.is_in(valores, existentes)))))
+
+    beneficios = lote['beneficios']
+    planos = pc.list_flatten(beneficios)
+    linha_beneficio = pc.list_parent_indices(beneficios).to_numpy()
+    validos = _mascara(pc.is_in(planos, _existentes(conn, planos, 'tbl_beneficio', 'id_beneficio')))
+    fk_beneficio = np.zeros(n, dtype=bool)
+    fk_beneficio[linha_beneficio[~validos]] = True
+    falhas.append(('fk id_beneficio', fk_beneficio))
+
+    invalida = np.zeros(n, dtype=bool)
+    motivos = {}
+    for motivo, mascara in falhas:
+        invalida |= mascara
+        for linha in np.flatnonzero(mascara):
+            motivos.setdefault(int(linha), []).append(motivo)
+    return ~invalida, motivos
+
+
+def ingest_table(conn, lote):
+    lote = normalize(lote)
+    validas, motivos = validate(conn, lote)
+    indices = np.flatnonzero(validas)
+    aceitas = lote.take(indices)
+    n = aceitas.num_rows
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), motivos
+
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        inicio = reserve_ids(conn, 'seq_tbl_avaliacao', n)
+        ids = np.arange(inicio, inicio + n, dtype=np.int64)
+        avaliacoes = aceitas.drop(['beneficios']).append_column('id_avaliacao', pa.array(ids, pa.int32()))
+        if avaliacoes['dt_avaliacao'].null_count:
+            agora = pa.scalar(datetime.datetime.now(), pa.timestamp('us'))
+            avaliacoes = avaliacoes.set_column(
+                avaliacoes.schema.get_field_index('dt_avaliacao'), 'dt_avaliacao',
+                pc.fill_null(avaliacoes['dt_avaliacao'], agora))
+        # vínculo de cada avaliação, resolvido para o lote inteiro (links.py);
+        # os ids são crescentes, na mesma ordem das linhas
+        conn.register('_lote_links', avaliacoes.select(['id_avaliacao', 'id_usuario', 'id_empresa', 'dt_avaliacao']))
+        try:
+            links = resolve_links(conn, '_lote_links')
+        finally:
+            conn.unregister('_lote_links')
+        avaliacoes = avaliacoes.append_column('id_vinculo', links['id_vinculo'])
+        insert_arrow(conn, 'tbl_avaliacao', avaliacoes)
+
+        # links (linha, benefício) sem repetição dentro da mesma avaliação
+        beneficios = aceitas['beneficios']
+        linha = pc.list_parent_indices(beneficios).to_numpy().astype(np.int64)
+        beneficio = pc.list_flatten(beneficios).to_numpy().astype(np.int64)
+        pares = np.unique(np.column_stack([linha, beneficio]), axis=0) if len(linha) else np.zeros((0, 2), np.int64)
+        if len(pares):
+            inicio_link = reserve_ids(conn, 'seq_tbl_avaliacao_beneficio', len(pares))
+            insert_arrow(conn, 'tbl_avaliacao_beneficio', pa.table({
+                'id_avaliacao_beneficio': pa.array(np.arange(inicio_link, inicio_link + len(pares)), pa.int32()),
+                'id_avaliacao': pa.array(ids[pares[:, 0]], pa.int32()),
+                'id_beneficio': pa.array(pares[:, 1], pa.int32()),
+            }))
+        bump_versions(conn, ['tbl_avaliacao', 'tbl_avaliacao_beneficio'])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return ids, motivos
+
+
+def ingest_file(conn, path, formato=None, batch_size=LOTE):
+    # cada lote tem sua própria transação; as linhas rejeitadas são
+    # numeradas em relação ao arquivo
+    inseridas = 0
+    rejeitadas = []
+    deslocamento = 0
+    for lote in read_batches(path, formato, batch_size):
+        ids, motivos = ingest_table(conn, lote)
+        inseridas += len(ids)
+        rejeitadas.extend(
+            {'linha': deslocamento + linha, 'motivos': m} for linha, m in sorted(motivos.items())
+        )
+        deslocamento += lote.num_rows
+    if inseridas:
+        update_rollup(conn)
+        update_leaderboard(conn)
+        update_similar(conn)
+        # só se o índice de busca / os sketches já foram construídos
+        update_index(conn)
+        update_sketches(conn)
+    return {'lidas': deslocamento, 'inseridas': inseridas, 'rejeitadas': rejeitadas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestão em lote de avaliações")
+    parser.add_argument('arquivo')
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--formato', choices=['csv', 'jsonl', 'parquet'])
+    parser.add_argument('--lote', type=int, default=LOTE)
+    parser.add_argument('--rejeitadas', help="grava as linhas rejeitadas em JSONL")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    resultado = ingest_file(conn, args.arquivo, args.formato, args.lote)
+    conn.close()
+    print(f"Lidas: {resultado['lidas']}, inseridas: {resultado['inseridas']}, "
+          f"rejeitadas: {len(resultado['rejeitadas'])}")
+    if args.rejeitadas:
+        with open(args.rejeitadas, 'w') as arquivo:
+            for linha in resultado['rejeitadas']:
+                arquivo.write(json.dumps(linha, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
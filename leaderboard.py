@@ -0,0 +1,327 @@
+import argparse
+import sys
+
+import duckdb
+
+from cache import bump_versions
+from refresh import changed_companies, current_marks, read_marks, save_marks
+
+# Ranking de empresas pela nota, com média bayesiana.
+#
+# A média simples põe uma empresa com uma avaliação 5 acima de outra com
+# milhares de 4,8. O score aqui puxa a média de cada empresa para a média
+# global, com o peso de `peso` avaliações fictícias:
+#
+#     score = (peso * media_global + soma) / (peso + qtd)
+#
+# tbl_placar_nota guarda as estatísticas suficientes (qtd e soma das notas)
+# por empresa e cargo do vínculo da avaliação (0 = avaliação sem vínculo).
+# tbl_placar guarda, já em ordem, as PROFUNDIDADE primeiras empresas de
+# cada escopo: geral, por estado da empresa e por cargo. O top k é a leitura
+# de k linhas pela chave (escopo, chave, posicao).
+#
+# update_leaderboard() é um consumidor incremental como os rollups: as
+# avaliações novas somam nas estatísticas, as alteradas (log) fazem
+# recalcular a empresa, e só as empresas tocadas têm o score refeito. Os
+# escopos onde elas aparecem são mesclados com o que já estava guardado;
+# um escopo só é refeito inteiro se uma empresa que estava na lista cheia
+# caiu (quem estava fora da lista pode ter passado a frente dela).
+#
+# A média global e o peso ficam congelados em tbl_placar_prior: com eles
+# fixos, o score de uma empresa não tocada não muda. Quando a média global
+# se afasta mais que TOLERANCIA da congelada, tudo é reclassificado.
+CONSUMIDOR = 'placar'
+ORIGENS = ['tbl_avaliacao', 'tbl_vinculo_usuario_empresa', 'tbl_empresa']
+PROFUNDIDADE = 200
+TOLERANCIA = 0.01
+ESCOPOS = ('geral', 'estado', 'cargo')
+
+LEADERBOARD_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_placar_nota (
+    id_empresa INTEGER NOT NULL,
+    id_cargo_especialidade INTEGER NOT NULL,
+    qtd BIGINT NOT NULL,
+    soma BIGINT NOT NULL,
+    PRIMARY KEY (id_empresa, id_cargo_especialidade)
+);
+
+CREATE TABLE IF NOT EXISTS tbl_placar_prior (
+    id_prior INTEGER PRIMARY KEY,
+    media DOUBLE NOT NULL,
+    peso DOUBLE NOT NULL,
+    dt_calculo TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tbl_placar (
+    escopo VARCHAR(10) NOT NULL,
+    chave VARCHAR(20) NOT NULL,
+    posicao INTEGER NOT NULL,
+    id_empresa INTEGER NOT NULL,
+    qtd BIGINT NOT NULL,
+    media DOUBLE NOT NULL,
+    score DOUBLE NOT NULL,
+    PRIMARY KEY (escopo, chave, posicao)
+);
+"""
+
+# qtd e soma por escopo; {empresas} filtra n.id_empresa
+_POR_ESCOPO = r"""
+SELECT 'geral' AS escopo, '' AS chave, n.id_empresa, sum(n.qtd) AS qtd, sum(n.soma) AS soma
+  FROM tbl_placar_nota n
+ WHERE {empresas}
+ GROUP BY n.id_empresa
+UNION ALL
+SELECT 'estado', e.estado_empresa, n.id_empresa, sum(n.qtd), sum(n.soma)
+  FROM tbl_placar_nota n
+  JOIN tbl_empresa e ON e.id_empresa = n.id_empresa
+ WHERE {empresas}
+ GROUP BY n.id_empresa, e.estado_empresa
+UNION ALL
+SELECT 'cargo', CAST(n.id_cargo_especialidade AS VARCHAR), n.id_empresa, n.qtd, n.soma
+  FROM tbl_placar_nota n
+ WHERE n.id_cargo_especialidade <> 0 AND {empresas}
+"""
+
+ORDEM = "score DESC, qtd DESC, id_empresa"
+
+
+def _escores(media, peso, empresas='TRUE'):
+    # literais DOUBLE: escritos com ponto seriam DECIMAL
+    peso, media = f"{float(peso)!r}::DOUBLE", f"{float(media)!r}::DOUBLE"
+    return f"""
+        SELECT escopo, chave, id_empresa, qtd,
+               soma / qtd AS media,
+               ({peso} * {media} + soma) / ({peso} + qtd) AS score
+          FROM ({_POR_ESCOPO.format(empresas=empresas)})
+    """
+
+
+def _somar(conn, filtro):
+    # upsert aditivo das avaliações do filtro (alias a)
+    conn.execute(f"""
+        INSERT INTO tbl_placar_nota
+        SELECT a.id_empresa, coalesce(v.id_cargo_especialidade, 0), count(*), sum(a.nota_geral)
+          FROM tbl_avaliacao a
+          LEFT JOIN tbl_vinculo_usuario_empresa v ON v.id_vinculo = a.id_vinculo
+         WHERE {filtro}
+         GROUP BY ALL
+        ON CONFLICT (id_empresa, id_cargo_especialidade) DO UPDATE
+           SET qtd = tbl_placar_nota.qtd + EXCLUDED.qtd,
+               soma = tbl_placar_nota.soma + EXCLUDED.soma
+    """)
+
+
+def _recalcular(conn, empresas=None):
+    # empresas: tabela temporária com a coluna id; None recalcula tudo
+    if empresas is None:
+        conn.execute("DELETE FROM tbl_placar_nota")
+        _somar(conn, 'TRUE')
+        return
+    conn.execute(f"DELETE FROM tbl_placar_nota WHERE id_empresa IN (SELECT id FROM {empresas})")
+    _somar(conn, f"a.id_empresa IN (SELECT id FROM {empresas})")
+
+
+def _prior(conn):
+    linha = conn.execute("SELECT media, peso FROM tbl_placar_prior WHERE id_prior = 1").fetchone()
+    return linha if linha is not None else (None, None)
+
+
+def _media_global(conn):
+    return conn.execute("SELECT sum(soma) / sum(qtd) FROM tbl_placar_nota").fetchone()[0]
+
+
+def _inserir(conn, candidatos):
+    # candidatos: consulta com escopo, chave, id_empresa, qtd, media, score
+    conn.execute(f"""
+        INSERT INTO tbl_placar
+        SELECT escopo, chave, posicao, id_empresa, qtd, media, score
+          FROM (SELECT *, row_number() OVER (PARTITION BY escopo, chave ORDER BY {ORDEM}) AS posicao
+                  FROM ({candidatos}))
+         WHERE posicao <= {PROFUNDIDADE}
+         ORDER BY escopo, chave, posicao
+    """)
+
+
+def _classificar_tudo(conn, peso=None):
+    # congela média global e peso (padrão: mediana de avaliações por
+    # empresa) e refaz todos os escopos
+    media = _media_global(conn)
+    conn.execute("DELETE FROM tbl_placar")
+    conn.execute("DELETE FROM tbl_placar_prior")
+    if media is None:
+        return
+    if peso is None:
+        peso = conn.execute("""
+            SELECT greatest(coalesce(median(qtd), 1), 1)
+              FROM (SELECT sum(qtd) AS qtd FROM tbl_placar_nota GROUP BY id_empresa)
+        """).fetchone()[0]
+    media, peso = float(media), float(peso)
+    conn.execute("INSERT INTO tbl_placar_prior (id_prior, media, peso) VALUES (1, ?, ?)", [media, peso])
+    _inserir(conn, _escores(media, peso))
+
+
+def _mesclar(conn, media, peso, tocadas):
+    # refaz os escopos das empresas tocadas (tabela temporária, coluna id)
+    dentro = f"id_empresa IN (SELECT id FROM {tocadas})"
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _placar_novos AS
+        {_escores(media, peso, f'n.{dentro}')}
+    """)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _placar_escopos AS
+        SELECT DISTINCT escopo, chave FROM _placar_novos
+        UNION
+        SELECT DISTINCT escopo, chave FROM tbl_placar WHERE {dentro}
+    """)
+    # lista cheia em que uma empresa tocada saiu do escopo ou caiu: quem
+    # estava fora pode ter passado a frente, o escopo é refeito inteiro
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _placar_refazer AS
+        SELECT DISTINCT o.escopo, o.chave
+          FROM tbl_placar o
+          LEFT JOIN _placar_novos n
+            ON n.escopo = o.escopo AND n.chave = o.chave AND n.id_empresa = o.id_empresa
+         WHERE o.{dentro}
+           AND (n.id_empresa IS NULL OR n.score < o.score OR (n.score = o.score AND n.qtd < o.qtd))
+           AND (SELECT count(*) FROM tbl_placar c
+                 WHERE c.escopo = o.escopo AND c.chave = o.chave) >= {PROFUNDIDADE}
+    """)
+    refeitos = conn.execute("SELECT count(*) FROM _placar_refazer").fetchone()[0]
+    no_escopo = "EXISTS (SELECT 1 FROM {t} s WHERE s.escopo = x.escopo AND s.chave = x.chave)"
+    mesclar = f"{no_escopo.format(t='_placar_escopos')} AND NOT {no_escopo.format(t='_placar_refazer')}"
+    candidatos = f"""
+        SELECT escopo, chave, id_empresa, qtd, media, score FROM tbl_placar x
+         WHERE {mesclar} AND NOT x.{dentro}
+        UNION ALL
+        SELECT escopo, chave, id_empresa, qtd, media, score FROM _placar_novos x
+         WHERE {mesclar}
+    """
+    if refeitos:
+        # só aqui os escores de todas as empresas são calculados
+        candidatos += f"""
+            UNION ALL
+            SELECT escopo, chave, id_empresa, qtd, media, score FROM ({_escores(media, peso)}) x
+             WHERE {no_escopo.format(t='_placar_refazer')}
+        """
+    conn.execute(f"CREATE OR REPLACE TEMP TABLE _placar_candidatos AS {candidatos}")
+    conn.execute(f"DELETE FROM tbl_placar x WHERE {no_escopo.format(t='_placar_escopos')}")
+    _inserir(conn, "SELECT * FROM _placar_candidatos")
+    for tabela in ('_placar_novos', '_placar_escopos', '_placar_refazer', '_placar_candidatos'):
+        conn.execute(f"DROP TABLE {tabela}")
+    return refeitos
+
+
+def update_leaderboard(conn):
+    # devolve o número de avaliações/registros consumidos (novos + alterados)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        marcas = read_marks(conn, CONSUMIDOR, ORIGENS)
+        novas = {
+            table: (max(ultimo_id, marcas[table][0]), ultimo_log)
+            for table, (ultimo_id, ultimo_log) in current_marks(conn, ORIGENS).items()
+        }
+        id_avaliacao = marcas['tbl_avaliacao'][0]
+
+        alterados, sumidos = changed_companies(conn, marcas, '_placar_tocadas')
+        inseridos = novas['tbl_avaliacao'][0] - id_avaliacao
+        # vínculos e empresas novos não mudam nota nenhuma sozinhos; as
+        # avaliações deles chegam como avaliações novas
+        if sumidos:
+            _recalcular(conn)
+        else:
+            if alterados:
+                _recalcular(conn, '_placar_tocadas')
+            if inseridos:
+                _somar(conn, f"a.id_avaliacao > {id_avaliacao} AND a.id_empresa NOT IN (SELECT id FROM _placar_tocadas)")
+                conn.execute(f"""
+                    INSERT INTO _placar_tocadas
+                    SELECT DISTINCT id_empresa FROM tbl_avaliacao WHERE id_avaliacao > {id_avaliacao}
+                    EXCEPT SELECT id FROM _placar_tocadas
+                """)
+
+        if alterados or inseridos:
+            media, peso = _prior(conn)
+            atual = _media_global(conn)
+            if sumidos or media is None or atual is None or abs(atual - media) > TOLERANCIA:
+                _classificar_tudo(conn, peso)
+            else:
+                _mesclar(conn, media, peso, '_placar_tocadas')
+            bump_versions(conn, ['tbl_placar'])
+        save_marks(conn, CONSUMIDOR, novas)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    conn.execute("DROP TABLE IF EXISTS _placar_tocadas")
+    return alterados + inseridos
+
+
+def rebuild_leaderboard(conn, peso=None):
+    # recálculo completo; peso=None usa a mediana de avaliações por empresa
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        _recalcular(conn)
+        _classificar_tudo(conn, peso)
+        bump_versions(conn, ['tbl_placar'])
+        save_marks(conn, CONSUMIDOR, current_marks(conn, ORIGENS))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def top_companies(conn, k=100, escopo='geral', chave=''):
+    # as k primeiras do escopo (chave: sigla do estado ou id do cargo), como
+    # lista de dicts; acima de PROFUNDIDADE calcula a partir das estatísticas
+    if escopo not in ESCOPOS:
+        raise ValueError(f"Escopo inválido: {escopo} (use {', '.join(ESCOPOS)})")
+    k, chave = int(k), str(chave)
+    if k <= PROFUNDIDADE:
+        origem = "tbl_placar p"
+    else:
+        media, peso = _prior(conn)
+        if media is None:
+            return []
+        origem = f"""(SELECT *, row_number() OVER (PARTITION BY escopo, chave ORDER BY {ORDEM}) AS posicao
+                        FROM ({_escores(media, peso)})) p"""
+    cursor = conn.execute(f"""
+        SELECT p.posicao, p.id_empresa, e.nm_fantasia_empresa, e.estado_empresa,
+               p.qtd, round(p.media, 2) AS media, round(p.score, 3) AS score
+          FROM {origem}
+          JOIN tbl_empresa e ON e.id_empresa = p.id_empresa
+         WHERE p.escopo = ? AND p.chave = ? AND p.posicao <= ?
+         ORDER BY p.posicao
+    """, [escopo, chave, k])
+    colunas = [d[0] for d in cursor.description]
+    return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ranking bayesiano de empresas pela nota")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--escopo', choices=ESCOPOS, default='geral')
+    parser.add_argument('--chave', default='', help="sigla do estado ou id do cargo")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--completo', action='store_true', help="recalcula tudo antes de ler")
+    parser.add_argument('--peso', type=float, help="avaliações fictícias na média global (com --completo)")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    if args.completo:
+        rebuild_leaderboard(conn, args.peso)
+    else:
+        update_leaderboard(conn)
+    media, peso = _prior(conn)
+    linhas = top_companies(conn, args.k, args.escopo, args.chave)
+    conn.close()
+    if media is not None:
+        print(f"Média global {media:.3f}, peso {peso:g}")
+    for linha in linhas:
+        print(f"{linha['posicao']:>4}  {linha['nm_fantasia_empresa']} ({linha['estado_empresa']})  "
+              f"score {linha['score']}  média {linha['media']}  avaliações {linha['qtd']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
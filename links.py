@@ -0,0 +1,118 @@
+import argparse
+import sys
+
+import duckdb
+
+from refresh import log_changes
+from rollup import CONSUMIDOR as CONSUMIDOR_ROLLUP, ROLLUPS
+
+# Vínculo de cada avaliação (tbl_avaliacao.id_vinculo).
+#
+# A avaliação não dizia a qual vínculo se refere, e as views juntavam por
+# (id_usuario, id_empresa): com dois vínculos na mesma empresa a avaliação
+# contava duas vezes. O vínculo resolvido é o mais recente da mesma
+# empresa iniciado até a data da avaliação (ASOF JOIN); avaliação anterior
+# a todos fica com o primeiro vínculo. Sem vínculo na empresa, fica NULL.
+#
+# A resolução é feita em bloco: na ingestão, para o lote inteiro antes do
+# INSERT; na migração, para as avaliações existentes; e em
+# backfill_links(), para as que continuam NULL (inseridas sem passar pela
+# ingestão, ou cujo vínculo foi cadastrado depois). O vínculo fica gravado:
+# um vínculo novo não muda o de avaliações já ligadas.
+
+# {origem} tem id_avaliacao, id_usuario, id_empresa e dt_avaliacao
+LINK_SQL = r"""
+SELECT a.id_avaliacao,
+       coalesce(anterior.id_vinculo, primeiro.id_vinculo) AS id_vinculo
+  FROM {origem} a
+  ASOF LEFT JOIN tbl_vinculo_usuario_empresa anterior
+    ON a.id_usuario = anterior.id_usuario
+   AND a.id_empresa = anterior.id_empresa
+   AND a.dt_avaliacao >= anterior.dt_inicio_vinculo
+  LEFT JOIN (
+      SELECT id_usuario, id_empresa, arg_min(id_vinculo, dt_inicio_vinculo) AS id_vinculo
+        FROM tbl_vinculo_usuario_empresa
+       GROUP BY id_usuario, id_empresa
+  ) primeiro
+    ON a.id_usuario = primeiro.id_usuario
+   AND a.id_empresa = primeiro.id_empresa
+ WHERE {filtro}
+"""
+
+# a junção de tbl_rollup_aumento passa a ser pelo vínculo: os rollups são
+# zerados junto com as marcas e remontados do zero no próximo update_rollup
+LINKS_DDL = f"""
+ALTER TABLE tbl_avaliacao ADD COLUMN id_vinculo INTEGER;
+
+UPDATE tbl_avaliacao
+   SET id_vinculo = l.id_vinculo
+  FROM ({LINK_SQL.format(origem='tbl_avaliacao', filtro='TRUE')}) l
+ WHERE tbl_avaliacao.id_avaliacao = l.id_avaliacao;
+
+{''.join(f'DELETE FROM {nome};' for nome in ROLLUPS)}
+DELETE FROM tbl_marca_incremental WHERE nm_consumidor = '{CONSUMIDOR_ROLLUP}';
+"""
+
+LOTE = 500_000
+
+
+def resolve_links(conn, origem, filtro='TRUE'):
+    # tabela Arrow (id_avaliacao, id_vinculo) em ordem de id_avaliacao
+    return conn.execute(
+        f"{LINK_SQL.format(origem=origem, filtro=filtro)} ORDER BY a.id_avaliacao"
+    ).to_arrow_table()
+
+
+def backfill_links(conn, lote=LOTE):
+    # liga as avaliações ainda sem vínculo, em faixas de id; as alteradas
+    # vão para o log, para rollups e mv_* recalcularem as empresas afetadas
+    faixa = conn.execute(
+        "SELECT min(id_avaliacao), max(id_avaliacao) FROM tbl_avaliacao WHERE id_vinculo IS NULL"
+    ).fetchone()
+    if faixa[0] is None:
+        return 0
+    ligadas = 0
+    for inicio in range(faixa[0], faixa[1] + 1, lote):
+        filtro = f"a.id_vinculo IS NULL AND a.id_avaliacao BETWEEN {inicio} AND {inicio + lote - 1}"
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            # sem RETURNING: com ele o UPDATE vira DELETE + INSERT, barrado
+            # pela FK de tbl_avaliacao_beneficio
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _links AS
+                SELECT * FROM ({LINK_SQL.format(origem='tbl_avaliacao', filtro=filtro)})
+                 WHERE id_vinculo IS NOT NULL
+            """)
+            conn.execute("""
+                UPDATE tbl_avaliacao
+                   SET id_vinculo = l.id_vinculo
+                  FROM _links l
+                 WHERE tbl_avaliacao.id_avaliacao = l.id_avaliacao
+            """)
+            ids = [r[0] for r in conn.execute("SELECT id_avaliacao FROM _links").fetchall()]
+            log_changes(conn, 'tbl_avaliacao', ids)
+            conn.execute("DROP TABLE _links")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        ligadas += len(ids)
+    return ligadas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Liga as avaliações sem vínculo ao vínculo resolvido")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--lote', type=int, default=LOTE, help="faixa de ids por transação")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    ligadas = backfill_links(conn, args.lote)
+    sem_vinculo = conn.execute("SELECT count(*) FROM tbl_avaliacao WHERE id_vinculo IS NULL").fetchone()[0]
+    conn.close()
+    print(f"Avaliações ligadas: {ligadas}; ainda sem vínculo: {sem_vinculo}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import argparse
+import sys
+import threading
+
+import duckdb
+
+# Consultas pontuais das páginas de produto: o perfil de uma empresa e o
+# histórico ("minhas avaliações") de um usuário.
+#
+# Cada consulta de STATEMENTS é preparada uma vez por cursor (PREPARE) e
+# depois só executada (EXECUTE nome(id)), sem novo parse nem bind. Os ids
+# são convertidos com int() antes de entrar no EXECUTE, então nada além de
+# um inteiro chega ao SQL.
+#
+# Nenhuma consulta varre tabela inteira: o perfil da empresa lê os rollups
+# (nota por mês, benefício e regime já somados por empresa), gravados em
+# ordem de empresa, e mv_empresa_resumo_avaliacao, gravada em ordem de
+# (empresa, data); com isso os zonemaps pulam os blocos das outras
+# empresas. Cadastro de empresa e usuário sai pela chave primária.
+RECENTES = 10
+
+STATEMENTS = {
+    'empresa': """
+        SELECT id_empresa, nm_fantasia_empresa, cidade_empresa, estado_empresa, dt_cadastro_empresa
+          FROM tbl_empresa
+         WHERE id_empresa = $1
+    """,
+    'empresa_nota': """
+        SELECT sum(qtd) AS qtd_avaliacoes,
+               round(sum(soma) / sum(qtd), 2) AS media_nota,
+               min(minimo) AS nota_minima,
+               max(maximo) AS nota_maxima
+          FROM tbl_rollup_nota
+         WHERE id_empresa = $1
+    """,
+    'empresa_beneficios': """
+        SELECT b.ds_beneficio, r.qtd, round(r.soma / r.qtd, 2) AS media_nota
+          FROM tbl_rollup_beneficio r
+          JOIN tbl_beneficio b ON b.id_beneficio = r.id_beneficio
+         WHERE r.id_empresa = $1
+         ORDER BY r.qtd DESC, b.ds_beneficio
+    """,
+    # mesma contagem que vw_distribuicao_clt_pj, para uma empresa só
+    'empresa_clt_pj': """
+        SELECT coalesce(sum(qtd) FILTER (WHERE cod_regime_contratacao = 1), 0) AS total_clt,
+               coalesce(sum(qtd) FILTER (WHERE cod_regime_contratacao = 2), 0) AS total_pj
+          FROM tbl_rollup_vinculo
+         WHERE id_empresa = $1
+    """,
+    'empresa_recentes': """
+        SELECT id_avaliacao, usuario, nota_geral, depoimento_geral, dt_avaliacao
+          FROM mv_empresa_resumo_avaliacao
+         WHERE id_empresa = $1
+         ORDER BY dt_avaliacao DESC, id_avaliacao DESC
+         LIMIT $2
+    """,
+    # listas pré-calculadas por similar.py, lidas pela chave primária
+    'empresa_similares': """
+        SELECT s.posicao, s.id_similar, e.nm_fantasia_empresa, round(s.similaridade, 4) AS similaridade
+          FROM tbl_empresa_similar s
+          JOIN tbl_empresa e ON e.id_empresa = s.id_similar
+         WHERE s.id_empresa = $1
+         ORDER BY s.posicao
+    """,
+    'usuario': """
+        SELECT id_usuario, nm_usuario, dt_criacao
+          FROM tbl_usuario
+         WHERE id_usuario = $1
+    """,
+    'usuario_vinculos': """
+        SELECT v.id_vinculo, e.nm_fantasia_empresa, ce.ds_cargo_especialidade, s.ds_senioridade,
+               v.salario_vinculo, v.cod_regime_contratacao, v.dt_inicio_vinculo, v.emprego_atual
+          FROM tbl_vinculo_usuario_empresa v
+          JOIN tbl_empresa e ON e.id_empresa = v.id_empresa
+          JOIN tbl_cargo_especialidade ce ON ce.id_cargo_especialidade = v.id_cargo_especialidade
+          JOIN tbl_senioridade s ON s.id_senioridade = v.id_senioridade
+         WHERE v.id_usuario = $1
+         ORDER BY v.dt_inicio_vinculo DESC
+    """,
+    # a mv já traz o nome da empresa: sem junção, que custa mais que o filtro
+    'usuario_avaliacoes': """
+        SELECT id_avaliacao, nm_fantasia_empresa, nota_geral, depoimento_geral, dt_avaliacao
+          FROM mv_empresa_resumo_avaliacao
+         WHERE id_usuario = $1
+         ORDER BY dt_avaliacao DESC
+    """,
+}
+
+
+class LookupService:
+    def __init__(self, conn, recentes=RECENTES, preparar=True):
+        # conn é compartilhada; cada thread usa o próprio cursor, com as
+        # próprias consultas preparadas (PREPARE vale por conexão).
+        # preparar=False executa o SQL com parâmetros a cada chamada (só
+        # para comparação em benchmark.py lookup)
+        self.conn = conn
+        self.recentes = int(recentes)
+        self.preparar = preparar
+        self._local = threading.local()
+        self._cursores = []
+        self._lock = threading.Lock()
+
+    def _cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self._local.cursor = cursor
+            self._local.preparadas = set()
+            with self._lock:
+                self._cursores.append(cursor)
+        return cursor
+
+    def execute(self, nome, *params):
+        # lista de dicts; nome precisa estar em STATEMENTS
+        if nome not in STATEMENTS:
+            raise ValueError(f"Consulta desconhecida: {nome}")
+        cursor = self._cursor()
+        params = [int(p) for p in params]
+        if not self.preparar:
+            cursor.execute(STATEMENTS[nome], params)
+        else:
+            preparadas = self._local.preparadas
+            if nome not in preparadas:
+                cursor.execute(f"PREPARE {nome} AS {STATEMENTS[nome]}")
+                preparadas.add(nome)
+            cursor.execute(f"EXECUTE {nome}({', '.join(map(str, params))})")
+        colunas = [d[0] for d in cursor.description]
+        return [dict(zip(colunas, linha)) for linha in cursor.fetchall()]
+
+    def company_profile(self, id_empresa):
+        # None se a empresa não existe
+        empresa = self.execute('empresa', id_empresa)
+        if not empresa:
+            return None
+        return {
+            'empresa': empresa[0],
+            'nota': self.execute('empresa_nota', id_empresa)[0],
+            'beneficios': self.execute('empresa_beneficios', id_empresa),
+            'clt_pj': self.execute('empresa_clt_pj', id_empresa)[0],
+            'recentes': self.execute('empresa_recentes', id_empresa, self.recentes),
+            'similares': self.execute('empresa_similares', id_empresa),
+        }
+
+    def user_history(self, id_usuario):
+        usuario = self.execute('usuario', id_usuario)
+        if not usuario:
+            return None
+        return {
+            'usuario': usuario[0],
+            'vinculos': self.execute('usuario_vinculos', id_usuario),
+            'avaliacoes': self.execute('usuario_avaliacoes', id_usuario),
+        }
+
+    def close(self):
+        with self._lock:
+            for cursor in self._cursores:
+                cursor.close()
+            self._cursores = []
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfil de empresa e histórico de usuário")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--empresa', type=int)
+    grupo.add_argument('--usuario', type=int)
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db, read_only=True)
+    with LookupService(conn) as lookups:
+        if args.empresa is not None:
+            resultado = lookups.company_profile(args.empresa)
+        else:
+            resultado = lookups.user_history(args.usuario)
+    conn.close()
+    if resultado is None:
+        print("Não encontrado")
+        return 1
+    for secao, valor in resultado.items():
+        print(f"{secao}:")
+        for linha in valor if isinstance(valor, list) else [valor]:
+            print(f"  {linha}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import argparse
+import re
+import sys
+
+import duckdb
+
+from archive import compact
+
+# Manutenção física do banco: ordem de gravação das tabelas.
+#
+# O DuckDB guarda mínimo e máximo de cada coluna por row group (zonemaps);
+# um filtro pula os row groups cujo intervalo não o admite. Em ordem de
+# inserção os intervalos cobrem quase tudo e nada é pulado. reorder()
+# regrava as tabelas de CLUSTER ordenadas pelas chaves dominantes dos
+# filtros e junções (reescreve o arquivo com archive.compact, então nenhuma
+# outra conexão pode estar aberta). As mv_* e os rollups já nascem
+# ordenados, mas o refresh incremental e os upserts acrescentam linhas no
+# fim; a manutenção periódica os reordena também. As mv_* (sem restrições,
+# criadas por CREATE TABLE AS) são reordenadas pelo próprio refresh com
+# resort_if_scattered(), sem trocar o arquivo: quando os row groups
+# acrescentados cobrem faixas largas da primeira chave de CLUSTER e uma
+# busca por igualdade passa a ler mais de ESPALHAMENTO dos row groups além
+# do seu, a tabela é regravada em ordem.
+#
+# Não há índices secundários: as buscas pontuais (lookup.py) saem pela
+# chave primária ou pelos zonemaps das tabelas ordenadas. Medido com SF=60,
+# um índice ART em tbl_vinculo_usuario_empresa(id_usuario) deixou a busca
+# dos vínculos de um usuário mais lenta (0,67 -> 0,93 ms), e índices em
+# tbl_avaliacao(id_usuario/id_vinculo) ganham décimos de ms em consultas
+# que nenhuma página faz, pagando em toda inserção.
+
+# tabela -> ORDER BY da regravação. tbl_avaliacao: cod_problema_pj
+# (vw_empresas_clt_mascarado_pj, vw_problemas_pj), depois empresa e usuário
+# (junção com os vínculos). Filtros IS NOT NULL, como o de
+# vw_tempo_medio_promocao_senioridade, não usam os zonemaps no DuckDB;
+# agrupar os nulos não poda nada.
+CLUSTER = {
+    'tbl_avaliacao': "cod_problema_pj, id_empresa, id_usuario",
+    'tbl_vinculo_usuario_empresa': "emprego_atual, id_usuario, id_empresa",
+    'tbl_avaliacao_beneficio': "id_avaliacao, id_beneficio",
+    'mv_empresa_resumo_avaliacao': "id_empresa, dt_avaliacao DESC",
+    'mv_usuario_empresa_atual': "id_empresa, id_usuario",
+    'tbl_rollup_vinculo': "id_empresa, id_cargo_especialidade, id_senioridade, cod_regime_contratacao, mes",
+    'tbl_rollup_aumento': "id_empresa, id_cargo_especialidade, id_senioridade, cod_regime_contratacao, mes",
+    'tbl_rollup_nota': "id_empresa, mes",
+    'tbl_rollup_beneficio': "id_empresa, id_beneficio",
+    'tbl_placar': "escopo, chave, posicao",
+    'tbl_empresa_similar': "id_empresa, posicao",
+}
+
+# filtros de exemplo para conferir a poda: (tabela, coluna, valor)
+FILTROS = [
+    ('tbl_avaliacao', 'cod_problema_pj', 2),
+    ('tbl_avaliacao', 'id_empresa', 1),
+    ('mv_empresa_resumo_avaliacao', 'id_empresa', 1),
+]
+
+ESPALHAMENTO = 0.25
+
+RE_STATS = re.compile(r'\[Min: (.*?), Max: (.*?)\]\[Has Null: (\w+), Has No Null: (\w+)\]')
+
+
+def reorder(db_file, ordem=CLUSTER):
+    # devolve (tamanho antes, tamanho depois) em bytes
+    return compact(db_file, ordem)
+
+
+def zonemap_skips(conn, tabela, coluna, valor):
+    # (row groups, row groups que os zonemaps pulam) para "coluna = valor"
+    # numa coluna numérica; lido de pragma_storage_info
+    grupos = conn.execute(f"""
+        SELECT row_group_id, stats FROM pragma_storage_info('{tabela}')
+         WHERE column_name = ? AND segment_type <> 'VALIDITY'
+    """, [coluna]).fetchall()
+    por_grupo = {}
+    for grupo, stats in grupos:
+        achado = RE_STATS.search(stats)
+        if achado is None:
+            # sem estatística o row group é sempre lido
+            por_grupo[grupo] = True
+            continue
+        minimo, maximo, _, tem_valor = achado.groups()
+        admite = tem_valor == 'true' and float(minimo) <= valor <= float(maximo)
+        por_grupo[grupo] = por_grupo.get(grupo, False) or admite
+    return len(por_grupo), sum(1 for admite in por_grupo.values() if not admite)
+
+
+def lookup_row_groups(conn, tabela, coluna):
+    # (row groups, row groups lidos em média por "coluna = valor"), pelos
+    # intervalos dos zonemaps de uma coluna numérica; valores fora de todos
+    # os intervalos não contam
+    faixas = {}
+    for grupo, stats in conn.execute(f"""
+        SELECT row_group_id, stats FROM pragma_storage_info('{tabela}')
+         WHERE column_name = ? AND segment_type <> 'VALIDITY'
+    """, [coluna]).fetchall():
+        achado = RE_STATS.search(stats)
+        if achado is None or achado.group(4) != 'true':
+            continue
+        minimo, maximo = float(achado.group(1)), float(achado.group(2))
+        antes = faixas.get(grupo, (minimo, maximo))
+        faixas[grupo] = (min(antes[0], minimo), max(antes[1], maximo))
+    if not faixas:
+        return 0, 0.0
+    menor = min(f[0] for f in faixas.values())
+    maior = max(f[1] for f in faixas.values())
+    lidos = sum(f[1] - f[0] + 1 for f in faixas.values()) / (maior - menor + 1)
+    return len(faixas), lidos
+
+
+def resort_if_scattered(conn, tabela, ordem=CLUSTER, limite=ESPALHAMENTO):
+    # regrava a tabela na ordem de CLUSTER se uma busca pela primeira chave
+    # lê mais que limite dos row groups além do seu; só para tabelas sem
+    # restrições (mv_*), que CREATE OR REPLACE TABLE AS recria iguais
+    grupos, lidos = lookup_row_groups(conn, tabela, ordem[tabela].split(',')[0].split()[0])
+    if lidos - 1 <= limite * grupos:
+        return False
+    conn.execute(f"CREATE OR REPLACE TABLE {tabela} AS SELECT * FROM {tabela} ORDER BY {ordem[tabela]}")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reordena as tabelas pelas chaves de CLUSTER")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--sem-reordenar', action='store_true', help="só mostra os row groups pulados")
+    args = parser.parse_args(argv)
+
+    if not args.sem_reordenar:
+        antes, depois = reorder(args.db)
+        print(f"Tabelas reordenadas: {', '.join(CLUSTER)} "
+              f"({antes / 2**20:.1f} MB -> {depois / 2**20:.1f} MB)")
+
+    conn = duckdb.connect(args.db, read_only=True)
+    for tabela, coluna, valor in FILTROS:
+        total, pulados = zonemap_skips(conn, tabela, coluna, valor)
+        print(f"{tabela}.{coluna} = {valor}: {pulados} de {total} row groups pulados")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
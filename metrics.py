@@ -0,0 +1,329 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+
+import duckdb
+import pyarrow as pa
+
+from generate import insert_arrow
+
+# Instrumentação das consultas.
+#
+# InstrumentedConnection embrulha uma conexão DuckDB e registra cada
+# comando: fingerprint do SQL (literais trocados por ?), tempo de parede
+# (execução + leitura do resultado) e linhas devolvidas. Os registros ficam
+# num buffer e vão em lotes para tbl_metrica_consulta ou, em conexões só de
+# leitura, para um arquivo JSONL com rotação.
+#
+# O profiler do DuckDB custa ~30% numa view de poucos ms, então linhas
+# varridas, bytes lidos do disco e o plano (JSON do EXPLAIN ANALYZE) só
+# saem de uma amostra dos comandos (taxa_perfil).
+METRICS_DDL = r"""
+CREATE SEQUENCE IF NOT EXISTS seq_metrica_consulta;
+CREATE TABLE IF NOT EXISTS tbl_metrica_consulta (
+    id_metrica BIGINT DEFAULT nextval('seq_metrica_consulta') PRIMARY KEY,
+    ds_fingerprint VARCHAR(16) NOT NULL,
+    ds_sql VARCHAR NOT NULL,
+    nm_origem VARCHAR(60),
+    tempo_ms DOUBLE NOT NULL,
+    qtd_linhas BIGINT,
+    linhas_varridas BIGINT,
+    bytes_lidos BIGINT,
+    ds_plano VARCHAR,
+    ds_erro VARCHAR,
+    dt_execucao TIMESTAMP NOT NULL
+);
+"""
+
+LOTE = 500
+TAXA_PERFIL = 0.01
+MAX_BYTES_ARQUIVO = 10 * 1024 * 1024
+ARQUIVOS_ANTIGOS = 5
+# diferenças menores que isso (em ms) são ruído, mesmo que passem do limite
+RUIDO_MS = 1.0
+
+COLUNAS = pa.schema([
+    ('ds_fingerprint', pa.string()),
+    ('ds_sql', pa.string()),
+    ('nm_origem', pa.string()),
+    ('tempo_ms', pa.float64()),
+    ('qtd_linhas', pa.int64()),
+    ('linhas_varridas', pa.int64()),
+    ('bytes_lidos', pa.int64()),
+    ('ds_plano', pa.string()),
+    ('ds_erro', pa.string()),
+    ('dt_execucao', pa.timestamp('us')),
+])
+
+RE_COMENTARIO = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+RE_NUMERO = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+RE_LISTA = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+RE_ESPACO = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    # (hash, sql normalizado): sem comentários, literais viram ?, listas de
+    # literais viram (?...), espaços colapsados e minúsculas
+    normalizado = RE_COMENTARIO.sub(' ', sql)
+    normalizado = RE_TEXTO.sub('?', normalizado)
+    normalizado = RE_NUMERO.sub('?', normalizado)
+    normalizado = RE_LISTA.sub('(?...)', normalizado)
+    normalizado = RE_ESPACO.sub(' ', normalizado).strip().rstrip(';').lower()
+    return hashlib.sha1(normalizado.encode()).hexdigest()[:16], normalizado
+
+
+class RotatingFile:
+    # JSONL com rotação por tamanho: caminho, caminho.1, ..., caminho.N
+    def __init__(self, caminho, max_bytes=MAX_BYTES_ARQUIVO, antigos=ARQUIVOS_ANTIGOS):
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self.antigos = antigos
+
+    def _rotacionar(self):
+        for i in range(self.antigos - 1, 0, -1):
+            if os.path.exists(f'{self.caminho}.{i}'):
+                os.replace(f'{self.caminho}.{i}', f'{self.caminho}.{i + 1}')
+        os.replace(self.caminho, f'{self.caminho}.1')
+
+    def write(self, registros):
+        if os.path.exists(self.caminho) and os.path.getsize(self.caminho) >= self.max_bytes:
+            self._rotacionar()
+        with open(self.caminho, 'a') as arquivo:
+            for registro in registros:
+                arquivo.write(json.dumps(registro, default=str, ensure_ascii=False) + '\n')
+
+
+class MetricsBuffer:
+    # compartilhado entre a conexão instrumentada e seus cursores
+    def __init__(self, conn, arquivo=None, lote=LOTE):
+        self._conn = conn
+        self._arquivo = RotatingFile(arquivo) if arquivo else None
+        self.lote = lote
+        self._registros = []
+        self._lock = threading.Lock()
+
+    def add(self, registro):
+        with self._lock:
+            self._registros.append(registro)
+            cheio = len(self._registros) >= self.lote
+        if cheio:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            registros, self._registros = self._registros, []
+        if not registros:
+            return 0
+        if self._arquivo is not None:
+            self._arquivo.write(registros)
+        else:
+            # cursor próprio: não descarta o resultado pendente de quem
+            # está sendo medido
+            cursor = self._conn.cursor()
+            try:
+                insert_arrow(cursor, 'tbl_metrica_consulta', pa.Table.from_pylist(registros, COLUNAS))
+            finally:
+                cursor.close()
+        return len(registros)
+
+
+class InstrumentedConnection:
+    # mesma interface da conexão DuckDB para execute/fetch*; o resto passa
+    # direto para a conexão embrulhada
+    def __init__(self, conn, arquivo=None, origem=None, taxa_perfil=TAXA_PERFIL, planos=False,
+                 lote=LOTE, buffer=None):
+        self.conn = conn
+        self.origem = origem
+        self.taxa_perfil = taxa_perfil
+        self.planos = planos
+        self.buffer = buffer or MetricsBuffer(conn, arquivo, lote)
+        self._pendente = None
+
+    def _fechar_pendente(self, linhas=None, tempo_fetch=0.0):
+        registro, self._pendente = self._pendente, None
+        if registro is None:
+            return
+        perfil = registro.pop('_perfil')
+        registro['tempo_ms'] += tempo_fetch * 1000.0
+        if linhas is not None:
+            registro['qtd_linhas'] = linhas
+        if perfil:
+            try:
+                dados = json.loads(self.conn.get_profiling_information(format='json'))
+                if registro['qtd_linhas'] is None:
+                    registro['qtd_linhas'] = dados.get('rows_returned')
+                registro['linhas_varridas'] = dados.get('cumulative_rows_scanned')
+                registro['bytes_lidos'] = dados.get('total_bytes_read')
+                if self.planos:
+                    registro['ds_plano'] = json.dumps(dados)
+            finally:
+                self.conn.execute("PRAGMA disable_profiling")
+        self.buffer.add(registro)
+
+    def execute(self, sql, params=None):
+        self._fechar_pendente()
+        perfil = random.random() < self.taxa_perfil
+        if perfil:
+            self.conn.execute("PRAGMA enable_profiling = 'no_output'")
+        chave, normalizado = fingerprint(sql)
+        registro = {
+            'ds_fingerprint': chave, 'ds_sql': normalizado, 'nm_origem': self.origem,
+            'qtd_linhas': None, 'linhas_varridas': None, 'bytes_lidos': None,
+            'ds_plano': None, 'ds_erro': None, 'dt_execucao': datetime.datetime.now(),
+        }
+        inicio = time.perf_counter()
+        try:
+            self.conn.execute(sql, params)
+        except Exception as erro:
+            registro['tempo_ms'] = (time.perf_counter() - inicio) * 1000.0
+            registro['ds_erro'] = f'{type(erro).__name__}: {erro}'[:500]
+            if perfil:
+                self.conn.execute("PRAGMA disable_profiling")
+            self.buffer.add(registro)
+            raise
+        registro['tempo_ms'] = (time.perf_counter() - inicio) * 1000.0
+        registro['_perfil'] = perfil
+        self._pendente = registro
+        return self
+
+    def _medir(self, metodo, contar, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = getattr(self.conn, metodo)(*args, **kwargs)
+        if self._pendente is not None:
+            self._fechar_pendente(contar(resultado), time.perf_counter() - inicio)
+        return resultado
+
+    # leituras completas: fecham o registro com o total de linhas
+    def fetchall(self):
+        return self._medir('fetchall', len)
+
+    def fetchnumpy(self):
+        return self._medir('fetchnumpy', lambda r: len(next(iter(r.values()))) if r else 0)
+
+    def fetchdf(self, *args, **kwargs):
+        return self._medir('fetchdf', len, *args, **kwargs)
+
+    df = fetchdf
+
+    def to_arrow_table(self, *args, **kwargs):
+        return self._medir('to_arrow_table', lambda r: r.num_rows, *args, **kwargs)
+
+    fetch_arrow_table = arrow = to_arrow_table
+
+    # leituras parciais (fetchone, fetchmany, to_arrow_reader) passam direto;
+    # o registro fica só com o tempo de execução (e as linhas, se estiver na
+    # amostra do profiler) e fecha no próximo comando
+
+    def cursor(self):
+        return InstrumentedConnection(self.conn.cursor(), origem=self.origem, taxa_perfil=self.taxa_perfil,
+                                      planos=self.planos, buffer=self.buffer)
+
+    def flush(self):
+        return self.buffer.flush()
+
+    def close(self):
+        self._fechar_pendente()
+        self.buffer.flush()
+        self.conn.close()
+
+    def __getattr__(self, nome):
+        return getattr(self.conn, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fonte(arquivo):
+    if arquivo:
+        return f"read_json_auto('{arquivo}*', format = 'newline_delimited')"
+    return "tbl_metrica_consulta"
+
+
+def slowest(conn, top=10, arquivo=None):
+    # fingerprints mais lentos pelo p95, com as views citadas no SQL
+    return conn.execute(f"""
+        SELECT ds_fingerprint,
+               any_value(ds_sql) AS ds_sql,
+               list_sort(list_distinct(flatten(list(regexp_extract_all(ds_sql, 'vw_\\w+'))))) AS views,
+               count(*) AS execucoes,
+               count(ds_erro) AS erros,
+               round(quantile_cont(tempo_ms, 0.5), 3) AS p50_ms,
+               round(quantile_cont(tempo_ms, 0.95), 3) AS p95_ms,
+               round(max(tempo_ms), 3) AS max_ms,
+               round(avg(qtd_linhas), 1) AS linhas_media,
+               max(linhas_varridas) AS linhas_varridas,
+               max(bytes_lidos) AS bytes_lidos
+          FROM {_fonte(arquivo)}
+         GROUP BY ds_fingerprint
+         ORDER BY p95_ms DESC
+         LIMIT ?
+    """, [top]).to_arrow_table()
+
+
+def regressions(conn, recentes=20, limite=0.25, arquivo=None):
+    # compara o p50 das últimas execuções de cada fingerprint com o das
+    # anteriores; só entram fingerprints com histórico dos dois lados
+    return conn.execute(f"""
+        WITH ordenadas AS (
+            SELECT ds_fingerprint, ds_sql, tempo_ms,
+                   row_number() OVER (PARTITION BY ds_fingerprint ORDER BY dt_execucao DESC) <= ? AS recente
+              FROM {_fonte(arquivo)}
+             WHERE ds_erro IS NULL
+        ), janelas AS (
+            SELECT ds_fingerprint, any_value(ds_sql) AS ds_sql,
+                   quantile_cont(tempo_ms, 0.5) FILTER (WHERE NOT recente) AS p50_anterior_ms,
+                   quantile_cont(tempo_ms, 0.5) FILTER (WHERE recente) AS p50_recente_ms
+              FROM ordenadas
+             GROUP BY ds_fingerprint
+        )
+        SELECT ds_fingerprint, ds_sql,
+               round(p50_anterior_ms, 3) AS p50_anterior_ms,
+               round(p50_recente_ms, 3) AS p50_recente_ms,
+               round(p50_recente_ms / p50_anterior_ms - 1, 4) AS aumento
+          FROM janelas
+         WHERE p50_anterior_ms IS NOT NULL
+           AND p50_recente_ms > p50_anterior_ms * (1 + ?)
+           AND p50_recente_ms - p50_anterior_ms > ?
+         ORDER BY aumento DESC
+    """, [recentes, limite, RUIDO_MS]).to_arrow_table()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatório das métricas de consulta")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--arquivo', help="lê o JSONL (e os rotacionados) em vez da tabela")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--recentes', type=int, default=20, help="execuções recentes comparadas com as anteriores")
+    parser.add_argument('--limite', type=float, default=0.25, help="aumento relativo do p50 tolerado")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db, read_only=True) if not args.arquivo else duckdb.connect()
+    print("Mais lentas (p95):")
+    for linha in slowest(conn, args.top, args.arquivo).to_pylist():
+        views = ', '.join(linha['views']) or linha['ds_sql'][:60]
+        print(f"  {linha['ds_fingerprint']}  p50 {linha['p50_ms']} ms  p95 {linha['p95_ms']} ms  "
+              f"x{linha['execucoes']}  {views}")
+    piores = regressions(conn, args.recentes, args.limite, args.arquivo).to_pylist()
+    print(f"Regressões (> {args.limite:.0%}): {len(piores)}")
+    for linha in piores:
+        print(f"  {linha['ds_fingerprint']}  {linha['p50_anterior_ms']} -> {linha['p50_recente_ms']} ms  "
+              f"{linha['ds_sql'][:80]}")
+    conn.close()
+    return 1 if piores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import hashlib
+import re
+
+# Migrações versionadas do schema.
+#
+# A versão fica gravada em tbl_versao_schema; cada migração pendente roda
+# numa transação junto com o registro da versão. Um banco criado pelo
+# index.py anterior às migrações não tem tbl_versao_schema, mas já tem o
+# schema inicial: ele é registrado como versão 1 e segue da 2 em diante. As views (e as tabelas
+# mv_* de VIEWS) são tratadas à parte: guardamos o hash da definição de
+# cada objeto em tbl_definicao_view e só recriamos o que mudou, sem tocar
+# nas tabelas base.
+CONTROLE_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_versao_schema (
+    versao INTEGER PRIMARY KEY,
+    descricao VARCHAR(200) NOT NULL,
+    dt_aplicacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tbl_definicao_view (
+    nm_objeto VARCHAR(100) PRIMARY KEY,
+    tipo_objeto VARCHAR(10) NOT NULL,
+    hash_definicao CHAR(64) NOT NULL,
+    dt_aplicacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+RE_CREATE = re.compile(
+    r'^\s*CREATE\s+(?:OR\s+REPLACE\s+)?(TABLE|VIEW)\s+(\w+)\s+AS\s+(.*)$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def current_version(conn):
+    tabelas = {r[0] for r in conn.execute("""
+        SELECT table_name FROM duckdb_tables() WHERE table_name IN ('tbl_versao_schema', 'tbl_usuario')
+    """).fetchall()}
+    if 'tbl_versao_schema' in tabelas:
+        versao = conn.execute("SELECT coalesce(max(versao), 0) FROM tbl_versao_schema").fetchone()[0]
+        if versao:
+            return versao
+    # banco anterior às migrações: o schema inicial já está lá
+    return 1 if 'tbl_usuario' in tabelas else 0
+
+
+def migrate(conn, migrations):
+    # migrations: lista de (versao, descricao, sql) em ordem crescente
+    conn.execute(CONTROLE_DDL)
+    versao = current_version(conn)
+    if versao and not conn.execute("SELECT count(*) FROM tbl_versao_schema").fetchone()[0]:
+        numero, descricao, _ = migrations[0]
+        conn.execute(
+            "INSERT INTO tbl_versao_schema (versao, descricao) VALUES (?, ?)",
+            [numero, f"{descricao} (banco anterior às migrações)"],
+        )
+    aplicadas = []
+    for numero, descricao, sql in migrations:
+        if numero <= versao:
+            continue
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute(sql)
+            conn.execute(
+                "INSERT INTO tbl_versao_schema (versao, descricao) VALUES (?, ?)",
+                [numero, descricao],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        aplicadas.append(numero)
+    return aplicadas
+
+
+def view_definitions(conn, views_sql):
+    # "CREATE [OR REPLACE] TABLE|VIEW nome AS ..." -> {nome: (tipo, select)};
+    # DROPs do script são ignorados, quem decide o que recriar é o hash
+    definicoes = {}
+    for statement in conn.extract_statements(views_sql):
+        achado = RE_CREATE.match(statement.query)
+        if achado is None:
+            continue
+        tipo, nome, select = achado.groups()
+        definicoes[nome] = (tipo.upper(), select.strip())
+    return definicoes
+
+
+def _hash(tipo, select):
+    normalizado = ' '.join(select.split())
+    return hashlib.sha256(f'{tipo} {normalizado}'.encode()).hexdigest()
+
+
+def apply_views(conn, views_sql):
+    # devolve os nomes dos objetos (re)criados
+    definicoes = view_definitions(conn, views_sql)
+    gravados = dict(conn.execute(
+        "SELECT nm_objeto, hash_definicao FROM tbl_definicao_view"
+    ).fetchall())
+    existentes = {r[0] for r in conn.execute(
+        "SELECT table_name FROM duckdb_tables() UNION ALL SELECT view_name FROM duckdb_views()"
+    ).fetchall()}
+
+    recriados = []
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for nome, (tipo, select) in definicoes.items():
+            hash_definicao = _hash(tipo, select)
+            if gravados.get(nome) == hash_definicao and nome in existentes:
+                continue
+            conn.execute(f"CREATE OR REPLACE {tipo} {nome} AS {select}")
+            conn.execute(
+                "INSERT OR REPLACE INTO tbl_definicao_view (nm_objeto, tipo_objeto, hash_definicao) VALUES (?, ?, ?)",
+                [nome, tipo, hash_definicao],
+            )
+            recriados.append(nome)
+
+        for nome in set(gravados) - set(definicoes):
+            tipo = conn.execute(
+                "SELECT tipo_objeto FROM tbl_definicao_view WHERE nm_objeto = ?", [nome]
+            ).fetchone()[0]
+            conn.execute(f"DROP {tipo} IF EXISTS {nome}")
+            conn.execute("DELETE FROM tbl_definicao_view WHERE nm_objeto = ?", [nome])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return recriados
@@ -0,0 +1,149 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import duckdb
+
+import index
+
+# Serviço de leitura concorrente: uma única instância do banco, um cursor
+# por thread do pool. O número de consultas em andamento (executando ou na
+# fila) é limitado, e cada consulta tem um timeout; ao estourar, a consulta
+# é interrompida no DuckDB.
+FORMATOS = {
+    'arrow': index.query_arrow,
+    'numpy': index.query_numpy,
+    'dict': index.query_to_dict,
+}
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class _Tarefa:
+    # o cursor só fica visível enquanto a consulta roda, e o lock impede que
+    # um cancelamento atrasado interrompa a consulta seguinte do mesmo
+    # cursor (cada thread reaproveita o seu)
+    def __init__(self):
+        self.cursor = None
+        self.cancelada = False
+        self._lock = threading.Lock()
+
+    def iniciar(self, cursor):
+        # False se a tarefa já foi cancelada
+        with self._lock:
+            if self.cancelada:
+                return False
+            self.cursor = cursor
+            return True
+
+    def terminar(self):
+        with self._lock:
+            self.cursor = None
+
+    def cancelar(self):
+        with self._lock:
+            self.cancelada = True
+            if self.cursor is not None:
+                self.cursor.interrupt()
+
+
+class _Leitura:
+    # conexão, um cursor por thread do executor e a lista de views, comuns
+    # ao QueryService e ao aio.AsyncDatabase
+    def __init__(self, db_file, read_only, conn, executor):
+        self.conn = conn if conn is not None else duckdb.connect(db_file, read_only=read_only)
+        self._conn_propria = conn is None
+        self._local = threading.local()
+        self._cursores = []
+        self._lock = threading.Lock()
+        self._executor = executor
+        self._views = None
+
+    def _cursor(self):
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self._local.cursor = cursor
+            with self._lock:
+                self._cursores.append(cursor)
+        return cursor
+
+    def _listar_views(self):
+        if self._views is None:
+            self._views = {r[0] for r in self._cursor().execute(
+                "SELECT view_name FROM duckdb_views() WHERE NOT internal"
+            ).fetchall()}
+        return self._views
+
+    def _sql_view(self, view):
+        if view not in self._listar_views():
+            raise ValueError(f"View desconhecida: {view}")
+        return f"SELECT * FROM {view}"
+
+    def _fechar(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for cursor in self._cursores:
+                cursor.close()
+            self._cursores.clear()
+        if self._conn_propria:
+            self.conn.close()
+
+
+class QueryService(_Leitura):
+    def __init__(self, db_file='meu_banco.duckdb', max_workers=8, max_pending=None,
+                 timeout=30.0, read_only=True, conn=None):
+        super().__init__(db_file, read_only, conn,
+                         ThreadPoolExecutor(max_workers, thread_name_prefix='duckdb-leitura'))
+        self.timeout = timeout
+        self._vagas = threading.BoundedSemaphore(max_pending or max_workers * 4)
+
+    def _run(self, tarefa, sql, params, formato):
+        cursor = self._cursor()
+        if not tarefa.iniciar(cursor):
+            raise QueryTimeout(sql)
+        try:
+            return FORMATOS[formato](cursor, sql, params)
+        finally:
+            tarefa.terminar()
+
+    def submit(self, sql, params=None, formato='arrow'):
+        if not self._vagas.acquire(timeout=self.timeout):
+            raise QueryTimeout("fila de consultas cheia")
+        tarefa = _Tarefa()
+        try:
+            futuro = self._executor.submit(self._run, tarefa, sql, params, formato)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.tarefa = tarefa
+        # também dispara quando a tarefa é cancelada antes de rodar
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro
+
+    def result(self, futuro, timeout=None):
+        try:
+            return futuro.result(timeout=self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            if not futuro.cancel():
+                futuro.tarefa.cancelar()
+            raise QueryTimeout(f"consulta excedeu {self.timeout}s") from None
+
+    def fetch(self, sql, params=None, formato='arrow', timeout=None):
+        return self.result(self.submit(sql, params, formato), timeout)
+
+    def views(self):
+        return self._listar_views()
+
+    def fetch_view(self, view, formato='arrow', timeout=None):
+        return self.fetch(self._sql_view(view), formato=formato, timeout=timeout)
+
+    def close(self):
+        self._fechar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,315 @@
+import sys
+
+import duckdb
+
+from cache import bump_versions
+from maintenance import resort_if_scattered
+
+# Refresh incremental das tabelas materializadas (mv_*) criadas em VIEWS.
+#
+# Inserções são detectadas pelo high-water mark do id de cada tabela de
+# origem (as sequences só crescem); alterações e exclusões precisam ser
+# registradas em tbl_log_alteracao por quem escreve (log_changes ou os
+# helpers abaixo). O refresh só lê o que passou da marca, então o custo
+# acompanha o volume de mudanças e não o tamanho das tabelas.
+REFRESH_DDL = r"""
+CREATE SEQUENCE IF NOT EXISTS seq_log_alteracao;
+CREATE TABLE IF NOT EXISTS tbl_log_alteracao (
+    id_log BIGINT DEFAULT nextval('seq_log_alteracao') PRIMARY KEY,
+    nm_tabela VARCHAR(60) NOT NULL,
+    id_registro INTEGER NOT NULL,
+    dt_log TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tbl_controle_refresh (
+    nm_tabela VARCHAR(60) PRIMARY KEY,
+    ultimo_id INTEGER NOT NULL,
+    ultimo_log BIGINT NOT NULL,
+    dt_refresh TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# marcas dos demais consumidores incrementais (rollups etc.): cada um guarda
+# até onde já leu cada tabela de origem, independente do refresh das mv_*
+MARKS_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_marca_incremental (
+    nm_consumidor VARCHAR(60) NOT NULL,
+    nm_tabela VARCHAR(60) NOT NULL,
+    ultimo_id INTEGER NOT NULL,
+    ultimo_log BIGINT NOT NULL,
+    dt_atualizacao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (nm_consumidor, nm_tabela)
+);
+"""
+
+# tabela de origem -> coluna de id
+SOURCES = {
+    'tbl_usuario': 'id_usuario',
+    'tbl_empresa': 'id_empresa',
+    'tbl_vinculo_usuario_empresa': 'id_vinculo',
+    'tbl_avaliacao': 'id_avaliacao',
+    'tbl_avaliacao_beneficio': 'id_avaliacao_beneficio',
+}
+
+# tabelas de origem sem id_empresa -> junção que chega à empresa
+EMPRESA_VIA = {
+    'tbl_avaliacao_beneficio': 'tbl_avaliacao_beneficio JOIN tbl_avaliacao USING (id_avaliacao)',
+}
+
+# mesmas consultas de VIEWS, com um filtro de delta no final
+MV_USUARIO_EMPRESA_ATUAL = r"""
+SELECT u.id_usuario,
+       u.nm_usuario,
+       e.id_empresa,
+       e.nm_fantasia_empresa,
+       v.dt_inicio_vinculo,
+       v.salario_vinculo
+FROM tbl_vinculo_usuario_empresa v
+JOIN tbl_usuario u ON v.id_usuario = u.id_usuario
+JOIN tbl_empresa e ON v.id_empresa = e.id_empresa
+WHERE v.emprego_atual = TRUE
+"""
+
+MV_EMPRESA_RESUMO_AVALIACAO = r"""
+SELECT a.id_avaliacao,
+       a.id_empresa,
+       u.id_usuario,
+       u.nm_usuario usuario,
+       e.nm_fantasia_empresa,
+       a.depoimento_geral,
+       a.nota_geral,
+       a.dt_avaliacao
+FROM tbl_avaliacao a
+JOIN tbl_empresa e ON a.id_empresa = e.id_empresa
+JOIN tbl_usuario u on u.id_usuario = a.id_usuario
+"""
+
+
+def init_refresh(conn):
+    # marca as tabelas mv_* como atualizadas até o estado atual
+    # (as tabelas de controle vêm da migração com REFRESH_DDL)
+    ultimo_log = conn.execute("SELECT coalesce(max(id_log), 0) FROM tbl_log_alteracao").fetchone()[0]
+    for table, key in SOURCES.items():
+        conn.execute(f"""
+            INSERT OR REPLACE INTO tbl_controle_refresh (nm_tabela, ultimo_id, ultimo_log)
+            SELECT ?, coalesce(max({key}), 0), ? FROM {table}
+        """, [table, ultimo_log])
+
+
+def log_changes(conn, table, ids):
+    # registra UPDATE/DELETE em linhas já existentes de uma tabela de origem;
+    # ao excluir um vínculo registre também o usuário (tbl_usuario), já que o
+    # vínculo apagado não permite mais descobrir o dono
+    if table not in SOURCES:
+        raise ValueError(f"Tabela sem refresh incremental: {table}")
+    ids = [int(i) for i in ids]
+    if not ids:
+        return
+    conn.execute(
+        "INSERT INTO tbl_log_alteracao (nm_tabela, id_registro) SELECT ?, unnest(?::INTEGER[])",
+        [table, ids],
+    )
+    bump_versions(conn, [table])
+
+
+# Os helpers abaixo só gravam a alteração e o log: as mv_*, os rollups e as
+# demais estruturas derivadas (e as views que leem delas) continuam com o
+# valor antigo até o próximo refresh (cli.py refresh roda todos).
+
+
+def set_emprego_atual(conn, id_usuario, id_vinculo):
+    # troca o emprego atual do usuário, mantendo um único vínculo atual
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        alterados = conn.execute("""
+            UPDATE tbl_vinculo_usuario_empresa
+               SET emprego_atual = (id_vinculo = $2)
+             WHERE id_usuario = $1
+               AND emprego_atual <> (id_vinculo = $2)
+            RETURNING id_vinculo
+        """, [id_usuario, id_vinculo]).fetchall()
+        log_changes(conn, 'tbl_vinculo_usuario_empresa', [r[0] for r in alterados])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def update_salario(conn, id_vinculo, salario):
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        conn.execute(
+            "UPDATE tbl_vinculo_usuario_empresa SET salario_vinculo = ? WHERE id_vinculo = ?",
+            [salario, id_vinculo],
+        )
+        log_changes(conn, 'tbl_vinculo_usuario_empresa', [id_vinculo])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def read_marks(conn, consumer, tables):
+    # {tabela: (ultimo_id, ultimo_log)}; sem marca gravada, lê desde o início
+    gravadas = {
+        r[0]: (r[1], r[2])
+        for r in conn.execute(
+            "SELECT nm_tabela, ultimo_id, ultimo_log FROM tbl_marca_incremental WHERE nm_consumidor = ?",
+            [consumer],
+        ).fetchall()
+    }
+    return {table: gravadas.get(table, (0, 0)) for table in tables}
+
+
+def current_marks(conn, tables):
+    # estado atual das tabelas; leia dentro da mesma transação que consome o delta
+    ultimo_log = conn.execute("SELECT coalesce(max(id_log), 0) FROM tbl_log_alteracao").fetchone()[0]
+    return {
+        table: (conn.execute(f"SELECT coalesce(max({SOURCES[table]}), 0) FROM {table}").fetchone()[0], ultimo_log)
+        for table in tables
+    }
+
+
+def save_marks(conn, consumer, marcas):
+    for table, (ultimo_id, ultimo_log) in marcas.items():
+        conn.execute("""
+            INSERT OR REPLACE INTO tbl_marca_incremental (nm_consumidor, nm_tabela, ultimo_id, ultimo_log)
+            VALUES (?, ?, ?, ?)
+        """, [consumer, table, ultimo_id, ultimo_log])
+
+
+def logged_ids(table, ultimo_log):
+    # ids alterados/excluídos depois da marca do log
+    return f"""
+        SELECT DISTINCT id_registro AS id FROM tbl_log_alteracao
+         WHERE id_log > {ultimo_log} AND nm_tabela = '{table}'
+    """
+
+
+def changed_companies(conn, marcas, destino):
+    # empresas das linhas alteradas depois das marcas (pela coluna
+    # id_empresa ou pela junção de EMPRESA_VIA) na tabela temporária destino, coluna id; devolve
+    # (alterados, sumidos): sumidos já não existem e sua empresa não dá
+    # mais para saber
+    conn.execute("CREATE OR REPLACE TEMP TABLE _alterados AS " + " UNION ALL ".join(
+        f"SELECT '{table}' AS nm_tabela, id FROM ({logged_ids(table, ultimo_log)})"
+        for table, (_, ultimo_log) in marcas.items()
+    ))
+    por_tabela = dict(conn.execute("SELECT nm_tabela, count(*) FROM _alterados GROUP BY nm_tabela").fetchall())
+    alterados = sum(por_tabela.values())
+    # só as tabelas com registros no log: o teste de existência varre a
+    # tabela de origem, e no caso comum (só inserções) não há o que testar
+    sumidos = sum(
+        conn.execute(f"""
+            SELECT count(*) FROM _alterados
+             WHERE nm_tabela = '{table}' AND id NOT IN (SELECT {SOURCES[table]} FROM {table})
+        """).fetchone()[0]
+        for table in marcas if table in por_tabela
+    )
+    if por_tabela:
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE {destino} AS " + " UNION ".join(
+            f"""SELECT id_empresa AS id FROM {EMPRESA_VIA.get(table, table)}
+                 WHERE {SOURCES[table]} IN (SELECT id FROM _alterados WHERE nm_tabela = '{table}')"""
+            for table in marcas if table in por_tabela
+        ))
+    else:
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE {destino} (id INTEGER)")
+    conn.execute("DROP TABLE _alterados")
+    return alterados, sumidos
+
+
+def _delta(table, key, marcas):
+    # ids inseridos depois da marca + ids registrados no log depois da marca
+    ultimo_id, ultimo_log = marcas[table]
+    return f"""
+        SELECT {key} AS id FROM {table} WHERE {key} > {ultimo_id}
+        UNION
+        SELECT id_registro FROM tbl_log_alteracao
+         WHERE id_log > {ultimo_log} AND nm_tabela = '{table}'
+    """
+
+
+def refresh(conn):
+    marcas = {
+        r[0]: (r[1], r[2])
+        for r in conn.execute("SELECT nm_tabela, ultimo_id, ultimo_log FROM tbl_controle_refresh").fetchall()
+    }
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        ultimo_log = conn.execute("SELECT coalesce(max(id_log), 0) FROM tbl_log_alteracao").fetchone()[0]
+        novos_ids = {
+            table: conn.execute(f"SELECT coalesce(max({key}), 0) FROM {table}").fetchone()[0]
+            for table, key in SOURCES.items()
+        }
+
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE _delta_avaliacao AS {_delta('tbl_avaliacao', 'id_avaliacao', marcas)}")
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE _delta_usuario AS {_delta('tbl_usuario', 'id_usuario', marcas)}")
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE _delta_empresa AS {_delta('tbl_empresa', 'id_empresa', marcas)}")
+        # vínculos afetam mv_usuario_empresa_atual pelo usuário dono do vínculo
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _delta_usuario_vinculo AS
+            SELECT DISTINCT v.id_usuario AS id
+              FROM tbl_vinculo_usuario_empresa v
+             WHERE v.id_vinculo IN ({_delta('tbl_vinculo_usuario_empresa', 'id_vinculo', marcas)})
+            UNION
+            SELECT id FROM _delta_usuario
+        """)
+
+        conn.execute("""
+            DELETE FROM mv_usuario_empresa_atual
+             WHERE id_usuario IN (SELECT id FROM _delta_usuario_vinculo)
+                OR id_empresa IN (SELECT id FROM _delta_empresa)
+        """)
+        conn.execute(f"""
+            INSERT INTO mv_usuario_empresa_atual
+            {MV_USUARIO_EMPRESA_ATUAL}
+              AND (v.id_usuario IN (SELECT id FROM _delta_usuario_vinculo)
+                   OR v.id_empresa IN (SELECT id FROM _delta_empresa))
+        """)
+
+        conn.execute("""
+            DELETE FROM mv_empresa_resumo_avaliacao
+             WHERE id_avaliacao IN (SELECT id FROM _delta_avaliacao)
+                OR id_usuario IN (SELECT id FROM _delta_usuario)
+                OR id_empresa IN (SELECT id FROM _delta_empresa)
+        """)
+        conn.execute(f"""
+            INSERT INTO mv_empresa_resumo_avaliacao
+            {MV_EMPRESA_RESUMO_AVALIACAO}
+            WHERE a.id_avaliacao IN (SELECT id FROM _delta_avaliacao)
+               OR a.id_usuario IN (SELECT id FROM _delta_usuario)
+               OR a.id_empresa IN (SELECT id FROM _delta_empresa)
+        """)
+
+        alteracoes = conn.execute("""
+            SELECT (SELECT count(*) FROM _delta_avaliacao) + (SELECT count(*) FROM _delta_usuario_vinculo)
+                 + (SELECT count(*) FROM _delta_empresa)
+        """).fetchone()[0]
+        if alteracoes:
+            bump_versions(conn, ['mv_usuario_empresa_atual', 'mv_empresa_resumo_avaliacao'])
+
+        for table, ultimo_id in novos_ids.items():
+            conn.execute("""
+                UPDATE tbl_controle_refresh
+                   SET ultimo_id = ?, ultimo_log = ?, dt_refresh = CURRENT_TIMESTAMP
+                 WHERE nm_tabela = ?
+            """, [ultimo_id, ultimo_log, table])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    for nome in ('_delta_avaliacao', '_delta_usuario', '_delta_empresa', '_delta_usuario_vinculo'):
+        conn.execute(f"DROP TABLE IF EXISTS {nome}")
+    # as linhas refeitas vão para o fim da tabela e desfazem a ordem por
+    # empresa de que os lookups dependem; reordena quando espalhou demais
+    for nome in ('mv_usuario_empresa_atual', 'mv_empresa_resumo_avaliacao'):
+        resort_if_scattered(conn, nome)
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'meu_banco.duckdb'
+    conn = duckdb.connect(db_file)
+    refresh(conn)
+    print("Tabelas mv_* atualizadas")
+    conn.close()
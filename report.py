@@ -0,0 +1,168 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import numpy as np
+
+from cache import data_versions, dependencies
+from fused import FUSED_VIEWS, full_report
+
+# Relatório headless: um gráfico por view vw_*, renderizado com o backend
+# Agg em paralelo num pool de processos. Os workers recebem só arrays
+# NumPy (rótulos e valores), não listas de linhas. Um manifesto no
+# diretório de saída guarda as versões de dados e o hash dos dados de cada
+# gráfico: se as versões não mudaram nem consultamos a view; se os dados
+# não mudaram, não redesenhamos.
+MANIFESTO = 'manifest.json'
+# views com uma linha por empresa ficam ilegíveis; desenhamos só o começo
+# (as views já vêm ordenadas)
+MAX_BARRAS = 40
+
+
+def _carregar_manifesto(out_dir):
+    caminho = os.path.join(out_dir, MANIFESTO)
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho) as arquivo:
+        return json.load(arquivo)
+
+
+def _gravar_manifesto(out_dir, manifesto):
+    caminho = os.path.join(out_dir, MANIFESTO)
+    with open(caminho + '.tmp', 'w') as arquivo:
+        json.dump(manifesto, arquivo, indent=2, ensure_ascii=False)
+    os.replace(caminho + '.tmp', caminho)
+
+
+def chart_data(conn, view, tabela=None):
+    # colunas de texto viram o rótulo; colunas numéricas, as séries. tabela
+    # (Arrow) é o resultado já calculado da view, quando houver
+    if tabela is None:
+        colunas = conn.execute(f"SELECT * FROM {view} LIMIT {MAX_BARRAS}").fetchnumpy()
+    else:
+        colunas = conn.from_arrow(tabela).limit(MAX_BARRAS).fetchnumpy()
+    rotulos, series, valores = [], [], []
+    for nome, coluna in colunas.items():
+        if coluna.dtype.kind in 'iuf':
+            series.append(nome)
+            valores.append(np.asarray(coluna, dtype=np.float64))
+        else:
+            rotulos.append(np.asarray(coluna, dtype=str))
+    if rotulos:
+        rotulo = rotulos[0]
+        for extra in rotulos[1:]:
+            rotulo = np.char.add(np.char.add(rotulo, ' / '), extra)
+    else:
+        rotulo = np.arange(len(valores[0]) if valores else 0).astype(str)
+    matriz = np.column_stack(valores) if valores else np.zeros((len(rotulo), 0))
+    return rotulo, matriz, series
+
+
+def data_hash(rotulos, valores, series):
+    h = hashlib.sha256()
+    h.update('\0'.join(series).encode())
+    h.update('\0'.join(rotulos.tolist()).encode())
+    h.update(np.ascontiguousarray(valores).tobytes())
+    return h.hexdigest()
+
+
+def render_chart(view, rotulos, valores, series, out_dir, formats):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    altura = max(3.0, 0.4 * len(rotulos) + 1.5)
+    fig, ax = plt.subplots(figsize=(10, altura))
+    posicoes = np.arange(len(rotulos))
+    largura = 0.8 / max(1, len(series))
+    for i, serie in enumerate(series):
+        ax.barh(posicoes + i * largura, valores[:, i], height=largura, label=serie)
+    ax.set_yticks(posicoes + largura * (len(series) - 1) / 2)
+    ax.set_yticklabels(rotulos)
+    ax.invert_yaxis()
+    ax.set_title(view)
+    if len(series) > 1:
+        ax.legend()
+    fig.tight_layout()
+
+    arquivos = []
+    for formato in formats:
+        caminho = os.path.join(out_dir, f'{view}.{formato}')
+        fig.savefig(caminho, format=formato)
+        arquivos.append(caminho)
+    plt.close(fig)
+    return arquivos
+
+
+def render_report(conn, out_dir='relatorios', formats=('png',), workers=None, views=None, fundido=False):
+    # fundido: as views de FUSED_VIEWS que precisarem de dados saem todas
+    # de uma varredura só de tbl_avaliacao (fused.full_report)
+    os.makedirs(out_dir, exist_ok=True)
+    manifesto = _carregar_manifesto(out_dir)
+    if views is None:
+        views = [r[0] for r in conn.execute("""
+            SELECT view_name FROM duckdb_views()
+             WHERE NOT internal AND view_name LIKE 'vw\\_%' ESCAPE '\\'
+             ORDER BY view_name
+        """).fetchall()]
+
+    resumo = {'renderizados': [], 'sem_mudanca': []}
+    pendentes = {}
+    fundidas = None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for view in views:
+            anterior = manifesto.get(view, {})
+            versoes = list(data_versions(conn, dependencies(conn, view)))
+            arquivos = [os.path.join(out_dir, f'{view}.{f}') for f in formats]
+            existem = all(os.path.exists(a) for a in arquivos)
+            if existem and anterior.get('versoes') == versoes:
+                resumo['sem_mudanca'].append(view)
+                continue
+
+            tabela = None
+            if fundido and view in FUSED_VIEWS:
+                if fundidas is None:
+                    fundidas = full_report(conn, [v for v in views if v in FUSED_VIEWS])
+                tabela = fundidas[view]
+            rotulos, valores, series = chart_data(conn, view, tabela)
+            hash_dados = data_hash(rotulos, valores, series)
+            if existem and anterior.get('hash') == hash_dados:
+                manifesto[view] = {**anterior, 'versoes': versoes}
+                resumo['sem_mudanca'].append(view)
+                continue
+
+            futuro = pool.submit(render_chart, view, rotulos, valores, series, out_dir, list(formats))
+            pendentes[view] = (futuro, versoes, hash_dados)
+
+        for view, (futuro, versoes, hash_dados) in pendentes.items():
+            manifesto[view] = {'versoes': versoes, 'hash': hash_dados, 'arquivos': futuro.result()}
+            resumo['renderizados'].append(view)
+
+    _gravar_manifesto(out_dir, manifesto)
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera os gráficos das views vw_* sem interface gráfica")
+    parser.add_argument('db', nargs='?', default='meu_banco.duckdb')
+    parser.add_argument('--out', default='relatorios')
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg'])
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--views', nargs='+')
+    parser.add_argument('--fundido', action='store_true',
+                        help="views de tbl_avaliacao numa varredura só (fused.py)")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db, read_only=True)
+    resumo = render_report(conn, args.out, args.formats, args.workers, args.views, args.fundido)
+    conn.close()
+    print(f"Renderizados: {len(resumo['renderizados'])}, sem mudança: {len(resumo['sem_mudanca'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import sys
+
+import duckdb
+
+from cache import bump_versions
+from refresh import changed_companies, current_marks, read_marks, save_marks
+
+# Rollups pré-agregados para os painéis de salário e nota.
+#
+# Cada tabela tbl_rollup_* guarda, por grupo, agregados parciais aditivos
+# (qtd, soma, soma dos quadrados, mínimo e máximo) de um único valor, então
+# médias, variâncias e extremos de qualquer nível acima saem de somar os
+# grupos. A grão é empresa × cargo × senioridade × regime × mês; as notas
+# não têm cargo próprio e ficam em empresa × mês, e a nota por benefício
+# citado em empresa × benefício (perfil da empresa, lookup.py).
+#
+# Linhas novas (id acima da marca) entram somando no grupo (upsert); linhas
+# alteradas ou excluídas (tbl_log_alteracao) fazem recalcular as empresas
+# afetadas. Se um registro alterado já não existe, recalculamos tudo. O
+# rollup por benefício também acompanha os links de tbl_avaliacao_beneficio:
+# um benefício citado depois, numa avaliação antiga, entra pelo id do link.
+CONSUMIDOR = 'rollup'
+ORIGENS = ['tbl_vinculo_usuario_empresa', 'tbl_avaliacao', 'tbl_avaliacao_beneficio']
+
+ROLLUP_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_rollup_vinculo (
+    id_empresa INTEGER NOT NULL,
+    id_cargo_especialidade INTEGER NOT NULL,
+    id_senioridade INTEGER NOT NULL,
+    cod_regime_contratacao INTEGER NOT NULL,
+    mes DATE NOT NULL,
+    qtd BIGINT NOT NULL,
+    soma DECIMAL(18,2) NOT NULL,
+    soma_quad DOUBLE NOT NULL,
+    minimo DECIMAL(10,2) NOT NULL,
+    maximo DECIMAL(10,2) NOT NULL,
+    PRIMARY KEY (id_empresa, id_cargo_especialidade, id_senioridade, cod_regime_contratacao, mes)
+);
+
+CREATE TABLE IF NOT EXISTS tbl_rollup_aumento (
+    id_empresa INTEGER NOT NULL,
+    id_cargo_especialidade INTEGER NOT NULL,
+    id_senioridade INTEGER NOT NULL,
+    cod_regime_contratacao INTEGER NOT NULL,
+    mes DATE NOT NULL,
+    qtd BIGINT NOT NULL,
+    soma BIGINT NOT NULL,
+    soma_quad DOUBLE NOT NULL,
+    minimo INTEGER NOT NULL,
+    maximo INTEGER NOT NULL,
+    PRIMARY KEY (id_empresa, id_cargo_especialidade, id_senioridade, cod_regime_contratacao, mes)
+);
+
+CREATE TABLE IF NOT EXISTS tbl_rollup_nota (
+    id_empresa INTEGER NOT NULL,
+    mes DATE NOT NULL,
+    qtd BIGINT NOT NULL,
+    soma BIGINT NOT NULL,
+    soma_quad DOUBLE NOT NULL,
+    minimo INTEGER NOT NULL,
+    maximo INTEGER NOT NULL,
+    PRIMARY KEY (id_empresa, mes)
+);
+"""
+
+CHAVES = ['id_empresa', 'id_cargo_especialidade', 'id_senioridade', 'cod_regime_contratacao', 'mes']
+
+# rollup -> (chaves, origem com a coluna "valor"); o {filtro} usa os aliases
+# v (vínculo), a (avaliação) e ab (link avaliação-benefício)
+ROLLUPS = {
+    'tbl_rollup_vinculo': (CHAVES, """
+        SELECT v.id_empresa, v.id_cargo_especialidade, v.id_senioridade, v.cod_regime_contratacao,
+               date_trunc('month', v.dt_inicio_vinculo)::DATE AS mes,
+               v.salario_vinculo AS valor
+          FROM tbl_vinculo_usuario_empresa v
+         WHERE {filtro}
+    """),
+    # cada avaliação conta uma vez, pelo vínculo resolvido (links.py)
+    'tbl_rollup_aumento': (CHAVES, """
+        SELECT v.id_empresa, v.id_cargo_especialidade, v.id_senioridade, v.cod_regime_contratacao,
+               date_trunc('month', a.dt_avaliacao)::DATE AS mes,
+               a.tempo_primeiro_aumento AS valor
+          FROM tbl_avaliacao a
+          JOIN tbl_vinculo_usuario_empresa v ON v.id_vinculo = a.id_vinculo
+         WHERE a.tempo_primeiro_aumento IS NOT NULL
+           AND {filtro}
+    """),
+    'tbl_rollup_nota': (['id_empresa', 'mes'], """
+        SELECT a.id_empresa,
+               date_trunc('month', a.dt_avaliacao)::DATE AS mes,
+               a.nota_geral AS valor
+          FROM tbl_avaliacao a
+         WHERE {filtro}
+    """),
+    'tbl_rollup_beneficio': (['id_empresa', 'id_beneficio'], """
+        SELECT a.id_empresa, ab.id_beneficio,
+               a.nota_geral AS valor
+          FROM tbl_avaliacao a
+          JOIN tbl_avaliacao_beneficio ab ON ab.id_avaliacao = a.id_avaliacao
+         WHERE {filtro}
+    """),
+}
+
+
+def _agregado(nome, filtro):
+    chaves, origem = ROLLUPS[nome]
+    colunas = ', '.join(chaves)
+    return f"""
+        SELECT {colunas},
+               count(valor) AS qtd,
+               sum(valor) AS soma,
+               sum(valor::DOUBLE * valor::DOUBLE) AS soma_quad,
+               min(valor) AS minimo,
+               max(valor) AS maximo
+          FROM ({origem.format(filtro=filtro)})
+         GROUP BY {colunas}
+    """
+
+
+# rollup criado depois dos outros: a migração já o preenche até a marca do
+# consumidor, e o que vier depois dela entra pelo update_rollup normal
+_ATE_A_MARCA = f"""a.id_avaliacao <= (
+    SELECT coalesce(max(ultimo_id), 0) FROM tbl_marca_incremental
+     WHERE nm_consumidor = '{CONSUMIDOR}' AND nm_tabela = 'tbl_avaliacao')"""
+
+ROLLUP_BENEFICIO_DDL = f"""
+CREATE TABLE IF NOT EXISTS tbl_rollup_beneficio (
+    id_empresa INTEGER NOT NULL,
+    id_beneficio INTEGER NOT NULL,
+    qtd BIGINT NOT NULL,
+    soma BIGINT NOT NULL,
+    soma_quad DOUBLE NOT NULL,
+    minimo INTEGER NOT NULL,
+    maximo INTEGER NOT NULL,
+    PRIMARY KEY (id_empresa, id_beneficio)
+);
+
+INSERT INTO tbl_rollup_beneficio {_agregado('tbl_rollup_beneficio', _ATE_A_MARCA)}
+ORDER BY id_empresa, id_beneficio;
+"""
+
+# tbl_avaliacao_beneficio passa a ter marca própria: o rollup por benefício
+# é refeito com os links atuais das avaliações até a marca, e a marca dos
+# links fica no maior id atual (só para bancos que já têm marcas do rollup)
+MARCA_BENEFICIO_DDL = f"""
+DELETE FROM tbl_rollup_beneficio;
+INSERT INTO tbl_rollup_beneficio {_agregado('tbl_rollup_beneficio', _ATE_A_MARCA)}
+ORDER BY id_empresa, id_beneficio;
+
+INSERT OR REPLACE INTO tbl_marca_incremental (nm_consumidor, nm_tabela, ultimo_id, ultimo_log)
+SELECT nm_consumidor, 'tbl_avaliacao_beneficio',
+       (SELECT coalesce(max(id_avaliacao_beneficio), 0) FROM tbl_avaliacao_beneficio),
+       ultimo_log
+  FROM tbl_marca_incremental
+ WHERE nm_consumidor = '{CONSUMIDOR}' AND nm_tabela = 'tbl_avaliacao';
+"""
+
+
+def _somar(conn, nome, filtro):
+    # upsert aditivo: o grupo existente recebe os agregados do delta
+    chaves, _ = ROLLUPS[nome]
+    conn.execute(f"""
+        INSERT INTO {nome} {_agregado(nome, filtro)}
+        ON CONFLICT ({', '.join(chaves)}) DO UPDATE
+           SET qtd = {nome}.qtd + EXCLUDED.qtd,
+               soma = {nome}.soma + EXCLUDED.soma,
+               soma_quad = {nome}.soma_quad + EXCLUDED.soma_quad,
+               minimo = least({nome}.minimo, EXCLUDED.minimo),
+               maximo = greatest({nome}.maximo, EXCLUDED.maximo)
+    """)
+
+
+def _recalcular(conn, nome, empresas=None):
+    # empresas: tabela temporária com a coluna id; None recalcula tudo
+    # (inserido em ordem de empresa: as consultas de uma empresa só, como as
+    # de lookup.py, pulam os blocos das outras pelos zonemaps)
+    colunas = ', '.join(ROLLUPS[nome][0])
+    if empresas is None:
+        conn.execute(f"DELETE FROM {nome}")
+        conn.execute(f"INSERT INTO {nome} {_agregado(nome, 'TRUE')} ORDER BY {colunas}")
+        return
+    alias = 'v' if nome == 'tbl_rollup_vinculo' else 'a'
+    conn.execute(f"DELETE FROM {nome} WHERE id_empresa IN (SELECT id FROM {empresas})")
+    conn.execute(f"INSERT INTO {nome} {_agregado(nome, f'{alias}.id_empresa IN (SELECT id FROM {empresas})')} ORDER BY {colunas}")
+
+
+def update_rollup(conn):
+    # devolve o número de linhas de origem consumidas (novas + alteradas)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        marcas = read_marks(conn, CONSUMIDOR, ORIGENS)
+        # a marca nunca recua (o maior id pode ter sido excluído)
+        novas = {
+            table: (max(ultimo_id, marcas[table][0]), ultimo_log)
+            for table, (ultimo_id, ultimo_log) in current_marks(conn, ORIGENS).items()
+        }
+        id_vinculo = marcas['tbl_vinculo_usuario_empresa'][0]
+        id_avaliacao = marcas['tbl_avaliacao'][0]
+        id_link = marcas['tbl_avaliacao_beneficio'][0]
+
+        alterados, sumidos = changed_companies(conn, marcas, '_rollup_empresas')
+        inseridos = sum(novas[table][0] - marcas[table][0] for table in ORIGENS)
+
+        if sumidos:
+            for nome in ROLLUPS:
+                _recalcular(conn, nome)
+        else:
+            if alterados:
+                for nome in ROLLUPS:
+                    _recalcular(conn, nome, '_rollup_empresas')
+            if inseridos:
+                fora = 'NOT IN (SELECT id FROM _rollup_empresas)'
+                _somar(conn, 'tbl_rollup_vinculo', f"v.id_vinculo > {id_vinculo} AND v.id_empresa {fora}")
+                # o vínculo de uma avaliação antiga só muda pelo backfill,
+                # que registra no log: Δ(A ⋈ V) = ΔA ⋈ V
+                _somar(conn, 'tbl_rollup_aumento', f"a.id_avaliacao > {id_avaliacao} AND a.id_empresa {fora}")
+                _somar(conn, 'tbl_rollup_nota', f"a.id_avaliacao > {id_avaliacao} AND a.id_empresa {fora}")
+                _somar(conn, 'tbl_rollup_beneficio',
+                       f"(a.id_avaliacao > {id_avaliacao} OR ab.id_avaliacao_beneficio > {id_link}) AND a.id_empresa {fora}")
+
+        if alterados or inseridos:
+            bump_versions(conn, list(ROLLUPS))
+        save_marks(conn, CONSUMIDOR, novas)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    conn.execute("DROP TABLE IF EXISTS _rollup_empresas")
+    return alterados + inseridos
+
+
+def rebuild_rollup(conn):
+    # recálculo completo (ex.: depois de mudar colunas de agrupamento sem
+    # registrar no log)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        for nome in ROLLUPS:
+            _recalcular(conn, nome)
+        bump_versions(conn, list(ROLLUPS))
+        save_marks(conn, CONSUMIDOR, current_marks(conn, ORIGENS))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'meu_banco.duckdb'
+    conn = duckdb.connect(db_file)
+    if '--completo' in sys.argv[2:]:
+        rebuild_rollup(conn)
+    else:
+        update_rollup(conn)
+    print("Rollups atualizados")
+    conn.close()
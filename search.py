@@ -0,0 +1,296 @@
+import argparse
+import math
+import sys
+import unicodedata
+
+import duckdb
+
+from refresh import current_marks, logged_ids, read_marks, save_marks
+
+# Busca textual em tbl_avaliacao.depoimento_geral com índice invertido e
+# ranking BM25, tudo em tabelas do próprio banco (sem extensão fts).
+#
+# A tokenização é feita em SQL, igual na indexação e na consulta: minúsculas,
+# sem acentos, "°"/"º" viram "o" (13° -> 13o), quebra em tudo que não é
+# letra ou dígito e remove stopwords. O stemming (opcional, escolhido na
+# construção do índice) é um redutor leve de plurais e de "-mente".
+#
+# As postagens carregam o tamanho do documento, a empresa e a nota, então
+# ranking e filtros não precisam juntar com tbl_avaliacao; só os k melhores
+# voltam com o texto. Novas avaliações entram pelo high-water mark e as
+# alteradas/excluídas pelo tbl_log_alteracao, como nos rollups.
+CONSUMIDOR = 'fts'
+K1 = 1.2
+B = 0.75
+
+SEARCH_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_fts_estado (
+    id_estado INTEGER PRIMARY KEY CHECK (id_estado = 1),
+    stemming BOOLEAN NOT NULL,
+    qtd_documentos BIGINT NOT NULL DEFAULT 0,
+    soma_tamanhos BIGINT NOT NULL DEFAULT 0,
+    dt_construcao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE SEQUENCE IF NOT EXISTS seq_fts_termo;
+CREATE TABLE IF NOT EXISTS tbl_fts_termo (
+    id_termo INTEGER DEFAULT nextval('seq_fts_termo') PRIMARY KEY,
+    termo VARCHAR NOT NULL UNIQUE,
+    df BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tbl_fts_documento (
+    id_avaliacao INTEGER NOT NULL,
+    tamanho INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tbl_fts_postagem (
+    id_termo INTEGER NOT NULL,
+    id_avaliacao INTEGER NOT NULL,
+    tf SMALLINT NOT NULL,
+    tamanho SMALLINT NOT NULL,
+    id_empresa INTEGER NOT NULL,
+    nota_geral TINYINT NOT NULL
+);
+"""
+
+# tf e tamanho nasceram SMALLINT: um depoimento com mais de 32767 termos
+# (ou um termo repetido tantas vezes) estourava a carga do índice
+POSTAGEM_INTEGER_DDL = r"""
+ALTER TABLE tbl_fts_postagem ALTER COLUMN tf TYPE INTEGER;
+ALTER TABLE tbl_fts_postagem ALTER COLUMN tamanho TYPE INTEGER;
+"""
+
+STOPWORDS = [
+    'a', 'ao', 'aos', 'as', 'até', 'com', 'como', 'da', 'das', 'de', 'do', 'dos', 'e', 'é', 'em',
+    'entre', 'era', 'essa', 'esse', 'está', 'estava', 'eu', 'foi', 'há', 'isso', 'já', 'mais',
+    'mas', 'me', 'mesmo', 'muito', 'na', 'nas', 'no', 'nos', 'num', 'numa', 'o', 'os', 'ou',
+    'para', 'pela', 'pelo', 'por', 'pouco', 'que', 'se', 'sem', 'ser', 'seu', 'sua', 'são',
+    'tem', 'tudo', 'um', 'uma', 'à',
+]
+
+# as stopwords passam pela mesma remoção de acentos que o texto
+PARADAS = ', '.join(sorted({
+    "'" + ''.join(c for c in unicodedata.normalize('NFKD', p) if not unicodedata.combining(c)) + "'"
+    for p in STOPWORDS
+}))
+
+# plural e advérbio, do sufixo mais específico para o mais geral
+STEM = r"""
+CASE WHEN length(t) <= 3 THEN t
+     WHEN t LIKE '%oes' OR t LIKE '%aes' THEN left(t, -3) || 'ao'
+     WHEN t LIKE '%ais' THEN left(t, -2) || 'l'
+     WHEN t LIKE '%eis' THEN left(t, -3) || 'el'
+     WHEN t LIKE '%ns' THEN left(t, -2) || 'm'
+     WHEN t LIKE '%res' OR t LIKE '%zes' OR t LIKE '%ses' THEN left(t, -2)
+     WHEN t LIKE '%mente' AND length(t) > 7 THEN left(t, -5)
+     WHEN t LIKE '%s' AND t NOT LIKE '%ss' THEN left(t, -1)
+     ELSE t
+END
+"""
+
+
+def terms_sql(texto, stemming=False):
+    # expressão SQL: texto -> lista de termos (com repetição, na ordem)
+    dobrado = f"strip_accents(lower(replace(replace({texto}, '°', 'o'), 'º', 'o')))"
+    termos = (f"list_filter(regexp_split_to_array({dobrado}, '[^a-z0-9]+'), "
+              f"lambda t: t <> '' AND NOT list_contains([{PARADAS}], t))")
+    if stemming:
+        termos = f"list_transform({termos}, lambda t: {' '.join(STEM.split())})"
+    return termos
+
+
+def _stemming(conn):
+    linha = conn.execute("SELECT stemming FROM tbl_fts_estado").fetchone()
+    return None if linha is None else linha[0]
+
+
+def _remover(conn, ids):
+    # tira do índice as avaliações de ids (tabela temporária com a coluna id)
+    conn.execute(f"""
+        UPDATE tbl_fts_termo t
+           SET df = t.df - r.qtd
+          FROM (SELECT id_termo, count(*) AS qtd FROM tbl_fts_postagem
+                 WHERE id_avaliacao IN (SELECT id FROM {ids}) GROUP BY id_termo) r
+         WHERE t.id_termo = r.id_termo
+    """)
+    conn.execute(f"DELETE FROM tbl_fts_postagem WHERE id_avaliacao IN (SELECT id FROM {ids})")
+    conn.execute(f"""
+        UPDATE tbl_fts_estado
+           SET qtd_documentos = qtd_documentos - r.qtd, soma_tamanhos = soma_tamanhos - r.soma
+          FROM (SELECT count(*) AS qtd, coalesce(sum(tamanho), 0) AS soma FROM tbl_fts_documento
+                 WHERE id_avaliacao IN (SELECT id FROM {ids})) r
+    """)
+    conn.execute(f"DELETE FROM tbl_fts_documento WHERE id_avaliacao IN (SELECT id FROM {ids})")
+
+
+def _indexar(conn, filtro, stemming):
+    # indexa as avaliações que passam no filtro (sobre o alias a)
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _fts_docs AS
+        SELECT a.id_avaliacao, a.id_empresa, a.nota_geral,
+               {terms_sql('a.depoimento_geral', stemming)} AS termos
+          FROM tbl_avaliacao a
+         WHERE {filtro}
+    """)
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE _fts_novos AS
+        SELECT id_avaliacao, id_empresa, nota_geral, tamanho, termo, count(*) AS tf
+          FROM (SELECT id_avaliacao, id_empresa, nota_geral, len(termos) AS tamanho, unnest(termos) AS termo
+                  FROM _fts_docs)
+         GROUP BY ALL
+    """)
+    conn.execute("""
+        INSERT INTO tbl_fts_termo (termo, df)
+        SELECT termo, count(*) FROM _fts_novos GROUP BY termo
+        ON CONFLICT (termo) DO UPDATE SET df = tbl_fts_termo.df + EXCLUDED.df
+    """)
+    conn.execute("""
+        INSERT INTO tbl_fts_postagem
+        SELECT t.id_termo, n.id_avaliacao, n.tf, n.tamanho, n.id_empresa, n.nota_geral
+          FROM _fts_novos n
+          JOIN tbl_fts_termo t ON t.termo = n.termo
+         ORDER BY t.id_termo, n.id_avaliacao
+    """)
+    conn.execute("INSERT INTO tbl_fts_documento SELECT id_avaliacao, len(termos) FROM _fts_docs")
+    conn.execute("""
+        UPDATE tbl_fts_estado
+           SET qtd_documentos = qtd_documentos + r.qtd, soma_tamanhos = soma_tamanhos + r.soma
+          FROM (SELECT count(*) AS qtd, coalesce(sum(len(termos)), 0) AS soma FROM _fts_docs) r
+    """)
+    n = conn.execute("SELECT count(*) FROM _fts_docs").fetchone()[0]
+    conn.execute("DROP TABLE _fts_docs")
+    conn.execute("DROP TABLE _fts_novos")
+    return n
+
+
+def build_index(conn, stemming=False):
+    # (re)constrói o índice inteiro; a escolha de stemming vale para as
+    # atualizações seguintes
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        marcas = current_marks(conn, ['tbl_avaliacao'])
+        for tabela in ('tbl_fts_postagem', 'tbl_fts_documento', 'tbl_fts_termo', 'tbl_fts_estado'):
+            conn.execute(f"DELETE FROM {tabela}")
+        conn.execute("INSERT INTO tbl_fts_estado (id_estado, stemming) VALUES (1, ?)", [stemming])
+        n = _indexar(conn, 'TRUE', stemming)
+        save_marks(conn, CONSUMIDOR, marcas)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return n
+
+
+def update_index(conn):
+    # devolve quantas avaliações foram (re)indexadas; None se o índice
+    # ainda não foi construído
+    stemming = _stemming(conn)
+    if stemming is None:
+        return None
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        ultimo_id, ultimo_log = read_marks(conn, CONSUMIDOR, ['tbl_avaliacao'])['tbl_avaliacao']
+        novas = current_marks(conn, ['tbl_avaliacao'])
+        novas['tbl_avaliacao'] = (max(novas['tbl_avaliacao'][0], ultimo_id), novas['tbl_avaliacao'][1])
+
+        conn.execute(f"CREATE OR REPLACE TEMP TABLE _fts_alterados AS {logged_ids('tbl_avaliacao', ultimo_log)}")
+        if conn.execute("SELECT count(*) FROM _fts_alterados").fetchone()[0]:
+            _remover(conn, '_fts_alterados')
+        n = _indexar(conn, f"a.id_avaliacao > {ultimo_id} OR a.id_avaliacao IN (SELECT id FROM _fts_alterados)",
+                     stemming)
+        save_marks(conn, CONSUMIDOR, novas)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("DROP TABLE IF EXISTS _fts_alterados")
+    return n
+
+
+def search(conn, consulta, k=10, empresa=None, nota_min=None, nota_max=None, todos=False):
+    # avaliações mais relevantes para a consulta (BM25), como tabela Arrow;
+    # empresa aceita um id ou uma lista; todos=True exige todos os termos
+    stemming = _stemming(conn)
+    if stemming is None:
+        raise RuntimeError("Índice de busca não construído (build_index)")
+    termos = conn.execute(f"SELECT list_distinct({terms_sql('?', stemming)})", [consulta]).fetchone()[0]
+    vocabulario = conn.execute(
+        "SELECT id_termo, df FROM tbl_fts_termo WHERE termo IN (SELECT unnest(?::VARCHAR[])) AND df > 0",
+        [termos],
+    ).fetchall()
+    n, soma = conn.execute("SELECT qtd_documentos, soma_tamanhos FROM tbl_fts_estado").fetchone()
+    media = soma / n if n else 1.0
+
+    # idf calculado aqui e os ids como literais: a lista de postagens é
+    # ordenada por id_termo, então o filtro pula row groups pelo zonemap
+    if vocabulario:
+        idf = 'CASE p.id_termo ' + ' '.join(
+            f'WHEN {id_termo} THEN {math.log(1 + (n - df + 0.5) / (df + 0.5))!r}' for id_termo, df in vocabulario
+        ) + ' END'
+        filtros = [f"p.id_termo IN ({', '.join(str(id_termo) for id_termo, _ in vocabulario)})"]
+    else:
+        idf, filtros = '0', ['FALSE']
+    params = []
+    if empresa is not None:
+        filtros.append("p.id_empresa IN (SELECT unnest(?::INTEGER[]))")
+        params.append(list(empresa) if isinstance(empresa, (list, tuple, set)) else [empresa])
+    if nota_min is not None:
+        filtros.append("p.nota_geral >= ?")
+        params.append(nota_min)
+    if nota_max is not None:
+        filtros.append("p.nota_geral <= ?")
+        params.append(nota_max)
+    todos_termos = f"HAVING count(*) = {len(termos)}" if todos else ""
+    params.append(k)
+
+    return conn.execute(f"""
+        WITH pontos AS (
+            SELECT p.id_avaliacao,
+                   sum(({idf}) * p.tf * ({K1} + 1)
+                       / (p.tf + {K1} * (1 - {B} + {B} * p.tamanho / {media!r}))) AS score
+              FROM tbl_fts_postagem p
+             WHERE {' AND '.join(filtros)}
+             GROUP BY p.id_avaliacao
+             {todos_termos}
+             ORDER BY score DESC, p.id_avaliacao
+             LIMIT ?
+        )
+        SELECT a.id_avaliacao, a.id_empresa, a.nota_geral, round(s.score, 4) AS score, a.depoimento_geral
+          FROM pontos s
+          JOIN tbl_avaliacao a ON a.id_avaliacao = s.id_avaliacao
+         ORDER BY s.score DESC, a.id_avaliacao
+    """, params).to_arrow_table()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Busca textual nas avaliações (BM25)")
+    parser.add_argument('consulta', nargs='?')
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--construir', action='store_true', help="reconstrói o índice")
+    parser.add_argument('--stemming', action='store_true', help="com --construir: reduz plurais e -mente")
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--empresa', type=int, nargs='+')
+    parser.add_argument('--nota-min', type=int)
+    parser.add_argument('--nota-max', type=int)
+    parser.add_argument('--todos', action='store_true', help="exige todos os termos")
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    if args.construir:
+        print(f"Avaliações indexadas: {build_index(conn, args.stemming)}")
+    else:
+        n = update_index(conn)
+        if n:
+            print(f"Avaliações indexadas: {n}")
+    if args.consulta:
+        for linha in search(conn, args.consulta, args.k, args.empresa, args.nota_min,
+                            args.nota_max, args.todos).to_pylist():
+            print(f"{linha['score']:8.4f}  #{linha['id_avaliacao']} empresa {linha['id_empresa']} "
+                  f"nota {linha['nota_geral']}: {linha['depoimento_geral']}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
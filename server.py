@@ -0,0 +1,225 @@
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import duckdb
+import pyarrow as pa
+
+from cache import data_versions, dependencies
+
+# Servidor HTTP local (só a biblioteca padrão) para as views vw_* e as
+# tabelas mv_*.
+#
+#   GET /                          lista dos objetos expostos
+#   GET /<nome>                    resultado em JSON (lista de objetos)
+#   GET /<nome>?formato=ndjson     um objeto JSON por linha
+#   GET /<nome>?formato=arrow      stream Arrow IPC
+#   ...&limite=N                   só as N primeiras linhas
+#
+# O ETag sai das versões de dados (tbl_versao_dados) das tabelas que o
+# objeto lê, mais o formato e o limite; um If-None-Match igual recebe 304
+# sem que a consulta rode. As respostas vão em chunked transfer encoding, um
+# lote Arrow por vez, então nem o resultado inteiro nem o corpo inteiro
+# ficam na memória.
+#
+# Por padrão só escuta em 127.0.0.1 e abre o banco só para leitura. O
+# DuckDB não deixa outro processo abrir o arquivo para escrita enquanto
+# essa conexão existir: com o servidor no ar, cargas e refresh (cli.py
+# load/refresh) falham com erro de lock, e os dados e ETags ficam os da
+# partida. Para servir dados que mudam, rode a escrita no mesmo processo e
+# passe a conexão (ViewServer(conn=...)); as versões que ela grava mudam o
+# ETag na hora.
+BATCH_SIZE = 8192
+FORMATOS = {
+    'json': 'application/json; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+RE_OBJETO = re.compile(r'^(vw|mv)_\w+$')
+
+
+def _json(valor):
+    # datas, decimais e afins viram texto
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
+
+class _Chunked:
+    # arquivo que escreve cada write como um chunk HTTP/1.1; serve de
+    # destino para o escritor Arrow IPC
+    def __init__(self, saida):
+        self.saida = saida
+        self.closed = False
+
+    def write(self, dados):
+        dados = bytes(dados)
+        if dados:
+            self.saida.write(b'%x\r\n%s\r\n' % (len(dados), dados))
+        return len(dados)
+
+    def flush(self):
+        self.saida.flush()
+
+    def close(self):
+        if not self.closed:
+            self.saida.write(b'0\r\n\r\n')
+            self.closed = True
+
+
+class ViewServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, db_file='meu_banco.duckdb', host='127.0.0.1', porta=8765,
+                 batch_size=BATCH_SIZE, read_only=True, conn=None):
+        super().__init__((host, porta), _Handler)
+        self.conn = conn if conn is not None else duckdb.connect(db_file, read_only=read_only)
+        self._conn_propria = conn is None
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._objetos = None
+        self._dependencias = {}
+
+    def objetos(self):
+        with self._lock:
+            if self._objetos is None:
+                nomes = self.conn.cursor().execute("""
+                    SELECT view_name FROM duckdb_views() WHERE NOT internal
+                    UNION ALL
+                    SELECT table_name FROM duckdb_tables()
+                """).fetchall()
+                self._objetos = sorted(n for (n,) in nomes if RE_OBJETO.match(n))
+            return self._objetos
+
+    def etag(self, cursor, nome, formato, limite):
+        with self._lock:
+            deps = self._dependencias.get(nome)
+        if deps is None:
+            deps = dependencies(cursor, nome)
+            with self._lock:
+                self._dependencias[nome] = deps
+        versoes = data_versions(cursor, deps)
+        chave = _json([nome, formato, limite, list(zip(deps, versoes))])
+        return '"%s"' % hashlib.sha1(chave.encode()).hexdigest()[:20]
+
+    def server_close(self):
+        super().server_close()
+        if self._conn_propria:
+            self.conn.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ViewServer'
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _erro(self, status, mensagem):
+        corpo = _json({'erro': mensagem}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', FORMATOS['json'])
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        nome = url.path.strip('/')
+        if not nome:
+            corpo = _json(self.server.objetos()).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', FORMATOS['json'])
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+            return
+        if nome not in self.server.objetos():
+            return self._erro(404, f"View desconhecida: {nome}")
+
+        parametros = parse_qs(url.query)
+        formato = parametros.get('formato', ['json'])[0]
+        if formato not in FORMATOS:
+            return self._erro(400, f"Formato inválido: {formato} (use {', '.join(FORMATOS)})")
+        try:
+            limite = int(parametros['limite'][0]) if 'limite' in parametros else None
+        except ValueError:
+            return self._erro(400, "limite deve ser inteiro")
+        if limite is not None and limite < 0:
+            return self._erro(400, "limite não pode ser negativo")
+
+        cursor = self.server.conn.cursor()
+        try:
+            etag = self.server.etag(cursor, nome, formato, limite)
+            if etag in [e.strip() for e in self.headers.get('If-None-Match', '').split(',')]:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            sql = f"SELECT * FROM {nome}" + (f" LIMIT {limite}" if limite is not None else "")
+            try:
+                reader = cursor.execute(sql).to_arrow_reader(self.server.batch_size)
+            except duckdb.Error as erro:
+                return self._erro(500, str(erro))
+
+            self.send_response(200)
+            self.send_header('Content-Type', FORMATOS[formato])
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            saida = _Chunked(self.wfile)
+            if formato == 'arrow':
+                with pa.ipc.new_stream(saida, reader.schema) as escritor:
+                    for batch in reader:
+                        escritor.write_batch(batch)
+            else:
+                separador = '\n' if formato == 'ndjson' else ','
+                primeira = True
+                if formato == 'json':
+                    saida.write(b'[')
+                for batch in reader:
+                    linhas = [_json(linha) for linha in batch.to_pylist()]
+                    if linhas:
+                        texto = separador.join(linhas)
+                        if formato == 'ndjson':
+                            texto += '\n'
+                        elif not primeira:
+                            texto = ',' + texto
+                        saida.write(texto.encode())
+                        primeira = False
+                if formato == 'json':
+                    saida.write(b']')
+            saida.close()
+        except (BrokenPipeError, ConnectionResetError, duckdb.Error):
+            # cliente desistiu ou a consulta falhou no meio do stream: sem o
+            # chunk final, o cliente vê a resposta incompleta
+            self.close_connection = True
+        finally:
+            cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HTTP das views vw_* e tabelas mv_*")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE, help="linhas por lote/chunk")
+    args = parser.parse_args(argv)
+
+    servidor = ViewServer(args.db, args.host, args.porta, args.batch)
+    print(f"Servindo {args.db} em http://{args.host}:{args.porta}/")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import pyarrow as pa
+
+import index
+from migrations import apply_views, migrate
+from refresh import init_refresh
+from rollup import update_rollup
+
+# Banco particionado em vários arquivos (shards) com consultas
+# scatter-gather.
+#
+# As empresas são divididas por estado (estados inteiros, balanceados pelo
+# número de avaliações) ou por hash(id_empresa); cada shard leva suas
+# empresas com os vínculos, avaliações e benefícios delas, então as junções
+# por (usuário, empresa) das views continuam locais. As dimensões e os
+# usuários (avaliam empresas de estados diferentes) são replicados em todos.
+#
+# Os shards são cópias derivadas do banco principal, só para leitura: as
+# sequences não são coordenadas entre eles, então escritas vão no banco
+# principal e os shards são recriados.
+#
+# Cada view vw_* tem uma consulta parcial, que roda em todos os shards em
+# paralelo (um processo por shard), e uma final, que junta as parciais
+# (tabela "parciais") num DuckDB em memória. Médias viram soma + contagem e
+# COUNT(DISTINCT) viaja como lista de ids distintos, nunca como média de
+# médias ou soma de contagens distintas.
+MANIFESTO = 'shards.json'
+REPLICADAS = ['tbl_usuario', 'tbl_senioridade', 'tbl_cargo_especialidade', 'tbl_beneficio']
+
+
+def _somada(view, chave, valor, ordem):
+    # views aditivas: a parcial é a própria view, a final soma por chave
+    return (f"SELECT * FROM {view}",
+            f"SELECT {chave}, SUM({valor})::BIGINT AS {valor} FROM parciais GROUP BY {chave} ORDER BY {ordem}")
+
+
+# view -> (consulta parcial em cada shard, consulta final sobre "parciais")
+CONSULTAS = {
+    'vw_beneficios_mais_oferecidos_boas_notas': _somada(
+        'vw_beneficios_mais_oferecidos_boas_notas', 'ds_beneficio', 'qtd', 'qtd DESC'),
+    'vw_problemas_pj': _somada('vw_problemas_pj', 'problema_pj', 'qtd', 'qtd DESC'),
+    # empate na contagem: a empresa de menor id primeiro, como na view e no
+    # relatório fundido; o menor id de cada nome viaja na parcial
+    'vw_empresas_clt_mascarado_pj': ("""
+        SELECT e.nm_fantasia_empresa AS empresa, COUNT(*) AS qtd_clt_mascarado, min(e.id_empresa) AS min_id
+          FROM tbl_avaliacao a JOIN tbl_empresa e ON a.id_empresa = e.id_empresa
+         WHERE a.cod_problema_pj = 2
+         GROUP BY e.nm_fantasia_empresa
+    """, """
+        SELECT empresa, SUM(qtd_clt_mascarado)::BIGINT AS qtd_clt_mascarado
+          FROM parciais GROUP BY empresa ORDER BY qtd_clt_mascarado DESC, min(min_id)
+    """),
+    'vw_empresas_maior_retencao': _somada(
+        'vw_empresas_maior_retencao', 'empresa', 'total_emprego_atual', 'total_emprego_atual DESC'),
+    'vw_distribuicao_clt_pj': ("SELECT * FROM vw_distribuicao_clt_pj", """
+        SELECT empresa, SUM(total_clt)::BIGINT AS total_clt, SUM(total_pj)::BIGINT AS total_pj
+          FROM parciais GROUP BY empresa ORDER BY empresa
+    """),
+    'vw_media_salario_cargo_senioridade': ("""
+        SELECT ce.ds_cargo_especialidade AS cargo, s.ds_senioridade AS senioridade,
+               SUM(r.soma) AS soma, SUM(r.qtd) AS qtd
+          FROM tbl_rollup_vinculo r
+          JOIN tbl_cargo_especialidade ce ON r.id_cargo_especialidade = ce.id_cargo_especialidade
+          JOIN tbl_senioridade s ON r.id_senioridade = s.id_senioridade
+         GROUP BY ce.ds_cargo_especialidade, s.ds_senioridade
+    """, """
+        SELECT cargo, senioridade, ROUND((SUM(soma) / SUM(qtd))::numeric, 2) AS media_salarial
+          FROM parciais GROUP BY cargo, senioridade
+    """),
+    'vw_tempo_medio_promocao_senioridade': ("""
+        SELECT s.ds_senioridade AS senioridade,
+               SUM(a.tempo_primeira_promocao) AS soma, COUNT(a.tempo_primeira_promocao) AS qtd
+          FROM tbl_avaliacao a
+          JOIN tbl_vinculo_usuario_empresa vue ON vue.id_vinculo = a.id_vinculo
+          JOIN tbl_senioridade s ON vue.id_senioridade = s.id_senioridade
+         WHERE a.tempo_primeira_promocao IS NOT NULL
+         GROUP BY s.ds_senioridade
+    """, """
+        SELECT senioridade, ROUND((SUM(soma) / SUM(qtd))::numeric, 2) AS media_meses_promocao
+          FROM parciais GROUP BY senioridade ORDER BY media_meses_promocao
+    """),
+    'vw_empresas_satisfacao_alta': ("""
+        SELECT e.nm_fantasia_empresa AS empresa, SUM(r.soma) AS soma, SUM(r.qtd) AS qtd
+          FROM tbl_rollup_nota r
+          JOIN tbl_empresa e ON r.id_empresa = e.id_empresa
+         GROUP BY e.nm_fantasia_empresa
+    """, """
+        SELECT empresa, ROUND((SUM(soma) / SUM(qtd))::numeric, 2) AS media_nota
+          FROM parciais GROUP BY empresa
+        HAVING SUM(soma) / SUM(qtd) > 4
+         ORDER BY media_nota DESC
+    """),
+    'vw_tempo_primeiro_aumento_dev': ("""
+        SELECT s.ds_senioridade AS senioridade, SUM(r.soma) AS soma, SUM(r.qtd) AS qtd
+          FROM tbl_rollup_aumento r
+          JOIN tbl_cargo_especialidade ce ON r.id_cargo_especialidade = ce.id_cargo_especialidade
+          JOIN tbl_senioridade s ON r.id_senioridade = s.id_senioridade
+         WHERE ce.ds_cargo_especialidade ILIKE '%desenvolvedor%'
+           AND s.ds_senioridade IN ('Júnior', 'Pleno', 'Sênior')
+         GROUP BY s.ds_senioridade
+    """, """
+        SELECT senioridade, ROUND((SUM(soma) / SUM(qtd))::numeric, 2) AS media_meses_aumento
+          FROM parciais GROUP BY senioridade ORDER BY senioridade
+    """),
+    'vw_percentual_hora_extra_remunerada': ("""
+        SELECT (SELECT COUNT(*) FROM tbl_empresa) AS total_emp,
+               (SELECT list(DISTINCT a.id_empresa) FROM tbl_avaliacao a
+                 WHERE a.faz_hora_extra = TRUE AND a.hora_extra_remunerada = TRUE) AS rem,
+               (SELECT list(DISTINCT a.id_empresa) FROM tbl_avaliacao a
+                 WHERE a.faz_hora_extra = TRUE AND a.hora_extra_remunerada = FALSE) AS nao_rem
+    """, """
+        WITH base AS (
+          SELECT (SELECT SUM(total_emp) FROM parciais) AS total_emp,
+                 (SELECT COUNT(DISTINCT id) FROM (SELECT unnest(rem) AS id FROM parciais)) AS total_rem,
+                 (SELECT COUNT(DISTINCT id) FROM (SELECT unnest(nao_rem) AS id FROM parciais)) AS total_nao_rem
+        )
+        SELECT 'Remunerado' AS categoria,
+               CASE WHEN total_emp = 0 THEN 0
+                    ELSE ROUND((total_rem * 100.0 / total_emp), 2)
+               END AS percentual
+        FROM base
+        UNION ALL
+        SELECT 'Não Remunerado' AS categoria,
+               CASE WHEN total_emp = 0 THEN 0
+                    ELSE ROUND((total_nao_rem * 100.0 / total_emp), 2)
+               END AS percentual
+        FROM base
+    """),
+}
+
+
+def _estados_por_shard(conn, n):
+    # estados inteiros, do maior para o menor, sempre no shard mais leve
+    estados = conn.execute("""
+        SELECT e.estado_empresa, count(a.id_avaliacao) AS peso
+          FROM tbl_empresa e LEFT JOIN tbl_avaliacao a ON a.id_empresa = e.id_empresa
+         GROUP BY e.estado_empresa
+         ORDER BY peso DESC, e.estado_empresa
+    """).fetchall()
+    if len(estados) < n:
+        raise ValueError(f"Só há {len(estados)} estados para {n} shards")
+    cargas = [0] * n
+    destino = {}
+    for estado, peso in estados:
+        shard = cargas.index(min(cargas))
+        destino[estado] = shard
+        cargas[shard] += peso
+    return destino
+
+
+def create_shards(db_file, destino='shards', n=4, por='hash'):
+    # devolve o manifesto; os arquivos antigos do diretório são trocados
+    origem = duckdb.connect(db_file, read_only=True)
+    estados = _estados_por_shard(origem, n) if por == 'estado' else None
+    origem.close()
+    if por == 'estado':
+        regra = "CASE e.estado_empresa " + ' '.join(
+            f"WHEN '{estado}' THEN {shard}" for estado, shard in estados.items()) + " END"
+    elif por == 'hash':
+        regra = f"hash(e.id_empresa) % {n}"
+    else:
+        raise ValueError(f"Particionamento desconhecido: {por}")
+
+    os.makedirs(destino, exist_ok=True)
+    arquivos = []
+    for shard in range(n):
+        arquivo = os.path.join(destino, f'shard_{shard}.duckdb')
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
+        conn = duckdb.connect(arquivo)
+        migrate(conn, index.MIGRATIONS)
+        conn.execute(f"ATTACH '{os.path.abspath(db_file)}' AS origem (READ_ONLY)")
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            for tabela in REPLICADAS:
+                conn.execute(f"INSERT INTO {tabela} SELECT * FROM origem.{tabela}")
+            conn.execute(f"INSERT INTO tbl_empresa SELECT * FROM origem.tbl_empresa e WHERE {regra} = {shard}")
+            for tabela in ('tbl_vinculo_usuario_empresa', 'tbl_avaliacao'):
+                conn.execute(f"""
+                    INSERT INTO {tabela} SELECT * FROM origem.{tabela}
+                     WHERE id_empresa IN (SELECT id_empresa FROM tbl_empresa)
+                """)
+            conn.execute("""
+                INSERT INTO tbl_avaliacao_beneficio SELECT * FROM origem.tbl_avaliacao_beneficio
+                 WHERE id_avaliacao IN (SELECT id_avaliacao FROM tbl_avaliacao)
+            """)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH origem")
+        apply_views(conn, index.VIEWS)
+        init_refresh(conn)
+        update_rollup(conn)
+        conn.execute("CHECKPOINT")
+        conn.close()
+        arquivos.append(os.path.basename(arquivo))
+
+    manifesto = {
+        'origem': os.path.abspath(db_file),
+        'por': por,
+        'arquivos': arquivos,
+        'estados': estados,
+        'dt_criacao': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(destino, MANIFESTO), 'w') as arquivo:
+        json.dump(manifesto, arquivo, indent=2, ensure_ascii=False)
+    return manifesto
+
+
+# uma conexão por shard em cada processo do pool
+_conexoes = {}
+
+
+def _parcial(arquivo, sql):
+    conn = _conexoes.get(arquivo)
+    if conn is None:
+        conn = _conexoes[arquivo] = duckdb.connect(arquivo, read_only=True)
+    return conn.execute(sql).to_arrow_table()
+
+
+class ShardedDatabase:
+    def __init__(self, destino='shards', workers=None):
+        with open(os.path.join(destino, MANIFESTO)) as arquivo:
+            self.manifesto = json.load(arquivo)
+        self.arquivos = [os.path.join(destino, nome) for nome in self.manifesto['arquivos']]
+        self._pool = ProcessPoolExecutor(workers or len(self.arquivos))
+        self._local = duckdb.connect()
+
+    def _juntar(self, view, parciais):
+        self._local.register('parciais', pa.concat_tables(parciais))
+        try:
+            return self._local.execute(CONSULTAS[view][1]).to_arrow_table()
+        finally:
+            self._local.unregister('parciais')
+
+    def fetch_views(self, views=None):
+        # {view: tabela Arrow}; todas as parciais são disparadas de uma vez
+        views = list(CONSULTAS) if views is None else views
+        for view in views:
+            if view not in CONSULTAS:
+                raise ValueError(f"View sem consulta distribuída: {view}")
+        futuros = {
+            view: [self._pool.submit(_parcial, arquivo, CONSULTAS[view][0]) for arquivo in self.arquivos]
+            for view in views
+        }
+        return {view: self._juntar(view, [f.result() for f in lista]) for view, lista in futuros.items()}
+
+    def fetch_view(self, view):
+        return self.fetch_views([view])[view]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._local.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shards do banco e consultas scatter-gather")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p = sub.add_parser('criar', help="divide o banco principal em shards")
+    p.add_argument('--db', default='meu_banco.duckdb')
+    p.add_argument('--destino', default='shards')
+    p.add_argument('-n', type=int, default=4)
+    p.add_argument('--por', choices=['estado', 'hash'], default='hash')
+    p = sub.add_parser('consultar', help="roda views vw_* em todos os shards")
+    p.add_argument('views', nargs='*')
+    p.add_argument('--destino', default='shards')
+    p.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+
+    if args.comando == 'criar':
+        manifesto = create_shards(args.db, args.destino, args.n, args.por)
+        print(f"{len(manifesto['arquivos'])} shards em {args.destino} (por {args.por})")
+        return 0
+    with ShardedDatabase(args.destino, args.workers) as banco:
+        for view, tabela in banco.fetch_views(args.views or None).items():
+            print(f"{view}:")
+            for linha in tabela.to_pylist():
+                print("  " + ", ".join(str(v) for v in linha.values()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
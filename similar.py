@@ -0,0 +1,356 @@
+import argparse
+import sys
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import scipy.sparse as sp
+
+from cache import bump_versions
+from generate import insert_arrow
+from lookup import LookupService
+from refresh import changed_companies, current_marks, read_marks, save_marks
+
+# "Empresas parecidas": os VIZINHOS vizinhos mais próximos de cada empresa
+# pelo cosseno entre perfis, pré-calculados em tbl_empresa_similar.
+#
+# O perfil de uma empresa (tbl_empresa_perfil) é a fração das avaliações
+# dela em cada atributo: benefício citado, nota, situação da hora extra e
+# problema PJ. Na montagem da matriz esparsa (uma linha por empresa) cada
+# grupo de atributos é normalizado e pesado por PESOS, e a linha toda
+# normalizada: o cosseno vira produto escalar.
+#
+# Os produtos são feitos em blocos de linhas contra a matriz inteira; o
+# bloco é dimensionado para o resultado denso caber em `memoria` bytes, e
+# de cada bloco só sobram os k maiores por linha. Com poucos atributos
+# (até DENSO colunas) a matriz vai para denso e o produto usa BLAS.
+#
+# update_similar() é incremental: as empresas com avaliações novas ou
+# alteradas (marcas e log, como os rollups) têm o perfil e a lista
+# refeitos; nas demais, a lista guardada é mesclada com a similaridade
+# nova com essas empresas. Se um vizinho da lista cheia ficou menos
+# parecido, quem estava fora pode ter entrado: essa lista é refeita contra
+# todas. Acima de FRACAO_COMPLETO das empresas tocadas, refaz tudo.
+CONSUMIDOR = 'similar'
+ORIGENS = ['tbl_avaliacao']
+VIZINHOS = 10
+MEMORIA = 256 * 2**20
+DENSO = 1024
+FRACAO_COMPLETO = 0.2
+PESOS = {'beneficio': 2.0, 'nota': 1.0, 'hora_extra': 0.5, 'problema_pj': 0.5}
+
+SIMILAR_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_empresa_perfil (
+    id_empresa INTEGER NOT NULL,
+    atributo VARCHAR(30) NOT NULL,
+    valor DOUBLE NOT NULL,
+    PRIMARY KEY (id_empresa, atributo)
+);
+
+CREATE TABLE IF NOT EXISTS tbl_empresa_similar (
+    id_empresa INTEGER NOT NULL,
+    posicao SMALLINT NOT NULL,
+    id_similar INTEGER NOT NULL,
+    similaridade DOUBLE NOT NULL,
+    PRIMARY KEY (id_empresa, posicao)
+);
+"""
+
+# atributo = '<grupo>:<valor>'; {filtro} usa o alias a
+PERFIL_SQL = r"""
+WITH a AS (
+    SELECT a.id_avaliacao, a.id_empresa, a.nota_geral, a.faz_hora_extra,
+           a.hora_extra_remunerada, a.cod_problema_pj
+      FROM tbl_avaliacao a
+     WHERE {filtro}
+),
+contagens AS (
+    SELECT id_empresa, 'nota:' || nota_geral AS atributo, count(*) AS qtd
+      FROM a GROUP BY ALL
+    UNION ALL
+    SELECT id_empresa,
+           'hora_extra:' || CASE WHEN NOT faz_hora_extra THEN 'nao'
+                                 WHEN hora_extra_remunerada THEN 'remunerada'
+                                 ELSE 'nao_remunerada' END,
+           count(*)
+      FROM a GROUP BY ALL
+    UNION ALL
+    SELECT id_empresa, 'problema_pj:' || cod_problema_pj, count(*)
+      FROM a WHERE cod_problema_pj IS NOT NULL GROUP BY ALL
+    UNION ALL
+    SELECT a.id_empresa, 'beneficio:' || ab.id_beneficio, count(*)
+      FROM a JOIN tbl_avaliacao_beneficio ab ON ab.id_avaliacao = a.id_avaliacao
+     GROUP BY ALL
+)
+SELECT c.id_empresa, c.atributo, c.qtd / t.qtd AS valor
+  FROM contagens c
+  JOIN (SELECT id_empresa, count(*) AS qtd FROM a GROUP BY id_empresa) t
+    ON t.id_empresa = c.id_empresa
+ ORDER BY c.id_empresa, c.atributo
+"""
+
+
+def _gravar_perfis(conn, empresas=None):
+    # empresas: tabela temporária com a coluna id; None refaz todos
+    if empresas is None:
+        conn.execute("DELETE FROM tbl_empresa_perfil")
+        filtro = 'TRUE'
+    else:
+        conn.execute(f"DELETE FROM tbl_empresa_perfil WHERE id_empresa IN (SELECT id FROM {empresas})")
+        filtro = f"a.id_empresa IN (SELECT id FROM {empresas})"
+    conn.execute(f"INSERT INTO tbl_empresa_perfil {PERFIL_SQL.format(filtro=filtro)}")
+
+
+def load_matrix(conn):
+    # (ids em ordem, matriz N x atributos com linhas de norma 1); densa
+    # quando há até DENSO atributos
+    perfis = conn.execute(
+        "SELECT id_empresa, atributo, valor FROM tbl_empresa_perfil ORDER BY id_empresa"
+    ).fetchnumpy()
+    ids, linhas = np.unique(perfis['id_empresa'], return_inverse=True)
+    atributos, colunas = np.unique(np.asarray(perfis['atributo'], dtype=str), return_inverse=True)
+    valores = np.asarray(perfis['valor'], dtype=np.float64)
+
+    grupos, grupo_da_coluna = np.unique(np.char.partition(atributos, ':')[:, 0], return_inverse=True)
+    peso = np.array([PESOS.get(g, 1.0) for g in grupos])
+    grupo = grupo_da_coluna[colunas]
+    # cada grupo com norma = peso, depois a linha inteira com norma 1
+    norma_grupo = np.zeros((len(ids), len(grupos)))
+    np.add.at(norma_grupo, (linhas, grupo), valores ** 2)
+    valores = valores * peso[grupo] / np.sqrt(norma_grupo[linhas, grupo])
+    norma_linha = np.zeros(len(ids))
+    np.add.at(norma_linha, linhas, valores ** 2)
+    valores = valores / np.sqrt(norma_linha[linhas])
+
+    matriz = sp.csr_matrix((valores.astype(np.float32), (linhas, colunas)), shape=(len(ids), len(atributos)))
+    if len(atributos) <= DENSO:
+        matriz = matriz.toarray()
+    return ids, matriz
+
+
+def _bloco(n_colunas, memoria):
+    # linhas por bloco: similaridades (float32), índices da partição (int64)
+    # e folga para os temporários do produto
+    return max(1, memoria // (16 * max(n_colunas, 1)))
+
+
+def _produto(matriz, linhas, colunas=None):
+    # similaridades densas (linhas x colunas) em float32
+    direita = matriz if colunas is None else matriz[colunas]
+    produto = matriz[linhas] @ direita.T
+    return np.asarray(produto.toarray() if sp.issparse(produto) else produto, dtype=np.float32)
+
+
+def _top(sims, indices, k):
+    # k maiores por linha em ordem decrescente; -inf marca posição vazia.
+    # A partição pega as k últimas posições, sem copiar sims negada
+    n = sims.shape[1]
+    k = min(k, n)
+    if k == 0:
+        return np.empty((len(sims), 0), np.int64), np.empty((len(sims), 0), np.float32)
+    parte = np.argpartition(sims, n - k, axis=1)[:, n - k:]
+    parte_sims = np.take_along_axis(sims, parte, axis=1)
+    ordem = np.argsort(-parte_sims, axis=1, kind='stable')
+    parte = np.take_along_axis(parte, ordem, axis=1)
+    escolhidos = parte if indices is None else np.take_along_axis(indices, parte, axis=1)
+    return escolhidos, np.take_along_axis(parte_sims, ordem, axis=1)
+
+
+def neighbors(matriz, linhas, k=VIZINHOS, memoria=MEMORIA):
+    # (vizinhos, similaridades) das linhas contra todas, em blocos
+    n = matriz.shape[0]
+    tamanho = _bloco(n, memoria)
+    vizinhos, similaridades = [], []
+    for inicio in range(0, len(linhas), tamanho):
+        bloco = linhas[inicio:inicio + tamanho]
+        sims = _produto(matriz, bloco)
+        sims[np.arange(len(bloco)), bloco] = -np.inf
+        v, s = _top(sims, None, k)
+        # cosseno zero: nada em comum, não é vizinho
+        s[s <= 0] = -np.inf
+        vizinhos.append(v)
+        similaridades.append(s)
+    if not vizinhos:
+        return np.empty((0, min(k, n)), np.int64), np.empty((0, min(k, n)), np.float32)
+    return np.vstack(vizinhos), np.vstack(similaridades)
+
+
+def _gravar(conn, ids, linhas, vizinhos, similaridades):
+    # troca as listas das empresas das linhas
+    validas = np.isfinite(similaridades)
+    n_por_linha = validas.sum(axis=1)
+    id_empresa = np.repeat(ids[linhas], n_por_linha)
+    posicao = (np.cumsum(validas, axis=1) - 1)[validas] + 1
+    conn.register('_similar_trocar', pa.table({'id': pa.array(ids[linhas], pa.int32())}))
+    conn.execute("DELETE FROM tbl_empresa_similar WHERE id_empresa IN (SELECT id FROM _similar_trocar)")
+    conn.unregister('_similar_trocar')
+    if len(id_empresa):
+        insert_arrow(conn, 'tbl_empresa_similar', pa.table({
+            'id_empresa': pa.array(id_empresa, pa.int32()),
+            'posicao': pa.array(posicao, pa.int16()),
+            'id_similar': pa.array(ids[vizinhos[validas]], pa.int32()),
+            'similaridade': pa.array(similaridades[validas], pa.float64()),
+        }))
+
+
+def _listas(conn, ids, k):
+    # listas guardadas como linhas da matriz atual: (vizinhos, sims), N x k;
+    # vizinho que perdeu o perfil vira -1, posição vazia fica com -inf
+    guardadas = conn.execute(
+        f"SELECT id_empresa, posicao, id_similar, similaridade FROM tbl_empresa_similar WHERE posicao <= {k}"
+    ).fetchnumpy()
+    vizinhos = np.full((len(ids), k), -1, dtype=np.int64)
+    sims = np.full((len(ids), k), -np.inf, dtype=np.float32)
+    linha = np.searchsorted(ids, guardadas['id_empresa'])
+    achada = (linha < len(ids)) & (ids[np.minimum(linha, len(ids) - 1)] == guardadas['id_empresa'])
+    vizinho = np.searchsorted(ids, guardadas['id_similar'])
+    existe = (vizinho < len(ids)) & (ids[np.minimum(vizinho, len(ids) - 1)] == guardadas['id_similar'])
+    posicao = guardadas['posicao'].astype(np.int64) - 1
+    vizinhos[linha[achada], posicao[achada]] = np.where(existe[achada], vizinho[achada], -1)
+    sims[linha[achada], posicao[achada]] = guardadas['similaridade'][achada]
+    return vizinhos, sims
+
+
+def _mesclar(conn, ids, matriz, tocadas, k, memoria):
+    # listas das linhas fora de tocadas depois que os perfis de tocadas
+    # mudaram; devolve quantas foram reescritas
+    antigos, antigas = _listas(conn, ids, k)
+    em_tocadas = np.zeros(len(ids), dtype=bool)
+    em_tocadas[tocadas] = True
+    coluna = np.full(len(ids), -1, dtype=np.int64)
+    coluna[tocadas] = np.arange(len(tocadas))
+
+    demais = np.flatnonzero(~em_tocadas)
+    tamanho = _bloco(len(tocadas) + k, memoria)
+    trocar, refazer = [], []
+    for inicio in range(0, len(demais), tamanho):
+        bloco = demais[inicio:inicio + tamanho]
+        novas = _produto(matriz, bloco, tocadas)
+        novas[novas <= 0] = -np.inf
+        viz, sim = antigos[bloco], antigas[bloco]
+        # vizinho guardado que mudou (ou sumiu): a similaridade nova sai de novas
+        mudou = (viz == -1) & np.isfinite(sim) | (viz >= 0) & em_tocadas[np.maximum(viz, 0)]
+        atual = np.where(
+            mudou,
+            np.take_along_axis(novas, np.maximum(coluna[np.maximum(viz, 0)], 0), axis=1),
+            sim,
+        )
+        atual[mudou & (viz == -1)] = -np.inf
+        cheia = np.isfinite(sim).all(axis=1)
+        caiu = cheia & (mudou & (atual < sim)).any(axis=1)
+
+        candidatos = np.hstack([np.where(mudou, -1, viz), np.broadcast_to(tocadas, novas.shape)])
+        candidatas = np.hstack([np.where(mudou, -np.inf, sim), novas])
+        viz_novos, sim_novas = _top(candidatas, candidatos, k)
+        if viz_novos.shape[1] < k:
+            viz_novos = np.pad(viz_novos, ((0, 0), (0, k - viz_novos.shape[1])), constant_values=-1)
+            sim_novas = np.pad(sim_novas, ((0, 0), (0, k - sim_novas.shape[1])), constant_values=-np.inf)
+        viz_novos[~np.isfinite(sim_novas)] = -1
+        diferente = ((viz_novos != np.where(np.isfinite(sim), viz, -1)) | (sim_novas != sim)).any(axis=1)
+
+        refazer.append(bloco[caiu])
+        fica = ~caiu & diferente
+        if fica.any():
+            trocar.append((bloco[fica], viz_novos[fica], sim_novas[fica]))
+
+    for linhas, viz, sim in trocar:
+        _gravar(conn, ids, linhas, viz, sim)
+    refazer = np.concatenate(refazer) if refazer else np.empty(0, np.int64)
+    if len(refazer):
+        _gravar(conn, ids, refazer, *neighbors(matriz, refazer, k, memoria))
+    return sum(len(linhas) for linhas, _, _ in trocar) + len(refazer)
+
+
+def update_similar(conn, k=VIZINHOS, memoria=MEMORIA):
+    # devolve o número de empresas cuja lista foi reescrita
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        marcas = read_marks(conn, CONSUMIDOR, ORIGENS)
+        novas = {
+            table: (max(ultimo_id, marcas[table][0]), ultimo_log)
+            for table, (ultimo_id, ultimo_log) in current_marks(conn, ORIGENS).items()
+        }
+        id_avaliacao = marcas['tbl_avaliacao'][0]
+        alterados, sumidos = changed_companies(conn, marcas, '_similar_tocadas')
+        conn.execute(f"""
+            INSERT INTO _similar_tocadas
+            SELECT DISTINCT id_empresa FROM tbl_avaliacao WHERE id_avaliacao > {id_avaliacao}
+            EXCEPT SELECT id FROM _similar_tocadas
+        """)
+        tocadas = np.array([r[0] for r in conn.execute("SELECT id FROM _similar_tocadas").fetchall()], dtype=np.int64)
+
+        reescritas = 0
+        if sumidos or len(tocadas):
+            completo = sumidos or id_avaliacao == 0
+            _gravar_perfis(conn, None if completo else '_similar_tocadas')
+            ids, matriz = load_matrix(conn)
+            linhas = np.flatnonzero(np.isin(ids, tocadas))
+            if completo or len(linhas) > FRACAO_COMPLETO * len(ids):
+                conn.execute("DELETE FROM tbl_empresa_similar")
+                linhas = np.arange(len(ids))
+            else:
+                # empresas que perderam todas as avaliações não têm mais perfil
+                conn.execute("""
+                    DELETE FROM tbl_empresa_similar
+                     WHERE id_empresa IN (SELECT id FROM _similar_tocadas)
+                       AND id_empresa NOT IN (SELECT id_empresa FROM tbl_empresa_perfil)
+                """)
+                reescritas += _mesclar(conn, ids, matriz, linhas, k, memoria)
+            _gravar(conn, ids, linhas, *neighbors(matriz, linhas, k, memoria))
+            reescritas += len(linhas)
+            bump_versions(conn, ['tbl_empresa_similar'])
+        save_marks(conn, CONSUMIDOR, novas)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    conn.execute("DROP TABLE IF EXISTS _similar_tocadas")
+    return reescritas
+
+
+def rebuild_similar(conn, k=VIZINHOS, memoria=MEMORIA):
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        _gravar_perfis(conn)
+        ids, matriz = load_matrix(conn)
+        conn.execute("DELETE FROM tbl_empresa_similar")
+        tamanho = _bloco(len(ids), memoria)
+        # grava bloco a bloco: nunca há mais que um bloco de listas na memória
+        for inicio in range(0, len(ids), tamanho):
+            linhas = np.arange(inicio, min(inicio + tamanho, len(ids)))
+            _gravar(conn, ids, linhas, *neighbors(matriz, linhas, k, memoria))
+        bump_versions(conn, ['tbl_empresa_similar'])
+        save_marks(conn, CONSUMIDOR, current_marks(conn, ORIGENS))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Empresas parecidas pelo perfil das avaliações")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--empresa', type=int, help="mostra as parecidas com esta empresa")
+    parser.add_argument('--completo', action='store_true', help="recalcula todas as listas")
+    parser.add_argument('--memoria-mb', type=int, default=MEMORIA // 2**20)
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    memoria = args.memoria_mb * 2**20
+    if args.completo:
+        print(f"Listas recalculadas: {rebuild_similar(conn, memoria=memoria)}")
+    else:
+        print(f"Listas reescritas: {update_similar(conn, memoria=memoria)}")
+    if args.empresa is not None:
+        with LookupService(conn) as lookups:
+            similares = lookups.execute('empresa_similares', args.empresa)
+        for linha in similares:
+            print(f"{linha['posicao']:>3}  {linha['nm_fantasia_empresa']}  {linha['similaridade']}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
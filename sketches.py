@@ -0,0 +1,309 @@
+import argparse
+import math
+import sys
+
+import duckdb
+import pyarrow as pa
+
+from refresh import changed_companies, current_marks, read_marks, save_marks
+
+# Modo aproximado (opcional) com sketches para contagens distintas e quantis.
+#
+# Os sketches ficam no próprio banco, por empresa (e cargo × senioridade nos
+# salários), uma linha por registrador/balde, então juntar empresas é um
+# GROUP BY: max(posto) no HyperLogLog e sum(qtd) nos quantis.
+#
+# - HyperLogLog com 2^P registradores sobre hash() do DuckDB (64 bits):
+#   erro padrão relativo 1.04/sqrt(2^P), ~1,6% com P = 12.
+# - Quantis num histograma de baldes logarítmicos (DDSketch): o valor
+#   devolvido fica a no máximo ALFA (1%) do valor exato, em erro relativo.
+#   Só valores positivos entram.
+#
+# Nada é mantido até build_sketches(); depois disso update_sketches() segue
+# as marcas como os rollups (novas linhas somam, empresas alteradas são
+# recalculadas). Cada resultado volta com seus limites de erro.
+CONSUMIDOR = 'sketch'
+ORIGENS = ['tbl_vinculo_usuario_empresa', 'tbl_avaliacao']
+P = 12
+M = 2 ** P
+ALFA = 0.01
+GAMA = (1 + ALFA) / (1 - ALFA)
+
+SKETCH_DDL = r"""
+CREATE TABLE IF NOT EXISTS tbl_sketch_hll (
+    nm_metrica VARCHAR(60) NOT NULL,
+    id_empresa INTEGER NOT NULL,
+    registro SMALLINT NOT NULL,
+    posto TINYINT NOT NULL,
+    PRIMARY KEY (nm_metrica, id_empresa, registro)
+);
+
+CREATE TABLE IF NOT EXISTS tbl_sketch_quantil (
+    nm_metrica VARCHAR(60) NOT NULL,
+    id_empresa INTEGER NOT NULL,
+    id_cargo_especialidade INTEGER NOT NULL,
+    id_senioridade INTEGER NOT NULL,
+    balde SMALLINT NOT NULL,
+    qtd BIGINT NOT NULL,
+    PRIMARY KEY (nm_metrica, id_empresa, id_cargo_especialidade, id_senioridade, balde)
+);
+"""
+
+# alias -> (tabela de origem, coluna id)
+ALIASES = {
+    'v': ('tbl_vinculo_usuario_empresa', 'id_vinculo'),
+    'a': ('tbl_avaliacao', 'id_avaliacao'),
+}
+
+# métrica -> (alias, origem com id_empresa e "valor")
+HLL = {
+    # as duas contagens distintas de vw_percentual_hora_extra_remunerada
+    'empresa_hora_extra_remunerada': ('a', """
+        SELECT a.id_empresa, a.id_empresa AS valor FROM tbl_avaliacao a
+         WHERE a.faz_hora_extra AND a.hora_extra_remunerada AND {filtro}
+    """),
+    'empresa_hora_extra_nao_remunerada': ('a', """
+        SELECT a.id_empresa, a.id_empresa AS valor FROM tbl_avaliacao a
+         WHERE a.faz_hora_extra AND NOT a.hora_extra_remunerada AND {filtro}
+    """),
+    'usuario_avaliador': ('a', """
+        SELECT a.id_empresa, a.id_usuario AS valor FROM tbl_avaliacao a WHERE {filtro}
+    """),
+}
+
+# métrica -> (alias, origem com id_empresa, cargo, senioridade e "valor");
+# as notas não têm cargo próprio e ficam com cargo e senioridade 0
+QUANTIS = {
+    'salario': ('v', """
+        SELECT v.id_empresa, v.id_cargo_especialidade, v.id_senioridade, v.salario_vinculo AS valor
+          FROM tbl_vinculo_usuario_empresa v WHERE {filtro}
+    """),
+    'nota': ('a', """
+        SELECT a.id_empresa, 0 AS id_cargo_especialidade, 0 AS id_senioridade, a.nota_geral AS valor
+          FROM tbl_avaliacao a WHERE {filtro}
+    """),
+}
+
+
+def _sketch_hll(nome, filtro):
+    # registrador: os P bits altos do hash; posto: posição do primeiro bit 1
+    # nos 64 - P restantes (bit_position numa BIT, exato)
+    _, origem = HLL[nome]
+    resto = 64 - P
+    return f"""
+        SELECT '{nome}' AS nm_metrica, id_empresa,
+               (h >> {resto})::SMALLINT AS registro,
+               max(CASE WHEN p = 0 THEN {resto + 1} ELSE p - {P} END)::TINYINT AS posto
+          FROM (SELECT id_empresa, h, bit_position('1'::BIT, (h & {2 ** resto - 1})::BIT) AS p
+                  FROM (SELECT id_empresa, hash(valor) AS h
+                          FROM ({origem.format(filtro=filtro)}) WHERE valor IS NOT NULL))
+         GROUP BY id_empresa, registro
+    """
+
+
+def _sketch_quantil(nome, filtro):
+    _, origem = QUANTIS[nome]
+    return f"""
+        SELECT '{nome}' AS nm_metrica, id_empresa, id_cargo_especialidade, id_senioridade,
+               ceil(ln(valor::DOUBLE) / {math.log(GAMA)!r})::SMALLINT AS balde,
+               count(*) AS qtd
+          FROM ({origem.format(filtro=filtro)})
+         WHERE valor > 0
+         GROUP BY ALL
+    """
+
+
+def _somar(conn, filtros):
+    # filtros: {alias: filtro}; o HLL é idempotente (max), os baldes somam
+    for nome, (alias, _) in HLL.items():
+        conn.execute(f"""
+            INSERT INTO tbl_sketch_hll {_sketch_hll(nome, filtros[alias])}
+            ON CONFLICT (nm_metrica, id_empresa, registro) DO UPDATE
+               SET posto = greatest(tbl_sketch_hll.posto, EXCLUDED.posto)
+        """)
+    for nome, (alias, _) in QUANTIS.items():
+        conn.execute(f"""
+            INSERT INTO tbl_sketch_quantil {_sketch_quantil(nome, filtros[alias])}
+            ON CONFLICT (nm_metrica, id_empresa, id_cargo_especialidade, id_senioridade, balde) DO UPDATE
+               SET qtd = tbl_sketch_quantil.qtd + EXCLUDED.qtd
+        """)
+
+
+def _recalcular(conn, empresas=None):
+    # empresas: tabela temporária com a coluna id; None recalcula tudo
+    if empresas is None:
+        conn.execute("DELETE FROM tbl_sketch_hll")
+        conn.execute("DELETE FROM tbl_sketch_quantil")
+        _somar(conn, {alias: 'TRUE' for alias in ALIASES})
+        return
+    for tabela in ('tbl_sketch_hll', 'tbl_sketch_quantil'):
+        conn.execute(f"DELETE FROM {tabela} WHERE id_empresa IN (SELECT id FROM {empresas})")
+    _somar(conn, {alias: f"{alias}.id_empresa IN (SELECT id FROM {empresas})" for alias in ALIASES})
+
+
+def _construido(conn):
+    return conn.execute(
+        "SELECT count(*) FROM tbl_marca_incremental WHERE nm_consumidor = ?", [CONSUMIDOR]
+    ).fetchone()[0] > 0
+
+
+def build_sketches(conn):
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        _recalcular(conn)
+        save_marks(conn, CONSUMIDOR, current_marks(conn, ORIGENS))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def update_sketches(conn):
+    # devolve o número de linhas de origem consumidas; None se os sketches
+    # ainda não foram construídos (modo aproximado desligado)
+    if not _construido(conn):
+        return None
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        marcas = read_marks(conn, CONSUMIDOR, ORIGENS)
+        # a marca nunca recua (o maior id pode ter sido excluído)
+        novas = {
+            table: (max(ultimo_id, marcas[table][0]), ultimo_log)
+            for table, (ultimo_id, ultimo_log) in current_marks(conn, ORIGENS).items()
+        }
+        alterados, sumidos = changed_companies(conn, marcas, '_sketch_empresas')
+        inseridos = sum(novas[table][0] - marcas[table][0] for table in ORIGENS)
+
+        if sumidos:
+            _recalcular(conn)
+        else:
+            if alterados:
+                _recalcular(conn, '_sketch_empresas')
+            if inseridos:
+                _somar(conn, {
+                    alias: f"{alias}.{chave} > {marcas[tabela][0]} "
+                           f"AND {alias}.id_empresa NOT IN (SELECT id FROM _sketch_empresas)"
+                    for alias, (tabela, chave) in ALIASES.items()
+                })
+        save_marks(conn, CONSUMIDOR, novas)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("DROP TABLE IF EXISTS _sketch_empresas")
+    return alterados + inseridos
+
+
+def _filtro_empresas(empresas, params):
+    if empresas is None:
+        return ""
+    params.append(list(empresas))
+    return "AND id_empresa IN (SELECT unnest(?::INTEGER[]))"
+
+
+def approx_distinct(conn, metrica, empresas=None):
+    # {estimativa, erro_padrao (relativo), limite_inferior, limite_superior}
+    # com ~95% de confiança (2 erros padrão); empresas: lista de ids
+    params = [metrica]
+    filtro = _filtro_empresas(empresas, params)
+    ocupados, soma = conn.execute(f"""
+        SELECT count(*), coalesce(sum(pow(2, -posto)), 0)
+          FROM (SELECT max(posto) AS posto FROM tbl_sketch_hll
+                 WHERE nm_metrica = ? {filtro} GROUP BY registro)
+    """, params).fetchone()
+    vazios = M - ocupados
+    estimativa = 0.7213 / (1 + 1.079 / M) * M * M / (soma + vazios)
+    if estimativa <= 2.5 * M and vazios:
+        # faixa pequena: contagem linear pelos registradores vazios
+        estimativa = M * math.log(M / vazios)
+    erro = 1.04 / math.sqrt(M)
+    return {
+        'estimativa': estimativa,
+        'erro_padrao': erro,
+        'limite_inferior': max(0.0, estimativa * (1 - 2 * erro)),
+        'limite_superior': estimativa * (1 + 2 * erro),
+    }
+
+
+def approx_overtime(conn):
+    # vw_percentual_hora_extra_remunerada com as contagens distintas
+    # estimadas; o total de empresas continua exato
+    total = conn.execute("SELECT count(*) FROM tbl_empresa").fetchone()[0]
+    linhas = {'categoria': [], 'percentual': [], 'limite_inferior': [], 'limite_superior': []}
+    for categoria, metrica in (('Remunerado', 'empresa_hora_extra_remunerada'),
+                               ('Não Remunerado', 'empresa_hora_extra_nao_remunerada')):
+        contagem = approx_distinct(conn, metrica)
+        linhas['categoria'].append(categoria)
+        for coluna, chave in (('percentual', 'estimativa'), ('limite_inferior', 'limite_inferior'),
+                              ('limite_superior', 'limite_superior')):
+            linhas[coluna].append(round(min(100.0, contagem[chave] * 100.0 / total), 2) if total else 0.0)
+    return pa.table(linhas)
+
+
+def approx_quantiles(conn, metrica, quantis=(0.5, 0.9), por=('id_cargo_especialidade', 'id_senioridade'),
+                     empresas=None):
+    # quantis de métrica agrupados pelas colunas de por (subconjunto de
+    # id_empresa, id_cargo_especialidade, id_senioridade), como tabela Arrow;
+    # o valor exato fica entre limite_inferior e limite_superior
+    params = [metrica]
+    filtro = _filtro_empresas(empresas, params)
+    params.append(list(quantis))
+    grupos = ', '.join(por)
+    particao = f"PARTITION BY {grupos}" if por else ""
+    prefixo = f"{grupos}, " if por else ""
+    return conn.execute(f"""
+        WITH baldes AS (
+            SELECT {prefixo}balde, sum(qtd) AS qtd
+              FROM tbl_sketch_quantil
+             WHERE nm_metrica = ? {filtro}
+             GROUP BY ALL
+        ), acumulados AS (
+            SELECT *, sum(qtd) OVER ({particao} ORDER BY balde) AS acumulado,
+                   sum(qtd) OVER ({particao}) AS total
+              FROM baldes
+        ), estimados AS (
+            -- mesmo elemento que quantile_disc: o de posição ceil(q * n)
+            SELECT {prefixo}q.quantil, 2 * pow({GAMA!r}, min(balde)) / {GAMA + 1!r} AS valor,
+                   any_value(total)::BIGINT AS qtd
+              FROM acumulados, (SELECT unnest(?::DOUBLE[]) AS quantil) q
+             WHERE acumulado >= greatest(1, ceil(q.quantil * total))
+             GROUP BY ALL
+        )
+        SELECT {prefixo}quantil, valor,
+               valor / {1 + ALFA!r} AS limite_inferior,
+               valor / {1 - ALFA!r} AS limite_superior,
+               qtd
+          FROM estimados
+         ORDER BY ALL
+    """, params).to_arrow_table()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Modo aproximado: HyperLogLog e quantis por sketches")
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--construir', action='store_true', help="(re)constrói os sketches e liga o modo")
+    parser.add_argument('--quantis', type=float, nargs='+', default=[0.5, 0.9])
+    parser.add_argument('--metrica', choices=list(QUANTIS), default='salario')
+    args = parser.parse_args(argv)
+
+    conn = duckdb.connect(args.db)
+    if args.construir:
+        build_sketches(conn)
+    elif update_sketches(conn) is None:
+        print("Sketches não construídos; use --construir")
+        conn.close()
+        return 1
+    for linha in approx_overtime(conn).to_pylist():
+        print(f"{linha['categoria']}: {linha['percentual']}% "
+              f"[{linha['limite_inferior']}, {linha['limite_superior']}]")
+    por = ('id_cargo_especialidade', 'id_senioridade') if args.metrica == 'salario' else ()
+    for linha in approx_quantiles(conn, args.metrica, args.quantis, por).to_pylist():
+        grupo = ' '.join(f"{c}={linha[c]}" for c in por)
+        print(f"{grupo} q{linha['quantil']}: {linha['valor']:.2f} "
+              f"[{linha['limite_inferior']:.2f}, {linha['limite_superior']:.2f}] n={linha['qtd']}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
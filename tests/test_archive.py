@@ -0,0 +1,37 @@
+import index
+from archive import archive
+
+PROMOCAO = "SELECT * FROM vw_tempo_medio_promocao_senioridade ORDER BY senioridade"
+
+
+def test_archive_keeps_links_of_remaining_reviews(tmp_path):
+    conn = index.open_database(str(tmp_path / 'arquivo.duckdb'))
+    try:
+        # vínculo antigo sem avaliação: esse pode sair
+        id_solto = conn.execute("""
+            INSERT INTO tbl_vinculo_usuario_empresa
+            SELECT * REPLACE (nextval('tbl_vinculo_usuario_empresa') AS id_vinculo,
+                              TIMESTAMP '2015-01-01' AS dt_inicio_vinculo, FALSE AS emprego_atual)
+              FROM tbl_vinculo_usuario_empresa LIMIT 1
+            RETURNING id_vinculo
+        """).fetchone()[0]
+        # as avaliações do script são de hoje e ficam; os vínculos anteriores
+        # ao corte que elas referenciam também
+        corte = conn.execute("SELECT max(dt_inicio_vinculo) + INTERVAL 1 DAY FROM tbl_vinculo_usuario_empresa").fetchone()[0]
+        antes = conn.execute(PROMOCAO).fetchall()
+
+        qtd = archive(conn, corte, str(tmp_path / 'arquivo'))
+
+        assert qtd['avaliacao'] == 0
+        assert qtd['vinculo_usuario_empresa'] >= 1
+        assert conn.execute("SELECT count(*) FROM tbl_vinculo_usuario_empresa WHERE id_vinculo = ?",
+                            [id_solto]).fetchone()[0] == 0
+        orfas = conn.execute("""
+            SELECT count(*) FROM tbl_avaliacao a
+             WHERE a.id_vinculo IS NOT NULL
+               AND a.id_vinculo NOT IN (SELECT id_vinculo FROM tbl_vinculo_usuario_empresa)
+        """).fetchone()[0]
+        assert orfas == 0
+        assert conn.execute(PROMOCAO).fetchall() == antes
+    finally:
+        conn.close()
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+import index
+from cache import ResultCache
+
+THREADS = 16
+VOLTAS = 20
+
+
+def _ordenada(tabela):
+    # views com empates no ORDER BY podem devolver os empatados em outra ordem
+    return tabela.sort_by([(nome, 'ascending') for nome in tabela.column_names])
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    conn = index.open_database(str(tmp_path_factory.mktemp('cache') / 'cache.duckdb'), scale_factor=0.05)
+    yield conn
+    conn.close()
+
+
+def test_concurrent_fetch_matches_direct_reads(conn):
+    views = [r[0] for r in conn.execute(
+        "SELECT view_name FROM duckdb_views() WHERE NOT internal AND view_name LIKE 'vw_%' ORDER BY view_name"
+    ).fetchall()]
+    # (view, filtros): as mesmas chaves pedidas por todas as threads
+    pedidos = [(view, None) for view in views] + [('mv_empresa_resumo_avaliacao', {'id_empresa': i}) for i in (1, 2, 3)]
+    esperado = {}
+    for view, filtros in pedidos:
+        sql = f"SELECT * FROM {view}" + (" WHERE id_empresa = ?" if filtros else "")
+        esperado[view, str(filtros)] = _ordenada(
+            conn.execute(sql, list(filtros.values()) if filtros else None).to_arrow_table())
+
+    cache = ResultCache(conn)
+    erros = []
+
+    def cliente(deslocamento):
+        try:
+            for volta in range(VOLTAS):
+                view, filtros = pedidos[(deslocamento + volta) % len(pedidos)]
+                if volta % 5 == 0:
+                    cache.clear()
+                tabela = cache.fetch(view, filtros)
+                if not _ordenada(tabela).equals(esperado[view, str(filtros)]):
+                    erros.append(f"{view} {filtros}: resultado de outra consulta")
+        except Exception as erro:
+            erros.append(repr(erro))
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert erros == []
+    assert cache.stats()['hits'] > 0
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import cli
+import index
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cli.py')
+REPETICOES = 3
+
+
+@pytest.fixture(scope='module')
+def db_file(tmp_path_factory):
+    db_file = str(tmp_path_factory.mktemp('cli') / 'cli.duckdb')
+    index.open_database(db_file).close()
+    return db_file
+
+
+def _partida_ms(argumentos):
+    # melhor de algumas execuções: a primeira paga o cache de disco
+    amostras = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, CLI] + argumentos, check=True, stdout=subprocess.DEVNULL)
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return min(amostras)
+
+
+@pytest.mark.parametrize('argumentos', [
+    ['--help'],
+    ['report', 'vw_problemas_pj'],
+    ['export', 'vw_problemas_pj', '--format', 'parquet'],
+])
+def test_startup_budget(db_file, tmp_path, argumentos):
+    if argumentos[0] == 'export':
+        argumentos = argumentos + ['--saida', str(tmp_path / 'saida.parquet')]
+    if argumentos[0] != '--help':
+        argumentos = ['--db', db_file] + argumentos
+    assert _partida_ms(argumentos) < cli.ORCAMENTO_MS
+
+
+def test_report_does_not_import_heavy_modules(db_file):
+    # sem --grafico, report não carrega matplotlib nem o index (e o gerador)
+    verificacao = subprocess.run([sys.executable, '-c', (
+        "import sys; sys.path.insert(0, sys.argv[1]); import cli; "
+        "cli.main(['--db', sys.argv[2], 'report', 'vw_problemas_pj']); "
+        "sys.exit(3 if {'matplotlib', 'index'} & set(sys.modules) else 0)"
+    ), os.path.dirname(CLI), db_file], stdout=subprocess.DEVNULL)
+    assert verificacao.returncode == 0
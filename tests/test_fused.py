@@ -0,0 +1,42 @@
+import index
+from fused import full_report
+
+
+def test_clt_mascarado_order_is_total(tmp_path):
+    conn = index.open_database(str(tmp_path / 'fused.duckdb'))
+    try:
+        # empates na contagem: a mesma contagem para todas as empresas
+        conn.execute("UPDATE tbl_avaliacao SET cod_problema_pj = 2")
+        esperado = [tuple(r) for r in conn.execute("""
+            SELECT e.nm_fantasia_empresa, count(*)
+              FROM tbl_avaliacao a JOIN tbl_empresa e ON e.id_empresa = a.id_empresa
+             GROUP BY e.nm_fantasia_empresa
+             ORDER BY count(*) DESC, min(e.id_empresa)
+        """).fetchall()]
+        assert len({qtd for _, qtd in esperado}) < len(esperado)
+
+        view = conn.execute("SELECT * FROM vw_empresas_clt_mascarado_pj").fetchall()
+        fundida = full_report(conn, ['vw_empresas_clt_mascarado_pj'])['vw_empresas_clt_mascarado_pj']
+        assert view == esperado
+        assert list(zip(*fundida.to_pydict().values())) == esperado
+    finally:
+        conn.close()
+
+
+def test_clt_mascarado_order_matches_across_shards(tmp_path):
+    from shard import ShardedDatabase, create_shards
+
+    arquivo = str(tmp_path / 'base.duckdb')
+    conn = index.open_database(arquivo)
+    try:
+        # empates na contagem, com as empresas espalhadas pelos shards
+        conn.execute("UPDATE tbl_avaliacao SET cod_problema_pj = 2")
+        conn.execute("CHECKPOINT")
+        esperado = conn.execute("SELECT * FROM vw_empresas_clt_mascarado_pj").fetchall()
+    finally:
+        conn.close()
+
+    create_shards(arquivo, str(tmp_path / 'shards'), n=3)
+    with ShardedDatabase(str(tmp_path / 'shards'), workers=1) as db:
+        distribuida = db.fetch_view('vw_empresas_clt_mascarado_pj')
+    assert list(zip(*distribuida.to_pydict().values())) == esperado
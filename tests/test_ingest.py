@@ -0,0 +1,58 @@
+import index
+from ingest import ingest_file
+
+CSV = """id_usuario,id_empresa,faz_hora_extra,depoimento_geral,nota_geral,beneficios,percent_promocao
+1,1,false,vazio,4,,
+1,1,false,dois,4,1;2,
+1,1,false,sobra,4,1;,
+1,1,false,arredonda,4,,999.999
+"""
+
+
+def test_ingest_empty_benefits_and_rounded_percent(tmp_path):
+    arquivo = tmp_path / 'avaliacoes.csv'
+    arquivo.write_text(CSV)
+    conn = index.open_database(str(tmp_path / 'banco.duckdb'))
+    try:
+        resultado = ingest_file(conn, str(arquivo))
+        # 999.999 vira 1000.00 no DECIMAL(5,2): só essa linha cai
+        assert resultado['inseridas'] == 3
+        assert resultado['rejeitadas'] == [{'linha': 3, 'motivos': ['percent_promocao fora de DECIMAL(5,2)']}]
+        beneficios = dict(conn.execute("""
+            SELECT a.depoimento_geral, list(ab.id_beneficio ORDER BY ab.id_beneficio) FILTER (WHERE ab.id_beneficio IS NOT NULL)
+              FROM tbl_avaliacao a LEFT JOIN tbl_avaliacao_beneficio ab USING (id_avaliacao)
+             WHERE a.depoimento_geral IN ('vazio', 'dois', 'sobra')
+             GROUP BY a.depoimento_geral
+        """).fetchall())
+        assert beneficios == {'vazio': None, 'dois': [1, 2], 'sobra': [1]}
+    finally:
+        conn.close()
+
+
+def test_read_batches_streams_jsonl(tmp_path, monkeypatch):
+    import json
+
+    import ingest
+
+    # blocos pequenos: cada um tem poucas linhas, e o percent_promocao só
+    # aparece depois do primeiro
+    linhas = [{'id_usuario': 1, 'id_empresa': 1, 'faz_hora_extra': False, 'depoimento_geral': f'd{i}',
+               'nota_geral': 4, 'beneficios': [1] if i % 2 else [],
+               'percent_promocao': 10.5 if i >= 5 else None} for i in range(7)]
+    arquivo = tmp_path / 'avaliacoes.jsonl'
+    arquivo.write_text(''.join(json.dumps(linha) + '\n' for linha in linhas))
+    monkeypatch.setattr(ingest, 'BLOCO_JSON', 256)
+    monkeypatch.setattr(ingest.pa_json, 'read_json', None)
+
+    lotes = list(ingest.read_batches(str(arquivo), batch_size=3))
+    assert [lote.num_rows for lote in lotes] == [3, 3, 1]
+    depoimentos = [d for lote in lotes for d in lote['depoimento_geral'].to_pylist()]
+    assert depoimentos == [f'd{i}' for i in range(7)]
+    assert [p for lote in lotes for p in lote['percent_promocao'].to_pylist()] == [None] * 5 + [10.5] * 2
+
+    conn = index.open_database(str(tmp_path / 'banco.duckdb'))
+    try:
+        resultado = ingest_file(conn, str(arquivo), batch_size=3)
+        assert (resultado['lidas'], resultado['inseridas'], resultado['rejeitadas']) == (7, 7, [])
+    finally:
+        conn.close()
@@ -0,0 +1,56 @@
+import duckdb
+
+import index
+from migrations import current_version
+
+
+def _banco_anterior(db_file):
+    # o que o index.py anterior às migrações gravava: DDL, carga do script e
+    # as views, sem tbl_versao_schema
+    conn = duckdb.connect(db_file)
+    conn.execute(index.DDL)
+    conn.execute(index.DIMENSIONS)
+    conn.execute(index.POPULATE)
+    conn.execute("""
+        CREATE TABLE mv_empresa_resumo_avaliacao AS
+        SELECT a.id_avaliacao, a.id_empresa FROM tbl_avaliacao a;
+        CREATE VIEW vw_problemas_pj AS SELECT cod_problema_pj, count(*) AS qtd
+          FROM tbl_avaliacao GROUP BY cod_problema_pj;
+    """)
+    conn.close()
+
+
+def test_open_database_upgrades_pre_migration_db(tmp_path):
+    db_file = str(tmp_path / 'antigo.duckdb')
+    _banco_anterior(db_file)
+    conn = duckdb.connect(db_file)
+    assert current_version(conn) == 1
+    conn.close()
+
+    conn = index.open_database(db_file)
+    try:
+        versoes = [r[0] for r in conn.execute("SELECT versao FROM tbl_versao_schema ORDER BY versao").fetchall()]
+        assert versoes == [m[0] for m in index.MIGRATIONS]
+        # os dados do script continuam lá, sem carga repetida
+        assert conn.execute("SELECT count(*) FROM tbl_usuario").fetchone()[0] == 15
+        assert conn.execute("SELECT count(*) FROM tbl_avaliacao WHERE id_vinculo IS NULL").fetchone()[0] == 0
+        # views e mv_* recriadas na definição atual
+        total = conn.execute("SELECT sum(qtd) FROM vw_problemas_pj").fetchone()[0]
+        assert total == conn.execute("SELECT count(*) FROM tbl_avaliacao WHERE cod_problema_pj IS NOT NULL").fetchone()[0]
+        assert 'usuario' in [d[0] for d in conn.execute("SELECT * FROM mv_empresa_resumo_avaliacao LIMIT 0").description]
+    finally:
+        conn.close()
+
+    # reabrir não aplica nada de novo
+    conn = index.open_database(db_file)
+    assert current_version(conn) == index.MIGRATIONS[-1][0]
+    conn.close()
+
+
+def test_open_database_new_db(tmp_path):
+    conn = index.open_database(str(tmp_path / 'novo.duckdb'))
+    try:
+        assert current_version(conn) == index.MIGRATIONS[-1][0]
+        assert conn.execute("SELECT count(*) FROM tbl_usuario").fetchone()[0] == 15
+    finally:
+        conn.close()
@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import random
+import threading
+import time
+
+import duckdb
+import pytest
+
+import aio
+from aio import AsyncDatabase
+from pool import QueryService, QueryTimeout, _Tarefa
+
+# alguns segundos de CPU em qualquer máquina: só termina interrompida
+LENTA = "SELECT count(*) FROM range(100_000_000_000) t(x) WHERE x % 7 = 1"
+RAPIDA = "SELECT 42 AS n"
+
+
+def test_late_cancel_does_not_interrupt_next_query():
+    conn = duckdb.connect()
+    cursor = conn.cursor()
+    tarefa = _Tarefa()
+    assert tarefa.iniciar(cursor)
+    tarefa.terminar()
+    # cancelamento que chega depois do fim: o cursor já não é da tarefa
+    tarefa.cancelar()
+    assert cursor.execute("SELECT count(*) FROM range(10_000_000)").fetchone()[0] == 10_000_000
+    # e a tarefa cancelada antes de começar nem pega o cursor
+    assert not tarefa.iniciar(cursor)
+    conn.close()
+
+
+def test_query_service_timeout_interrupts_and_recovers():
+    with QueryService(conn=duckdb.connect(), max_workers=1, timeout=0.2) as servico:
+        inicio = time.perf_counter()
+        with pytest.raises(QueryTimeout):
+            servico.fetch(LENTA)
+        # a única thread volta a atender, com o mesmo cursor
+        assert servico.fetch(RAPIDA, formato='dict') == [{'n': 42}]
+        assert time.perf_counter() - inicio < 10
+
+
+def test_query_service_cancels_queued_query():
+    with QueryService(conn=duckdb.connect(), max_workers=1, timeout=5) as servico:
+        lenta = servico.submit(LENTA)
+        na_fila = servico.submit(RAPIDA)
+        with pytest.raises(QueryTimeout):
+            servico.result(na_fila, timeout=0.1)
+        assert na_fila.cancelled()
+        with pytest.raises(QueryTimeout):
+            servico.result(lenta, timeout=0.1)
+        assert servico.fetch(RAPIDA, formato='dict') == [{'n': 42}]
+
+
+def test_async_timeout_and_cancel():
+    async def cenario():
+        async with AsyncDatabase(conn=duckdb.connect(), max_concurrency=1) as db:
+            inicio = time.perf_counter()
+            with pytest.raises(QueryTimeout):
+                await db.fetch(LENTA, timeout=0.2)
+
+            tarefa = asyncio.create_task(db.fetch(LENTA))
+            await asyncio.sleep(0.2)
+            tarefa.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await tarefa
+
+            # stream abandonado no meio também libera a vaga
+            async with contextlib.aclosing(db.batches("SELECT * FROM range(1_000_000)", batch_size=1000)) as lotes:
+                async for _ in lotes:
+                    break
+            resultado = await db.fetch(RAPIDA, formato='dict', timeout=5)
+            assert resultado == [{'n': 42}]
+            assert time.perf_counter() - inicio < 10
+
+    asyncio.run(cenario())
+
+
+def test_async_stress_keeps_states_and_concurrency(monkeypatch):
+    # centenas de corrotinas misturando fetch rápido, timeout, cancelamento
+    # e stream abandonado: cada uma termina no estado esperado, nunca há
+    # mais consultas no DuckDB do que vagas e nenhuma vaga vaza
+    vagas = 8
+    lock = threading.Lock()
+    contagem = {'agora': 0, 'pico': 0, 'total': 0}
+
+    class _TarefaContada(_Tarefa):
+        # conta só o trecho entre iniciar() aceito e terminar()
+        def iniciar(self, cursor):
+            ok = super().iniciar(cursor)
+            if ok:
+                with lock:
+                    self._contada = True
+                    contagem['agora'] += 1
+                    contagem['total'] += 1
+                    contagem['pico'] = max(contagem['pico'], contagem['agora'])
+            return ok
+
+        def terminar(self):
+            with lock:
+                if getattr(self, '_contada', False):
+                    self._contada = False
+                    contagem['agora'] -= 1
+            super().terminar()
+
+    monkeypatch.setattr(aio, '_Tarefa', _TarefaContada)
+
+    async def rapida(db, i):
+        return await db.fetch("SELECT ?::INTEGER AS n", [i], formato='dict')
+
+    async def estoura(db):
+        return await db.fetch(LENTA, timeout=0.1)
+
+    async def abandona(db):
+        async with contextlib.aclosing(db.batches("SELECT * FROM range(1_000_000)", batch_size=1000)) as lotes:
+            async for batch in lotes:
+                return batch.num_rows
+
+    async def cenario():
+        async with AsyncDatabase(conn=duckdb.connect(), max_concurrency=vagas) as db:
+            tipos = ['rapida'] * 250 + ['timeout'] * 60 + ['cancelada'] * 50 + ['stream'] * 40
+            random.Random(7).shuffle(tipos)
+            tarefas = []
+            for i, tipo in enumerate(tipos):
+                if tipo == 'rapida':
+                    corrotina = rapida(db, i)
+                elif tipo == 'timeout':
+                    corrotina = estoura(db)
+                elif tipo == 'cancelada':
+                    # sem timeout: só termina cancelada
+                    corrotina = db.fetch(LENTA)
+                else:
+                    corrotina = abandona(db)
+                tarefas.append(asyncio.create_task(corrotina))
+            await asyncio.sleep(0.3)
+            for tipo, tarefa in zip(tipos, tarefas):
+                if tipo == 'cancelada':
+                    tarefa.cancel()
+            resultados = await asyncio.wait_for(asyncio.gather(*tarefas, return_exceptions=True), 120)
+
+            for i, (tipo, resultado) in enumerate(zip(tipos, resultados)):
+                if tipo == 'rapida':
+                    assert resultado == [{'n': i}]
+                elif tipo == 'timeout':
+                    assert isinstance(resultado, QueryTimeout)
+                elif tipo == 'cancelada':
+                    assert isinstance(resultado, asyncio.CancelledError)
+                else:
+                    assert resultado == 1000
+
+            assert contagem['agora'] == 0
+            assert 0 < contagem['pico'] <= vagas
+            # todas as vagas voltaram: vagas consultas simultâneas ainda rodam
+            seguintes = await asyncio.wait_for(
+                asyncio.gather(*(db.fetch(RAPIDA, formato='dict', timeout=5) for _ in range(vagas))), 10
+            )
+            assert seguintes == [[{'n': 42}]] * vagas
+
+    asyncio.run(cenario())
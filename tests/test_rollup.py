@@ -0,0 +1,42 @@
+import index
+from refresh import log_changes
+from rollup import ROLLUPS, _agregado, update_rollup
+
+
+def _diferenca(conn):
+    # grupos do rollup por benefício que não batem com o recálculo completo
+    return conn.execute(f"""
+        SELECT count(*) FROM (
+            (SELECT * FROM tbl_rollup_beneficio EXCEPT ALL {_agregado('tbl_rollup_beneficio', 'TRUE')})
+            UNION ALL
+            ({_agregado('tbl_rollup_beneficio', 'TRUE')} EXCEPT ALL SELECT * FROM tbl_rollup_beneficio)
+        )
+    """).fetchone()[0]
+
+
+def test_rollup_follows_benefit_links(tmp_path):
+    conn = index.open_database(str(tmp_path / 'rollup.duckdb'))
+    try:
+        assert 'tbl_rollup_beneficio' in ROLLUPS
+        assert _diferenca(conn) == 0
+
+        # benefício citado depois, numa avaliação já somada
+        id_avaliacao, id_beneficio = conn.execute("""
+            SELECT a.id_avaliacao, b.id_beneficio FROM tbl_avaliacao a, tbl_beneficio b
+             WHERE NOT EXISTS (SELECT 1 FROM tbl_avaliacao_beneficio ab
+                                WHERE ab.id_avaliacao = a.id_avaliacao AND ab.id_beneficio = b.id_beneficio)
+             ORDER BY a.id_avaliacao, b.id_beneficio LIMIT 1
+        """).fetchone()
+        conn.execute("INSERT INTO tbl_avaliacao_beneficio (id_avaliacao, id_beneficio) VALUES (?, ?)",
+                     [id_avaliacao, id_beneficio])
+        assert update_rollup(conn) == 1
+        assert _diferenca(conn) == 0
+
+        # link excluído, registrado no log
+        id_link = conn.execute("SELECT min(id_avaliacao_beneficio) FROM tbl_avaliacao_beneficio").fetchone()[0]
+        conn.execute("DELETE FROM tbl_avaliacao_beneficio WHERE id_avaliacao_beneficio = ?", [id_link])
+        log_changes(conn, 'tbl_avaliacao_beneficio', [id_link])
+        assert update_rollup(conn) == 1
+        assert _diferenca(conn) == 0
+    finally:
+        conn.close()
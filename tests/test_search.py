@@ -0,0 +1,20 @@
+import index
+from search import build_index, search
+
+
+def test_long_review_is_indexed(tmp_path):
+    # mais de 32767 termos num depoimento só (tf e tamanho passam de SMALLINT)
+    conn = index.open_database(str(tmp_path / 'busca.duckdb'))
+    try:
+        id_avaliacao = conn.execute("SELECT min(id_avaliacao) FROM tbl_avaliacao").fetchone()[0]
+        conn.execute("UPDATE tbl_avaliacao SET depoimento_geral = repeat('gestão ', 40000) || 'xilofone' "
+                     "WHERE id_avaliacao = ?", [id_avaliacao])
+        build_index(conn)
+        tf, tamanho = conn.execute("""
+            SELECT p.tf, p.tamanho FROM tbl_fts_postagem p JOIN tbl_fts_termo t USING (id_termo)
+             WHERE t.termo = 'gestao' AND p.id_avaliacao = ?
+        """, [id_avaliacao]).fetchone()
+        assert (tf, tamanho) == (40000, 40001)
+        assert search(conn, 'xilofone')['id_avaliacao'].to_pylist() == [id_avaliacao]
+    finally:
+        conn.close()
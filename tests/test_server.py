@@ -0,0 +1,52 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import index
+from cache import bump_versions
+from server import ViewServer
+
+
+@pytest.fixture
+def servidor(tmp_path):
+    conn = index.open_database(str(tmp_path / 'server.duckdb'))
+    servidor = ViewServer(porta=0, conn=conn)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+    conn.close()
+
+
+def _get(servidor, caminho, headers=None):
+    cliente = http.client.HTTPConnection(*servidor.server_address, timeout=10)
+    cliente.request('GET', caminho, headers=headers or {})
+    resposta = cliente.getresponse()
+    corpo = resposta.read()
+    cliente.close()
+    return resposta, corpo
+
+
+def test_limite(servidor):
+    resposta, corpo = _get(servidor, '/vw_problemas_pj?limite=2')
+    assert resposta.status == 200
+    assert len(json.loads(corpo)) == 2
+    for limite in ('-1', 'dois'):
+        resposta, corpo = _get(servidor, f'/vw_problemas_pj?limite={limite}')
+        assert resposta.status == 400
+        assert 'limite' in json.loads(corpo)['erro']
+
+
+def test_etag_follows_data_versions(servidor):
+    resposta, _ = _get(servidor, '/vw_problemas_pj')
+    etag = resposta.getheader('ETag')
+    resposta, _ = _get(servidor, '/vw_problemas_pj', {'If-None-Match': etag})
+    assert resposta.status == 304
+    # escrita pela mesma conexão do servidor muda o ETag
+    bump_versions(servidor.conn, ['tbl_avaliacao'])
+    resposta, _ = _get(servidor, '/vw_problemas_pj', {'If-None-Match': etag})
+    assert resposta.status == 200
+    assert resposta.getheader('ETag') != etag
@@ -0,0 +1,79 @@
+import pyarrow as pa
+
+import index
+from users import (SCRYPT_LOG_N_SINTETICO, hash_password, hash_plaintext, import_table, valid_cpfs,
+                   verify_password)
+
+# custo baixo: os testes não medem o scrypt
+LOG_N = SCRYPT_LOG_N_SINTETICO
+
+
+def _lote(linhas):
+    colunas = ['nm_usuario', 'cpf_usuario', 'email_usuario', 'senha']
+    return pa.table({c: pa.array([linha[i] for linha in linhas], pa.string()) for i, c in enumerate(colunas)})
+
+
+def test_valid_cpfs():
+    cpfs = ['52998224725', '52998224724', '11111111111', '529.982.247-25', '5299822472', None]
+    assert valid_cpfs(pa.array(cpfs)).tolist() == [True, False, False, False, False, False]
+
+
+def test_verify_password_round_trip():
+    guardado = hash_password('segredo123', LOG_N)
+    assert guardado.startswith(f'scrypt${LOG_N}$')
+    assert verify_password('segredo123', guardado)
+    assert not verify_password('segredo124', guardado)
+    # senha antiga em texto puro não é hash: recusada, sem exceção
+    assert not verify_password('senha111', 'senha111')
+    assert not verify_password('x', None)
+
+
+def test_import_rejects_duplicates_and_registered(tmp_path):
+    conn = index.open_database(str(tmp_path / 'usuarios.duckdb'))
+    try:
+        ids, motivos = import_table(conn, _lote([
+            ('Ana', '529.982.247-25', 'Nova@Example.com', 'segredo123'),
+            ('Bia', '52998224725', 'bia@example.com', 'segredo123'),
+            ('Caio', '39053344705', 'nova@example.com', 'segredo123'),
+            ('Dora', '16899535009', 'ana.silva@example.com', 'segredo123'),
+        ]), log_n=LOG_N)
+        assert len(ids) == 1
+        assert motivos == {
+            1: ['cpf repetido no lote'],
+            2: ['email repetido no lote'],
+            3: ['email já cadastrado'],
+        }
+        cpf, email, senha = conn.execute(
+            "SELECT cpf_usuario, email_usuario, senha_usuario FROM tbl_usuario WHERE id_usuario = ?", [int(ids[0])]
+        ).fetchone()
+        assert (cpf, email) == ('52998224725', 'nova@example.com')
+        assert verify_password('segredo123', senha)
+
+        ids, motivos = import_table(conn, _lote([('Eva', '52998224725', 'eva@example.com', 'segredo123')]),
+                                    log_n=LOG_N)
+        assert len(ids) == 0
+        assert motivos == {0: ['cpf já cadastrado']}
+    finally:
+        conn.close()
+
+
+def test_no_plaintext_passwords(tmp_path):
+    # script do index.py e gerador gravam hash; banco antigo é convertido
+    conn = index.open_database(str(tmp_path / 'senhas.duckdb'))
+    try:
+        senha = conn.execute("SELECT senha_usuario FROM tbl_usuario WHERE email_usuario = 'ana.silva@example.com'").fetchone()[0]
+        assert verify_password('senha111', senha)
+        conn.execute("UPDATE tbl_usuario SET senha_usuario = 'senha222' WHERE email_usuario = 'bruno.souza@example.com'")
+        assert hash_plaintext(conn, log_n=LOG_N) == 1
+        senha = conn.execute("SELECT senha_usuario FROM tbl_usuario WHERE email_usuario = 'bruno.souza@example.com'").fetchone()[0]
+        assert verify_password('senha222', senha)
+    finally:
+        conn.close()
+
+    conn = index.open_database(str(tmp_path / 'gerado.duckdb'), scale_factor=0.01)
+    try:
+        assert conn.execute("SELECT count(*) FROM tbl_usuario WHERE senha_usuario NOT LIKE 'scrypt$%'").fetchone()[0] == 0
+        senha = conn.execute("SELECT min(senha_usuario) FROM tbl_usuario").fetchone()[0]
+        assert verify_password('senha-sintetica', senha)
+    finally:
+        conn.close()
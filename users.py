@@ -0,0 +1,291 @@
+import argparse
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from cache import bump_versions
+from generate import cpf_digits, insert_arrow, reserve_ids
+from ingest import read_batches
+
+# Cadastro de usuários em lote (CSV, JSONL ou Parquet), com a senha
+# guardada como hash scrypt em vez do texto puro.
+#
+# O scrypt é feito para ser caro (SCRYPT_LOG_N: ~0,1 s e 32 MB por senha),
+# então é ele que limita a carga. As senhas são divididas em pedaços de
+# PEDACO e espalhadas por um pool de processos, um por núcleo. O
+# hashlib.scrypt do OpenSSL solta o GIL enquanto calcula; por isso
+# hash_passwords() aceita qualquer Executor, e um pool de threads também
+# ocupa os núcleos (benchmark.py users compara os dois com o serial).
+#
+# Antes do hash, cada lote é validado inteiro, como em ingest.py:
+# dígitos verificadores do CPF calculados de uma vez para o lote
+# (generate.cpf_digits), formato do e-mail e, numa consulta só ao DuckDB,
+# e-mail e CPF repetidos dentro do lote ou já cadastrados. Só as linhas
+# válidas pagam o hash; cada lote entra numa transação.
+#
+# Formato do hash: scrypt$<log2 N>$<r>$<p>$<sal base64>$<hash base64>.
+# Bancos anteriores guardavam a senha em texto puro (script do index.py e
+# gerador); verify_password() recusa o que não estiver no formato, e
+# hash_plaintext() (--hash-existentes) converte essas linhas. Os dados
+# sintéticos usam SCRYPT_LOG_N_SINTETICO, de custo baixo.
+LOTE = 50_000
+PEDACO = 16
+SCRYPT_LOG_N = 15
+SCRYPT_LOG_N_SINTETICO = 4
+SCRYPT_R = 8
+SCRYPT_P = 1
+SENHA_MINIMA = 8
+
+COLUNAS = pa.schema([
+    ('nm_usuario', pa.string()),
+    ('cpf_usuario', pa.string()),
+    ('email_usuario', pa.string()),
+    ('senha', pa.string()),
+])
+RE_EMAIL = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+
+def hash_password(senha, log_n=SCRYPT_LOG_N, r=SCRYPT_R, p=SCRYPT_P):
+    sal = os.urandom(16)
+    # maxmem: o padrão do OpenSSL (32 MB) não comporta N=2^15, r=8
+    chave = hashlib.scrypt(senha.encode(), salt=sal, n=2 ** log_n, r=r, p=p,
+                           maxmem=256 * r * 2 ** log_n, dklen=32)
+    return '$'.join([
+        'scrypt', str(log_n), str(r), str(p),
+        base64.b64encode(sal).decode(), base64.b64encode(chave).decode(),
+    ])
+
+
+def verify_password(senha, guardado):
+    # False também para o que não é hash (senha antiga em texto puro)
+    partes = (guardado or '').split('$')
+    if len(partes) != 6 or partes[0] != 'scrypt':
+        return False
+    _, log_n, r, p, sal, chave = partes
+    log_n, r = int(log_n), int(r)
+    calculada = hashlib.scrypt(senha.encode(), salt=base64.b64decode(sal), n=2 ** log_n, r=r, p=int(p),
+                               maxmem=256 * r * 2 ** log_n, dklen=32)
+    return hmac.compare_digest(calculada, base64.b64decode(chave))
+
+
+def _hash_pedaco(senhas, log_n=SCRYPT_LOG_N):
+    return [hash_password(senha, log_n) for senha in senhas]
+
+
+def hash_passwords(senhas, pool=None, pedaco=PEDACO, log_n=SCRYPT_LOG_N):
+    # hashes na ordem das senhas; pool None faz tudo neste processo
+    pedacos = [senhas[i:i + pedaco] for i in range(0, len(senhas), pedaco)]
+    if pool is None:
+        resultados = (_hash_pedaco(p, log_n) for p in pedacos)
+    else:
+        resultados = pool.map(_hash_pedaco, pedacos, [log_n] * len(pedacos))
+    return [h for resultado in resultados for h in resultado]
+
+
+def _mascara(expr):
+    # expressão booleana do Arrow -> np.bool_, NULL conta como falha
+    return np.asarray(pc.fill_null(expr, False).to_numpy(zero_copy_only=False), dtype=bool)
+
+
+def valid_cpfs(cpfs):
+    # cpfs: strings de 11 dígitos (já sem pontuação) -> np.bool_; confere
+    # os dois dígitos verificadores e recusa os de dígitos todos iguais
+    cpfs = pc.cast(cpfs, pa.string())
+    if isinstance(cpfs, pa.ChunkedArray):
+        cpfs = cpfs.combine_chunks()
+    formato = _mascara(pc.match_substring_regex(cpfs, r'^[0-9]{11}$'))
+    # com todas as strings de 11 bytes, o buffer de dados vira a matriz
+    # (n, 11) sem cópia por linha
+    fixos = pc.if_else(pa.array(formato), cpfs, '00000000000')
+    offsets = np.frombuffer(fixos.buffers()[1], np.int32)[fixos.offset:fixos.offset + len(fixos) + 1]
+    dados = np.frombuffer(fixos.buffers()[2], np.uint8)[offsets[0]:offsets[-1]]
+    digitos = dados.reshape(len(fixos), 11).astype(np.int64) - ord('0')
+    base = digitos[:, :9] @ 10 ** np.arange(8, -1, -1, dtype=np.int64)
+    confere = (cpf_digits(base) == digitos).all(axis=1)
+    repetido = (digitos == digitos[:, :1]).all(axis=1)
+    return formato & confere & ~repetido
+
+
+def normalize(tabela):
+    # schema de COLUNAS; CPF só com os dígitos, e-mail em minúsculas
+    faltando = [c.name for c in COLUNAS if c.name not in tabela.column_names]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {faltando}")
+    colunas = {c.name: pc.cast(tabela[c.name], c.type) for c in COLUNAS}
+    colunas['nm_usuario'] = pc.utf8_trim_whitespace(colunas['nm_usuario'])
+    colunas['cpf_usuario'] = pc.replace_substring_regex(colunas['cpf_usuario'], r'[.\-\s]', '')
+    colunas['email_usuario'] = pc.utf8_lower(pc.utf8_trim_whitespace(colunas['email_usuario']))
+    return pa.table(colunas).combine_chunks()
+
+
+def validate(conn, lote):
+    # devolve (mascara_validas, {linha: [motivos]}); as regras espelham as
+    # restrições de tbl_usuario
+    n = lote.num_rows
+    falhas = []
+    for campo in COLUNAS:
+        falhas.append((f'{campo.name} ausente', ~_mascara(pc.is_valid(lote[campo.name]))))
+    for coluna in ('nm_usuario', 'email_usuario'):
+        falhas.append((f'{coluna} maior que 200', ~_mascara(pc.less_equal(pc.utf8_length(lote[coluna]), 200))))
+    falhas.append(('cpf inválido', ~valid_cpfs(lote['cpf_usuario'])))
+    falhas.append(('email inválido', ~_mascara(pc.match_substring_regex(lote['email_usuario'], RE_EMAIL))))
+    falhas.append(('senha curta', ~_mascara(pc.greater_equal(pc.utf8_length(lote['senha']), SENHA_MINIMA))))
+
+    # repetidos: a primeira ocorrência no lote fica, as demais caem
+    conn.register('_usuarios_lote', lote.select(['cpf_usuario', 'email_usuario'])
+                  .append_column('linha', pa.array(np.arange(n), pa.int64())))
+    try:
+        repetidos = conn.execute("""
+            SELECT email_usuario IS NOT NULL AND row_number() OVER (PARTITION BY email_usuario ORDER BY linha) > 1,
+                   cpf_usuario IS NOT NULL AND row_number() OVER (PARTITION BY cpf_usuario ORDER BY linha) > 1,
+                   email_usuario IN (SELECT lower(email_usuario) FROM tbl_usuario),
+                   cpf_usuario IN (SELECT cpf_usuario FROM tbl_usuario)
+              FROM _usuarios_lote
+             ORDER BY linha
+        """).fetchnumpy()
+    finally:
+        conn.unregister('_usuarios_lote')
+    for motivo, coluna in zip(('email repetido no lote', 'cpf repetido no lote',
+                               'email já cadastrado', 'cpf já cadastrado'), repetidos.values()):
+        falhas.append((motivo, np.asarray(np.ma.filled(coluna, False), dtype=bool)))
+
+    invalida = np.zeros(n, dtype=bool)
+    motivos = {}
+    for motivo, mascara in falhas:
+        invalida |= mascara
+        for linha in np.flatnonzero(mascara):
+            motivos.setdefault(int(linha), []).append(motivo)
+    return ~invalida, motivos
+
+
+def import_table(conn, lote, pool=None, log_n=SCRYPT_LOG_N):
+    lote = normalize(lote)
+    validas, motivos = validate(conn, lote)
+    aceitas = lote.take(np.flatnonzero(validas))
+    n = aceitas.num_rows
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), motivos
+
+    # o hash fica fora da transação: é a parte demorada
+    hashes = hash_passwords(aceitas['senha'].to_pylist(), pool, log_n=log_n)
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        inicio = reserve_ids(conn, 'seq_usuario', n)
+        ids = np.arange(inicio, inicio + n, dtype=np.int64)
+        insert_arrow(conn, 'tbl_usuario', pa.table({
+            'id_usuario': pa.array(ids, pa.int32()),
+            'nm_usuario': aceitas['nm_usuario'],
+            'cpf_usuario': aceitas['cpf_usuario'],
+            'email_usuario': aceitas['email_usuario'],
+            'senha_usuario': pa.array(hashes, pa.string()),
+        }))
+        bump_versions(conn, ['tbl_usuario'])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return ids, motivos
+
+
+def hash_plaintext(conn, pool=None, log_n=SCRYPT_LOG_N, lote=LOTE):
+    # troca as senhas em texto puro de tbl_usuario pelo hash; devolve
+    # quantas foram convertidas. Cada lote entra numa transação
+    convertidas = 0
+    while True:
+        pendentes = conn.execute("""
+            SELECT id_usuario, senha_usuario FROM tbl_usuario
+             WHERE senha_usuario NOT LIKE 'scrypt$%'
+             ORDER BY id_usuario LIMIT ?
+        """, [lote]).fetchall()
+        if not pendentes:
+            return convertidas
+        hashes = hash_passwords([senha for _, senha in pendentes], pool, log_n=log_n)
+        conn.register('_senhas_lote', pa.table({
+            'id_usuario': pa.array([i for i, _ in pendentes], pa.int32()),
+            'senha_usuario': pa.array(hashes, pa.string()),
+        }))
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            conn.execute("""
+                UPDATE tbl_usuario
+                   SET senha_usuario = s.senha_usuario
+                  FROM _senhas_lote s
+                 WHERE tbl_usuario.id_usuario = s.id_usuario
+            """)
+            bump_versions(conn, ['tbl_usuario'])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.unregister('_senhas_lote')
+        convertidas += len(pendentes)
+
+
+def import_file(conn, path, formato=None, batch_size=LOTE, processos=None, log_n=SCRYPT_LOG_N):
+    # um pool para o arquivo inteiro; processos=1 faz o hash sem pool
+    processos = processos or os.cpu_count()
+    pool = ProcessPoolExecutor(processos) if processos > 1 else None
+    inseridas = 0
+    rejeitadas = []
+    deslocamento = 0
+    try:
+        for lote in read_batches(path, formato, batch_size, COLUNAS):
+            ids, motivos = import_table(conn, lote, pool, log_n)
+            inseridas += len(ids)
+            rejeitadas.extend(
+                {'linha': deslocamento + linha, 'motivos': m} for linha, m in sorted(motivos.items())
+            )
+            deslocamento += lote.num_rows
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {'lidas': deslocamento, 'inseridas': inseridas, 'rejeitadas': rejeitadas}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cadastro de usuários em lote, com hash das senhas")
+    parser.add_argument('arquivo', nargs='?')
+    parser.add_argument('--db', default='meu_banco.duckdb')
+    parser.add_argument('--formato', choices=['csv', 'jsonl', 'parquet'])
+    parser.add_argument('--lote', type=int, default=LOTE)
+    parser.add_argument('--processos', type=int, help="processos do hash (padrão: um por núcleo)")
+    parser.add_argument('--rejeitadas', help="grava as linhas rejeitadas em JSONL")
+    parser.add_argument('--hash-existentes', action='store_true',
+                        help="converte as senhas em texto puro já cadastradas")
+    args = parser.parse_args(argv)
+    if not args.arquivo and not args.hash_existentes:
+        parser.error("informe o arquivo ou --hash-existentes")
+
+    conn = duckdb.connect(args.db)
+    if args.hash_existentes:
+        processos = args.processos or os.cpu_count()
+        with ProcessPoolExecutor(processos) if processos > 1 else contextlib.nullcontext() as pool:
+            convertidas = hash_plaintext(conn, pool)
+        print(f"Senhas convertidas: {convertidas}")
+        if not args.arquivo:
+            conn.close()
+            return 0
+    resultado = import_file(conn, args.arquivo, args.formato, args.lote, args.processos)
+    conn.close()
+    print(f"Lidas: {resultado['lidas']}, inseridas: {resultado['inseridas']}, "
+          f"rejeitadas: {len(resultado['rejeitadas'])}")
+    if args.rejeitadas:
+        with open(args.rejeitadas, 'w') as arquivo:
+            for linha in resultado['rejeitadas']:
+                arquivo.write(json.dumps(linha, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())